@@ -0,0 +1,146 @@
+import os
+import time
+
+import click
+import numpy as np
+import pandas as pd
+
+from ann_index import IVFPQIndex
+from flat_index import FlatIndex
+from quantized_index import QuantizedIndex
+
+
+def _dir_size(path: str) -> int:
+    return sum(
+        os.path.getsize(os.path.join(path, name))
+        for name in os.listdir(path)
+        if os.path.isfile(os.path.join(path, name))
+    )
+
+
+def _sample_queries(flat: FlatIndex, num_queries: int, noise: float, seed: int):
+    """Perturbed copies of random index vectors, standing in for real queries."""
+    rng = np.random.default_rng(seed)
+    rows = rng.choice(len(flat), min(num_queries, len(flat)), replace=False)
+    vectors = np.asarray(flat.vectors[np.sort(rows)], dtype=np.float32)
+    scale = noise * vectors.std(axis=0, keepdims=True)
+    return vectors + rng.standard_normal(vectors.shape).astype(np.float32) * scale
+
+
+def _question_queries(model: str, num_queries: int):
+    import chroma_lib
+    from sanguo_exp import eval
+
+    questions = [q["query"] for q in eval.load_questions()][:num_queries]
+    return np.asarray(chroma_lib.embedding_model(model).embed_documents(questions))
+
+
+def measure(index, queries: np.ndarray, exact: np.ndarray, k: int) -> dict:
+    """Recall@k against `exact` rows and single-query latency percentiles."""
+    latencies = []
+    hits = 0
+    for query, expected in zip(queries, exact):
+        start = time.perf_counter()
+        _, rows = index.search(query[None, :], k)
+        latencies.append(time.perf_counter() - start)
+        hits += len(set(rows[0].tolist()) & set(expected.tolist()))
+    latencies = np.asarray(latencies) * 1000
+    return {
+        f"recall@{k}": hits / exact.size,
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+        "qps": len(queries) / (latencies.sum() / 1000),
+    }
+
+
+@click.command()
+@click.option("--flat_index_dir", default="flat_index/sanguo", help="Exact baseline index")
+@click.option("--ann_index_dir", default="ann_index/sanguo", help="Index from build_ann_index.py")
+@click.option(
+    "--quantized_index_dir",
+    multiple=True,
+    help="Index from build_quantized_index.py, repeatable; measured at each rerank depth",
+)
+@click.option(
+    "--queries",
+    type=click.Choice(["sample", "questions"]),
+    default="sample",
+    help="Perturbed index vectors, or the embedded eval question set",
+)
+@click.option("--embedding_model", default="qwen2.5:7b", help="Model for --queries questions")
+@click.option("--num_queries", default=200, help="Number of queries")
+@click.option("--noise", default=0.1, help="Noise added to sampled queries, relative to std")
+@click.option("--k", default=5, help="Number of neighbours")
+@click.option("--nprobe", default="1,2,4,8,16,32", help="Comma-separated nprobe values")
+@click.option("--rerank", default="0,50", help="Comma-separated rerank depths")
+@click.option("--output", default=None, help="Optional JSON file for the results table")
+def run(
+    flat_index_dir: str,
+    ann_index_dir: str,
+    quantized_index_dir: tuple[str, ...],
+    queries: str,
+    embedding_model: str,
+    num_queries: int,
+    noise: float,
+    k: int,
+    nprobe: str,
+    rerank: str,
+    output: str | None,
+) -> None:
+    """
+    Measure recall@k, query latency and size of ANN and quantized operating points
+    against exact search. Pass --ann_index_dir "" to skip the IVF index.
+    """
+    flat = FlatIndex.load(flat_index_dir)
+    if queries == "sample":
+        query_vectors = _sample_queries(flat, num_queries, noise, seed=0)
+    else:
+        query_vectors = _question_queries(embedding_model, num_queries)
+    _, exact = flat.search(query_vectors, k)
+
+    rows = [
+        {
+            "index": "flat",
+            "nprobe": None,
+            "rerank": None,
+            "size_mb": _dir_size(flat_index_dir) / 1024**2,
+            **measure(flat, query_vectors, exact, k),
+        }
+    ]
+    for index_dir in quantized_index_dir:
+        size = _dir_size(index_dir) / 1024**2
+        for depth in map(int, rerank.split(",")):
+            index = QuantizedIndex.load(index_dir, flat, rerank=depth)
+            rows.append(
+                {
+                    "index": index.describe(),
+                    "nprobe": None,
+                    "rerank": depth,
+                    "size_mb": size,
+                    **measure(index, query_vectors, exact, k),
+                }
+            )
+
+    if ann_index_dir:
+        ann_size = _dir_size(ann_index_dir) / 1024**2
+        for probes in map(int, nprobe.split(",")):
+            for depth in map(int, rerank.split(",")):
+                index = IVFPQIndex.load(ann_index_dir, flat, nprobe=probes, rerank=depth)
+                rows.append(
+                    {
+                        "index": "ivf",
+                        "nprobe": probes,
+                        "rerank": depth,
+                        "size_mb": ann_size,
+                        **measure(index, query_vectors, exact, k),
+                    }
+                )
+
+    df = pd.DataFrame(rows)
+    print(df.to_string(index=False, float_format=lambda x: f"{x:.3f}"))
+    if output:
+        df.to_json(output, orient="records", indent=2)
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,244 @@
+import json
+import os
+
+import numpy as np
+
+from flat_index import FlatIndex, VectorIndexRetriever, top_k
+
+_META_FILE = "ivf_meta.json"
+_ARRAYS = ["centroids", "list_offsets", "list_rows", "codes", "codebooks"]
+# Rows per block when assigning vectors to centroids.
+_BLOCK_ROWS = 8192
+
+
+def _squared_distances(x: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    return (
+        np.einsum("ij,ij->i", x, x)[:, None]
+        - 2 * x @ centroids.T
+        + np.einsum("ij,ij->i", centroids, centroids)[None, :]
+    )
+
+
+def _assign(x: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    labels = np.empty(len(x), dtype=np.int64)
+    for start in range(0, len(x), _BLOCK_ROWS):
+        block = np.asarray(x[start : start + _BLOCK_ROWS], dtype=np.float32)
+        labels[start : start + len(block)] = _squared_distances(block, centroids).argmin(1)
+    return labels
+
+
+def kmeans(x: np.ndarray, k: int, iterations: int = 20, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    k = min(k, len(x))
+    centroids = x[rng.choice(len(x), k, replace=False)].astype(np.float32)
+    for _ in range(iterations):
+        labels = _assign(x, centroids)
+        counts = np.bincount(labels, minlength=k)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, x)
+        empty = counts == 0
+        centroids[~empty] = sums[~empty] / counts[~empty, None]
+        # Re-seed empty clusters with random points.
+        centroids[empty] = x[rng.choice(len(x), int(empty.sum()))]
+    return centroids
+
+
+class IVFPQIndex:
+    """
+    An approximate index: inverted file (IVF) lists over k-means centroids, with
+    vectors stored either as product-quantization (PQ) codes or, when `pq_m` is 0,
+    at full precision.
+
+    A query scans the `nprobe` lists closest to it. PQ distances are computed with
+    per-query lookup tables (asymmetric distance). The best `rerank` candidates can
+    then be re-scored exactly against the flat index. Scores use the same metric and
+    "higher is better" convention as `FlatIndex`, and rows refer to the flat index, so
+    the two are interchangeable behind `VectorIndexRetriever`.
+
+    All arrays are saved as .npy files and memory-mapped on load.
+    """
+
+    def __init__(
+        self,
+        flat: FlatIndex,
+        centroids: np.ndarray,
+        list_offsets: np.ndarray,
+        list_rows: np.ndarray,
+        codes: np.ndarray,
+        codebooks: np.ndarray | None,
+        nprobe: int = 8,
+        rerank: int = 0,
+    ):
+        self.flat = flat
+        self.metric = flat.metric
+        self.centroids = centroids
+        self.list_offsets = list_offsets
+        self.list_rows = list_rows
+        # PQ codes (n, pq_m) uint8, or full vectors if codebooks is None.
+        self.codes = codes
+        self.codebooks = codebooks
+        self.nprobe = nprobe
+        self.rerank = rerank
+
+    def __len__(self) -> int:
+        return len(self.list_rows)
+
+    @property
+    def nlist(self) -> int:
+        return len(self.centroids)
+
+    @classmethod
+    def build(
+        cls,
+        flat: FlatIndex,
+        nlist: int = 256,
+        pq_m: int = 64,
+        pq_bits: int = 8,
+        train_size: int = 20000,
+        seed: int = 0,
+    ):
+        if pq_m and not 1 <= pq_bits <= 8:
+            raise ValueError(f"pq_bits must be between 1 and 8 for uint8 codes, got {pq_bits}")
+        rng = np.random.default_rng(seed)
+        vectors = cls._prepare(flat, flat.vectors)
+        train_rows = np.sort(
+            rng.choice(len(vectors), min(train_size, len(vectors)), replace=False)
+        )
+        train = np.asarray(vectors[train_rows], dtype=np.float32)
+
+        centroids = kmeans(train, nlist, seed=seed)
+        labels = _assign(vectors, centroids)
+        list_rows = np.argsort(labels, kind="stable")
+        list_offsets = np.concatenate(
+            [[0], np.cumsum(np.bincount(labels, minlength=len(centroids)))]
+        )
+
+        codebooks = None
+        if pq_m:
+            subspaces = cls._split(train, pq_m)
+            codebooks = np.stack(
+                [kmeans(sub, 2**pq_bits, seed=seed) for sub in subspaces]
+            )
+            codes = np.empty((len(vectors), pq_m), dtype=np.uint8)
+            for start in range(0, len(vectors), _BLOCK_ROWS):
+                block = np.asarray(vectors[start : start + _BLOCK_ROWS], np.float32)
+                for m, sub in enumerate(cls._split(block, pq_m)):
+                    codes[start : start + len(block), m] = _assign(sub, codebooks[m])
+            codes = codes[list_rows]
+        else:
+            codes = np.asarray(vectors[list_rows], dtype=flat.vectors.dtype)
+        return cls(flat, centroids, list_offsets, list_rows, codes, codebooks)
+
+    @staticmethod
+    def _prepare(flat: FlatIndex, vectors: np.ndarray) -> np.ndarray:
+        if flat.metric != "cosine":
+            return vectors
+        vectors = np.asarray(vectors, dtype=np.float32)
+        return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+    @staticmethod
+    def _split(x: np.ndarray, pq_m: int) -> list[np.ndarray]:
+        """Split columns into pq_m equal subspaces, zero-padding if needed."""
+        pad = -x.shape[1] % pq_m
+        if pad:
+            x = np.pad(x, ((0, 0), (0, pad)))
+        return np.split(x, pq_m, axis=1)
+
+    def save(self, index_dir: str) -> None:
+        os.makedirs(index_dir, exist_ok=True)
+        for name in _ARRAYS:
+            array = getattr(self, name)
+            if array is not None:
+                np.save(os.path.join(index_dir, f"{name}.npy"), array)
+        with open(os.path.join(index_dir, _META_FILE), "w") as f:
+            json.dump({"nprobe": self.nprobe, "rerank": self.rerank}, f)
+
+    @classmethod
+    def load(cls, index_dir: str, flat: FlatIndex, **search_params):
+        arrays = {}
+        for name in _ARRAYS:
+            path = os.path.join(index_dir, f"{name}.npy")
+            arrays[name] = np.load(path, mmap_mode="r") if os.path.exists(path) else None
+        with open(os.path.join(index_dir, _META_FILE), "r") as f:
+            params = json.load(f)
+        params.update(search_params)
+        return cls(flat, **arrays, **params)
+
+    def _coarse_scores(self, queries: np.ndarray) -> np.ndarray:
+        if self.metric == "ip":
+            return queries @ self.centroids.T
+        return -_squared_distances(queries, np.asarray(self.centroids))
+
+    def _pq_tables(self, query: np.ndarray) -> np.ndarray | None:
+        """Per-subspace scores of `query` against every PQ centroid, (pq_m, 2**bits)."""
+        if self.codebooks is None:
+            return None
+        pq_m = self.codebooks.shape[0]
+        sub_queries = self._split(query[None, :], pq_m)
+        if self.metric == "ip":
+            return np.stack([self.codebooks[m] @ sub_queries[m][0] for m in range(pq_m)])
+        return -np.stack(
+            [_squared_distances(sub_queries[m], self.codebooks[m])[0] for m in range(pq_m)]
+        )
+
+    def _candidate_scores(
+        self, query: np.ndarray, tables: np.ndarray | None, start: int, end: int
+    ) -> np.ndarray:
+        codes = np.asarray(self.codes[start:end])
+        if tables is None:
+            vectors = codes.astype(np.float32)
+            if self.metric == "ip":
+                return vectors @ query
+            return -np.einsum("ij,ij->i", vectors - query, vectors - query)
+        return tables[np.arange(len(tables))[None, :], codes].sum(axis=1)
+
+    def search(self, queries: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+        queries = self._prepare(self.flat, np.atleast_2d(queries)).astype(np.float32)
+        nprobe = min(self.nprobe, self.nlist)
+        _, probes = top_k(self._coarse_scores(queries), nprobe)
+
+        num_candidates = max(k, self.rerank)
+        all_scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        all_rows = np.full((len(queries), k), -1, dtype=np.int64)
+        for i, query in enumerate(queries):
+            tables = self._pq_tables(query)
+            scores, rows = [], []
+            for probe in probes[i]:
+                start, end = self.list_offsets[probe], self.list_offsets[probe + 1]
+                if start == end:
+                    continue
+                scores.append(self._candidate_scores(query, tables, start, end))
+                rows.append(np.asarray(self.list_rows[start:end]))
+            if not rows:
+                continue
+            scores = np.concatenate(scores)[None, :]
+            rows = np.concatenate(rows)
+            scores, order = top_k(scores, num_candidates)
+            rows = rows[order[0]]
+            if self.rerank:
+                # Exact re-scoring on the original vectors (in sorted row order for
+                # sequential mmap reads).
+                by_row = np.argsort(rows)
+                exact = np.empty(len(rows), dtype=np.float32)
+                exact[by_row] = self._exact_scores(queries[i], rows[by_row])
+                scores = exact[None, :]
+            scores, order = top_k(scores, k)
+            all_scores[i, : order.shape[1]] = scores[0]
+            all_rows[i, : order.shape[1]] = rows[order[0]]
+        return all_scores, all_rows
+
+    def _exact_scores(self, query: np.ndarray, rows: np.ndarray) -> np.ndarray:
+        vectors = self._prepare(self.flat, np.asarray(self.flat.vectors[rows], np.float32))
+        if self.metric == "l2":
+            return -np.einsum("ij,ij->i", vectors - query, vectors - query)
+        return vectors @ query
+
+    def document(self, row: int):
+        return self.flat.document(row)
+
+    @property
+    def embedding_model(self):
+        return self.flat.embedding_model
+
+    def as_retriever(self, search_kwargs: dict | None = None):
+        return VectorIndexRetriever.for_index(self, search_kwargs)
@@ -0,0 +1,37 @@
+import click
+
+from ann_index import IVFPQIndex
+from flat_index import FlatIndex
+
+
+@click.command()
+@click.option("--flat_index_dir", default="flat_index/sanguo", help="Index from build_flat_index.py")
+@click.option("--index_dir", default="ann_index/sanguo", help="Output directory")
+@click.option("--nlist", default=256, help="Number of IVF lists (k-means centroids)")
+@click.option("--pq_m", default=64, help="PQ subspaces (code bytes per vector); 0 disables PQ")
+@click.option("--pq_bits", default=8, help="Bits per PQ code, at most 8")
+@click.option("--nprobe", default=8, help="Default number of lists scanned per query")
+@click.option("--rerank", default=0, help="Default number of candidates re-scored exactly")
+@click.option("--train_size", default=20000, help="Vectors sampled for k-means training")
+def run(
+    flat_index_dir: str,
+    index_dir: str,
+    nlist: int,
+    pq_m: int,
+    pq_bits: int,
+    nprobe: int,
+    rerank: int,
+    train_size: int,
+) -> None:
+    flat = FlatIndex.load(flat_index_dir)
+    index = IVFPQIndex.build(
+        flat, nlist=nlist, pq_m=pq_m, pq_bits=pq_bits, train_size=train_size
+    )
+    index.nprobe = nprobe
+    index.rerank = rerank
+    index.save(index_dir)
+    print(f"Built IVF index over {len(index)} vectors with {index.nlist} lists in {index_dir}")
+
+
+if __name__ == "__main__":
+    run()
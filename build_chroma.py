@@ -10,12 +10,18 @@ _SCI_FI_BOOKS_DIR = os.path.expanduser("~/ml_data/sci-fi-books")
 _CHROMA_DB_DIR = "chroma_db/sci-fi-books"
 
 @click.command()
-def run() -> None:
+@click.option(
+    "--incremental",
+    is_flag=True,
+    help="Update the existing collection in place instead of rebuilding it",
+)
+def run(incremental: bool) -> None:
     chroma_lib.build_db_from_dir(
         docs_dir=_SCI_FI_BOOKS_DIR,
         db_dir=_CHROMA_DB_DIR,
         collection_name="sci-fi-books",
         embedding_model=chroma_lib.default_embedding_model(),
+        incremental=incremental,
     )
 
 
@@ -0,0 +1,25 @@
+import click
+import numpy as np
+
+import chroma_lib
+
+
+@click.command()
+@click.option("--db_dir", default="chroma_db/sanguo", help="Chroma database to export")
+@click.option("--collection_name", default="sanguo", help="Name of the Chroma collection")
+@click.option("--index_dir", default="flat_index/sanguo", help="Output directory")
+@click.option(
+    "--dtype",
+    type=click.Choice(["float32", "float16"]),
+    default="float32",
+    help="Storage precision of the embedding matrix",
+)
+def run(db_dir: str, collection_name: str, index_dir: str, dtype: str) -> None:
+    index = chroma_lib.export_flat_index(
+        db_dir, collection_name, index_dir, dtype=np.dtype(dtype)
+    )
+    print(f"Exported {len(index)} vectors of dim {index.vectors.shape[1]} to {index_dir}")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,19 @@
+import click
+
+import chroma_lib
+
+
+@click.command()
+@click.option("--db_dir", default="chroma_db/sanguo", help="Chroma database to index")
+@click.option("--collection_name", default="sanguo", help="Name of the Chroma collection")
+@click.option("--index_dir", default="lexical_index/sanguo", help="Output directory")
+def run(db_dir: str, collection_name: str, index_dir: str) -> None:
+    index = chroma_lib.export_lexical_index(db_dir, collection_name, index_dir)
+    print(
+        f"Indexed {len(index)} chunks, {len(index.terms)} terms, "
+        f"{len(index.postings) / 1024**2:.1f} MiB of postings to {index_dir}"
+    )
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,48 @@
+import click
+
+from flat_index import FlatIndex
+from quantized_index import QuantizedIndex
+
+
+@click.command()
+@click.option("--flat_index_dir", default="flat_index/sanguo", help="Index from build_flat_index.py")
+@click.option("--index_dir", default="quantized_index/sanguo", help="Output directory")
+@click.option(
+    "--dtype",
+    type=click.Choice(["float32", "float16", "int8"]),
+    default="int8",
+    help="Storage precision; int8 uses per-dimension scalar quantization",
+)
+@click.option("--dim", default=0, help="Reduce vectors to this many dimensions; 0 keeps all")
+@click.option(
+    "--projection",
+    type=click.Choice(["pca", "random"]),
+    default="pca",
+    help="Dimension reduction learned at build time, used with --dim",
+)
+@click.option("--rerank", default=0, help="Default number of candidates re-scored exactly")
+@click.option("--train_size", default=20000, help="Vectors sampled to learn the projection and ranges")
+def run(
+    flat_index_dir: str,
+    index_dir: str,
+    dtype: str,
+    dim: int,
+    projection: str,
+    rerank: int,
+    train_size: int,
+) -> None:
+    flat = FlatIndex.load(flat_index_dir)
+    index = QuantizedIndex.build(
+        flat, dtype=dtype, dim=dim, projection=projection, train_size=train_size
+    )
+    index.rerank = rerank
+    index.save(index_dir)
+    ratio = flat.vectors.nbytes / index.codes.nbytes
+    print(
+        f"Built {index.describe()} index over {len(index)} vectors in {index_dir}, "
+        f"{ratio:.1f}x smaller than the flat vectors"
+    )
+
+
+if __name__ == "__main__":
+    run()
@@ -1,22 +1,56 @@
 import glob
+import hashlib
+import itertools
+import json
 import os
 import shutil
 
 import fix_sqlite
 
+import numpy as np
 from langchain_ollama import OllamaEmbeddings
 from langchain_chroma import Chroma
 from langchain_core.documents import Document
-from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+import chunking
+import ingest
+from ann_index import IVFPQIndex
+from embedding_cache import CachedEmbeddings
+from flat_index import FlatIndex
+from lexical_index import LexicalIndex
+from quantized_index import QuantizedIndex
 
 _MODEL_NAME = "deepseek-r1:7b"
+_EMBEDDING_CACHE_PATH = "cache/embeddings.sqlite3"
+_MANIFEST_FILE = "manifest.json"
+_CHECKPOINT_FILE = "ingest_checkpoint.jsonl"
+_WRITE_BATCH_SIZE = 1000
+_WHOLE_FILE = "whole_file"
 _SCI_FI_COLLECTION_NAME = "sci-fi-books"
 _SCI_FI_BOOKS_DIR = os.path.expanduser("~/ml_data/sci-fi-books")
 _SCI_FI_BOOKS_CHROMA_DB_DIR = "chroma_db/sci-fi-books"
 
 
+def embedding_model(
+    model_name: str = _MODEL_NAME, cache_path: str | None = _EMBEDDING_CACHE_PATH
+):
+    """
+    Return an Ollama embedding model. Unless `cache_path` is None, it is wrapped in a
+    persistent cache so that rebuilding an index only embeds new text.
+    """
+    model = OllamaEmbeddings(model=model_name)
+    if cache_path is None:
+        return model
+    return CachedEmbeddings(model, path=cache_path)
+
+
 def default_embedding_model():
-    return OllamaEmbeddings(model=_MODEL_NAME)
+    return embedding_model()
+
+
+def _print_cache_stats(embedding_model) -> None:
+    if isinstance(embedding_model, CachedEmbeddings):
+        embedding_model.print_stats()
 
 
 def get_vector_store(db_dir: str, collection_name: str, embedding_model) -> Chroma:
@@ -28,6 +62,52 @@ def get_vector_store(db_dir: str, collection_name: str, embedding_model) -> Chro
     return vector_store
 
 
+def export_flat_index(
+    db_dir: str,
+    collection_name: str,
+    index_dir: str,
+    dtype=np.float32,
+    embedding_model=None,
+) -> FlatIndex:
+    """Copy a Chroma collection into a `FlatIndex` saved under `index_dir`."""
+    vector_store = get_vector_store(db_dir, collection_name, embedding_model)
+    index = FlatIndex.from_vector_store(vector_store, dtype=dtype)
+    index.save(index_dir)
+    return index
+
+
+def get_flat_index(index_dir: str, embedding_model=None) -> FlatIndex:
+    return FlatIndex.load(index_dir, embedding_model=embedding_model)
+
+
+def export_lexical_index(db_dir: str, collection_name: str, index_dir: str) -> LexicalIndex:
+    """Build a BM25 `LexicalIndex` over the chunks of a Chroma collection."""
+    vector_store = get_vector_store(db_dir, collection_name, embedding_model=None)
+    index = LexicalIndex.from_vector_store(vector_store)
+    index.save(index_dir)
+    return index
+
+
+def get_lexical_index(index_dir: str) -> LexicalIndex:
+    return LexicalIndex.load(index_dir)
+
+
+def get_ann_index(
+    index_dir: str, flat_index_dir: str, embedding_model=None, **search_params
+) -> IVFPQIndex:
+    """Load an IVF/PQ index; `search_params` override the saved nprobe and rerank."""
+    flat = get_flat_index(flat_index_dir, embedding_model)
+    return IVFPQIndex.load(index_dir, flat, **search_params)
+
+
+def get_quantized_index(
+    index_dir: str, flat_index_dir: str, embedding_model=None, **search_params
+) -> QuantizedIndex:
+    """Load a `QuantizedIndex`; `search_params` override the saved rerank depth."""
+    flat = get_flat_index(flat_index_dir, embedding_model)
+    return QuantizedIndex.load(index_dir, flat, **search_params)
+
+
 def _read_file(file_path: str) -> str:
     with open(file_path, "rb") as f:
         content_bytes = f.read()
@@ -38,40 +118,224 @@ def _read_file(file_path: str) -> str:
     return content
 
 
-def build_db(
-    doc_paths: list[str], db_dir: str, collection_name: str, embedding_model
+def _chunk_id(source: str, text: str, seen: dict[str, int]) -> str:
+    """
+    Derive a stable ID from the chunk content, so that unchanged chunks keep their
+    IDs when text is inserted or removed elsewhere in the document.
+    """
+    digest = hashlib.sha1(f"{source}\0{text}".encode("utf-8")).hexdigest()[:20]
+    count = seen.get(digest, 0)
+    seen[digest] = count + 1
+    return digest if count == 0 else f"{digest}_{count}"
+
+
+def _file_sha256(file_path: str) -> str:
+    with open(file_path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def _splitter_config(text_splitter) -> str:
+    params = {
+        key: value
+        for key, value in vars(text_splitter).items()
+        if isinstance(value, (bool, int, float, str, list, tuple))
+    }
+    return f"{type(text_splitter).__name__}:{json.dumps(params, sort_keys=True)}"
+
+
+def _embedding_name(embedding_model) -> str:
+    # Cache and timing wrappers keep the wrapped model as `embeddings`.
+    while hasattr(embedding_model, "embeddings"):
+        embedding_model = embedding_model.embeddings
+    model = getattr(embedding_model, "model", None) or getattr(
+        embedding_model, "model_name", None
+    )
+    return f"{type(embedding_model).__name__}:{model}"
+
+
+def manifest_path(db_dir: str) -> str:
+    """The ingest manifest of a Chroma directory, rewritten whenever documents change."""
+    return os.path.join(db_dir, _MANIFEST_FILE)
+
+
+def _load_manifest(db_dir: str) -> dict:
+    path = manifest_path(db_dir)
+    if not os.path.exists(path):
+        return {"config": None, "embedding_model": None, "files": {}}
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def _save_manifest(db_dir: str, manifest: dict) -> None:
+    path = manifest_path(db_dir)
+    with open(path + ".tmp", "w") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1)
+    os.replace(path + ".tmp", path)
+
+
+def _ingest_fingerprint(doc_paths: list[str], config: str, embedding_name: str) -> str:
+    """
+    Identifies an ingest run for resuming. The checkpoint records batch positions in
+    the chunk stream, so any edit to a file must invalidate it.
+    """
+    contents = [(doc_path, _file_sha256(doc_path)) for doc_path in doc_paths]
+    return hashlib.sha1(
+        json.dumps([config, embedding_name, contents]).encode("utf-8")
+    ).hexdigest()
+
+
+def _sync_documents(
+    vector_store: Chroma,
+    db_dir: str,
+    doc_paths: list[str],
+    load_documents,
+    config: str,
+    embedding_name: str,
+    fingerprint: str,
+    batch_size: int,
+    max_workers: int,
 ) -> None:
-    if os.path.exists(db_dir):
+    """
+    Bring the collection in line with `doc_paths` using the manifest in `db_dir`.
+
+    The manifest records (source file, mtime, sha256, chunk IDs). Files whose content
+    and chunking config are unchanged are skipped. For changed files only vanished
+    chunks are deleted and new chunks are embedded and added. New chunks are streamed
+    file by file into the batched ingestion pipeline.
+    """
+    manifest = _load_manifest(db_dir)
+    config_changed = manifest["config"] != config
+    files = manifest["files"]
+
+    def delete(ids: list[str]) -> None:
+        for batch in itertools.batched(ids, _WRITE_BATCH_SIZE):
+            vector_store.delete(ids=list(batch))
+
+    def documents_to_add():
+        for doc_path in list(files):
+            if doc_path not in doc_paths:
+                print(f"{doc_path}: removed")
+                delete(files.pop(doc_path)["ids"])
+
+        for doc_path in doc_paths:
+            mtime = os.path.getmtime(doc_path)
+            entry = files.get(doc_path)
+            if entry and not config_changed and entry["mtime"] == mtime:
+                continue
+            sha256 = _file_sha256(doc_path)
+            if entry and not config_changed and entry["sha256"] == sha256:
+                entry["mtime"] = mtime
+                continue
+
+            documents = load_documents(doc_path)
+            old_ids = set(entry["ids"]) if entry else set()
+            new_ids = {doc.id for doc in documents}
+            kept = [doc for doc in documents if doc.id in old_ids]
+            to_add = [doc for doc in documents if doc.id not in old_ids]
+            print(
+                f"{doc_path}: {len(to_add)} chunks to add, "
+                f"{len(old_ids - new_ids)} to delete, {len(kept)} unchanged"
+            )
+            delete(list(old_ids - new_ids))
+            # Positions may have shifted; refresh metadata without re-embedding. The
+            # public `Chroma.update_documents` would embed the unchanged text again.
+            for batch in itertools.batched(kept, _WRITE_BATCH_SIZE):
+                vector_store._collection.update(
+                    ids=[doc.id for doc in batch],
+                    metadatas=[doc.metadata for doc in batch],
+                )
+            yield from to_add
+            files[doc_path] = {
+                "mtime": mtime,
+                "sha256": sha256,
+                "ids": [doc.id for doc in documents],
+            }
+
+    ingest.ingest_documents(
+        vector_store,
+        documents_to_add(),
+        batch_size=batch_size,
+        max_workers=max_workers,
+        checkpoint_path=os.path.join(db_dir, _CHECKPOINT_FILE),
+        fingerprint=fingerprint,
+    )
+    manifest["config"] = config
+    manifest["embedding_model"] = embedding_name
+    _save_manifest(db_dir, manifest)
+
+
+def _prepare_db_dir(
+    db_dir: str, incremental: bool, embedding_name: str, fingerprint: str
+) -> None:
+    checkpoint_path = os.path.join(db_dir, _CHECKPOINT_FILE)
+    if ingest.checkpoint_matches(checkpoint_path, fingerprint):
+        print(f"Resuming interrupted build of {db_dir}")
+    elif os.path.exists(db_dir) and not incremental:
         print(f"Deleting existing database at {db_dir}")
         shutil.rmtree(db_dir)
+    elif os.path.exists(db_dir):
+        # Unchanged chunks keep their vectors, so a new model needs a full rebuild.
+        previous = _load_manifest(db_dir).get("embedding_model")
+        if previous != embedding_name:
+            print(
+                f"Embedding model changed from {previous} to {embedding_name}, "
+                f"rebuilding {db_dir}"
+            )
+            shutil.rmtree(db_dir)
+    os.makedirs(db_dir, exist_ok=True)
+
+
+def build_db(
+    doc_paths: list[str],
+    db_dir: str,
+    collection_name: str,
+    embedding_model,
+    incremental: bool = False,
+    batch_size: int = ingest.BATCH_SIZE,
+    max_workers: int = ingest.MAX_WORKERS,
+) -> None:
+    embedding_name = _embedding_name(embedding_model)
+    fingerprint = _ingest_fingerprint(doc_paths, _WHOLE_FILE, embedding_name)
+    _prepare_db_dir(db_dir, incremental, embedding_name, fingerprint)
 
-    documents = []
-    ids = []
-    for i, doc_path in enumerate(doc_paths):
+    def load_documents(doc_path: str) -> list[Document]:
         content = _read_file(doc_path)
-        _id = str(i + 1)
-        documents.append(
+        source = os.path.basename(doc_path)
+        return [
             Document(
                 page_content=content,
-                metadata={"source": os.apth.basenam(doc_path)},
-                id=_id,
+                metadata={"source": source},
+                id=_chunk_id(source, content, {}),
             )
-        )
-        ids.append(_id)
+        ]
 
     vector_store = get_vector_store(db_dir, collection_name, embedding_model)
-    vector_store.add_documents(documents=documents, ids=ids)
+    _sync_documents(
+        vector_store,
+        db_dir,
+        doc_paths,
+        load_documents,
+        _WHOLE_FILE,
+        embedding_name,
+        fingerprint,
+        batch_size,
+        max_workers,
+    )
+    _print_cache_stats(embedding_model)
 
 
 def build_db_from_dir(
-    docs_dir: str, db_dir: str, collection_name: str, embedding_model=None
+    docs_dir: str,
+    db_dir: str,
+    collection_name: str,
+    embedding_model=None,
+    incremental: bool = False,
 ) -> None:
     if not embedding_model:
         embedding_model = default_embedding_model()
 
     doc_paths = sorted(glob.glob(os.path.join(docs_dir, "*.txt")))[:10]
-    embedding_model = OllamaEmbeddings(model=_MODEL_NAME)
-    build_db(doc_paths, db_dir, collection_name, embedding_model)
+    build_db(doc_paths, db_dir, collection_name, embedding_model, incremental)
 
 
 def build_db_with_chrunking(
@@ -80,43 +344,66 @@ def build_db_with_chrunking(
     collection_name: str,
     text_splitter=None,
     embedding_model=None,
+    incremental: bool = False,
+    batch_size: int = ingest.BATCH_SIZE,
+    max_workers: int = ingest.MAX_WORKERS,
+    chunk_size: int = chunking.CHUNK_SIZE,
+    chunk_overlap: int = chunking.CHUNK_OVERLAP,
 ) -> None:
-    if os.path.exists(db_dir):
-        print(f"Deleting existing database at {db_dir}")
-        shutil.rmtree(db_dir)
-
-    if text_splitter is None:
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000,
-            chunk_overlap=200,
-            length_function=len,
-            separators=["\n\n", "\n", " ", "。", ""],
-        )
+    """
+    Split the documents into chunks and index them. With `incremental`, the existing
+    collection is updated in place instead of being rebuilt from scratch.
 
+    By default documents are split with the shared `chunking` module, so chunk
+    `slice` metadata matches the `chunk-{i}` IDs used by question generation and KG
+    extraction. Passing a LangChain `text_splitter` uses that instead.
+    """
     if not embedding_model:
         embedding_model = default_embedding_model()
 
-    documents = []
-    ids = []
-    for i, doc_path in enumerate(doc_paths):
-        content = _read_file(doc_path)
-        slices = text_splitter.split_text(content)
-        for j, slice in enumerate(slices):
-            _id = f"{i}_{j}"
-            documents.append(
-                Document(
-                    page_content=slice,
-                    metadata={
-                        "source": os.path.basename(doc_path),
-                        "slice": str(j),
-                    },
-                    id=_id,
-                )
+    if text_splitter is None:
+        config = f"chunking:{chunk_size}:{chunk_overlap}"
+    else:
+        config = _splitter_config(text_splitter)
+    embedding_name = _embedding_name(embedding_model)
+    fingerprint = _ingest_fingerprint(doc_paths, config, embedding_name)
+    _prepare_db_dir(db_dir, incremental, embedding_name, fingerprint)
+
+    def load_documents(doc_path: str) -> list[Document]:
+        source = os.path.basename(doc_path)
+        seen = {}
+        if text_splitter is None:
+            corpus = chunking.Corpus([doc_path])
+            chunks = corpus.chunks(chunk_size, chunk_overlap)
+            slices = [corpus.text(chunk) for chunk in chunks]
+            metadatas = [corpus.metadata(chunk, j) for j, chunk in enumerate(chunks)]
+        else:
+            slices = text_splitter.split_text(_read_file(doc_path))
+            metadatas = [
+                {"source": source, "slice": str(j)} for j in range(len(slices))
+            ]
+        return [
+            Document(
+                page_content=slice,
+                metadata=metadata,
+                id=_chunk_id(source, slice, seen),
             )
-            ids.append(_id)
+            for slice, metadata in zip(slices, metadatas)
+        ]
 
     vector_store = get_vector_store(db_dir, collection_name, embedding_model)
-    vector_store.add_documents(documents=documents, ids=ids)
+    _sync_documents(
+        vector_store,
+        db_dir,
+        doc_paths,
+        load_documents,
+        config,
+        embedding_name,
+        fingerprint,
+        batch_size,
+        max_workers,
+    )
+    _print_cache_stats(embedding_model)
 
 
 def get_sci_fi_retriever(embedding_model):
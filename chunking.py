@@ -0,0 +1,239 @@
+"""
+Deterministic, offset-based chunking shared by index builds, KG extraction and
+question generation.
+
+A corpus is a list of UTF-8 text files that are memory-mapped rather than read into
+memory. A chunk is a compact (doc_id, start, end, chapter) record, where start/end
+are byte offsets into the file, and text is only decoded when `Corpus.text` is
+called. Chunks never cross a `第X回` chapter heading and are cut at sentence ends
+(`。！？` or a line break) whenever possible.
+
+Because the split is deterministic, position i in `Corpus.chunks()` identifies the
+same text for every consumer; it is stored as `chunk-{i}` / `slice` metadata. The
+split is also cached on disk, keyed by file content and chunking parameters.
+"""
+
+import codecs
+import hashlib
+import mmap
+import os
+import re
+from collections import deque
+from collections.abc import Iterator
+from typing import NamedTuple
+
+import numpy as np
+
+_CACHE_DIR = "cache/chunks"
+# Bump when the splitting algorithm changes so cached splits are invalidated.
+_VERSION = 1
+_NUMERALS = "一二三四五六七八九十百千零〇0123456789"
+_CHAPTER_RE = re.compile(
+    ("^[ \t]*(?:　)*第(?:" + "|".join(_NUMERALS) + ")+回").encode("utf-8"),
+    re.MULTILINE,
+)
+_SENTENCE_END_RE = re.compile("(?:(?:。|！|？)(?:”|」)?|\n)".encode("utf-8"))
+_FULL_WIDTH_SPACE = "　".encode("utf-8")
+_BLOCK_SIZE = 1 << 20
+_CHUNK_DTYPE = np.dtype(
+    [("doc_id", np.int32), ("start", np.int64), ("end", np.int64), ("chapter", np.int32)]
+)
+
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 200
+
+
+class Chunk(NamedTuple):
+    doc_id: int
+    # Byte offsets into the UTF-8 encoded document.
+    start: int
+    end: int
+    # Index into Corpus.chapters(doc_id), or -1 for text before the first chapter.
+    chapter: int
+
+
+class Corpus:
+    def __init__(self, paths: list[str]):
+        self.paths = list(paths)
+        self._data = {}
+        self._chapters = {}
+
+    def data(self, doc_id: int) -> bytes | mmap.mmap:
+        if doc_id not in self._data:
+            self._data[doc_id] = _open(self.paths[doc_id])
+        return self._data[doc_id]
+
+    def text(self, chunk: Chunk) -> str:
+        return self.data(chunk.doc_id)[chunk.start : chunk.end].decode("utf-8")
+
+    def source(self, chunk: Chunk) -> str:
+        return os.path.basename(self.paths[chunk.doc_id])
+
+    def chapters(self, doc_id: int) -> list[tuple[int, str]]:
+        """(byte offset, title line) of every chapter heading in the document."""
+        if doc_id not in self._chapters:
+            data = self.data(doc_id)
+            chapters = []
+            for match in _CHAPTER_RE.finditer(data):
+                line_end = data.find(b"\n", match.start())
+                if line_end < 0:
+                    line_end = len(data)
+                title = data[match.start() : line_end].decode("utf-8").strip()
+                chapters.append((match.start(), title))
+            self._chapters[doc_id] = chapters
+        return self._chapters[doc_id]
+
+    def chapter_title(self, chunk: Chunk) -> str:
+        if chunk.chapter < 0:
+            return ""
+        return self.chapters(chunk.doc_id)[chunk.chapter][1]
+
+    def metadata(self, chunk: Chunk, index: int) -> dict:
+        return {
+            "source": self.source(chunk),
+            "slice": str(index),
+            "chapter": self.chapter_title(chunk),
+            "start": chunk.start,
+            "end": chunk.end,
+        }
+
+    def iter_chunks(
+        self, chunk_size: int = CHUNK_SIZE, chunk_overlap: int = CHUNK_OVERLAP
+    ) -> Iterator[Chunk]:
+        for doc_id in range(len(self.paths)):
+            yield from _split_document(self, doc_id, chunk_size, chunk_overlap)
+
+    def chunks(
+        self,
+        chunk_size: int = CHUNK_SIZE,
+        chunk_overlap: int = CHUNK_OVERLAP,
+        cache_dir: str | None = _CACHE_DIR,
+    ) -> list[Chunk]:
+        """The full split, loaded from `cache_dir` if it was computed before."""
+        cache_path = None
+        if cache_dir is not None:
+            cache_path = os.path.join(
+                cache_dir, self.fingerprint(chunk_size, chunk_overlap) + ".npy"
+            )
+            if os.path.exists(cache_path):
+                return [Chunk(*map(int, row)) for row in np.load(cache_path)]
+
+        chunks = list(self.iter_chunks(chunk_size, chunk_overlap))
+        if cache_path is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+            np.save(cache_path, np.array(chunks, dtype=_CHUNK_DTYPE))
+        return chunks
+
+    def fingerprint(
+        self, chunk_size: int = CHUNK_SIZE, chunk_overlap: int = CHUNK_OVERLAP
+    ) -> str:
+        digest = hashlib.sha1(f"v{_VERSION}:{chunk_size}:{chunk_overlap}".encode())
+        for doc_id in range(len(self.paths)):
+            digest.update(hashlib.sha1(self.data(doc_id)).digest())
+        return digest.hexdigest()
+
+
+def _open(path: str) -> bytes | mmap.mmap:
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b""
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        # Validate in blocks rather than keeping a decoded copy around.
+        decoder = codecs.getincrementaldecoder("utf-8")()
+        for offset in range(0, len(data), _BLOCK_SIZE):
+            decoder.decode(data[offset : offset + _BLOCK_SIZE])
+        decoder.decode(b"", final=True)
+    except UnicodeDecodeError:
+        # Offsets are always into UTF-8, so re-encode legacy Chinese encodings.
+        converted = data[:].decode("gb18030").encode("utf-8")
+        data.close()
+        return converted
+    return data
+
+
+def _is_space(data, pos: int) -> int:
+    """Length of the whitespace character at `pos`, or 0."""
+    if data[pos : pos + 1] in (b" ", b"\t", b"\r", b"\n"):
+        return 1
+    if data[pos : pos + 3] == _FULL_WIDTH_SPACE:
+        return 3
+    return 0
+
+
+def _trim(data, start: int, end: int) -> tuple[int, int]:
+    while start < end and (width := _is_space(data, start)):
+        start += width
+    while start < end:
+        if data[end - 1 : end] in (b" ", b"\t", b"\r", b"\n"):
+            end -= 1
+        elif end - 3 >= start and data[end - 3 : end] == _FULL_WIDTH_SPACE:
+            end -= 3
+        else:
+            break
+    return start, end
+
+
+def _sentences(data, start: int, end: int, max_chars: int) -> Iterator[tuple]:
+    """(start, end, number of characters) of each sentence in data[start:end]."""
+    pos = start
+    for match in _SENTENCE_END_RE.finditer(data, start, end):
+        yield from _split_long(data, pos, match.end(), max_chars)
+        pos = match.end()
+    if pos < end:
+        yield from _split_long(data, pos, end, max_chars)
+
+
+def _split_long(data, start: int, end: int, max_chars: int) -> Iterator[tuple]:
+    text = data[start:end].decode("utf-8")
+    if len(text) <= max_chars:
+        yield start, end, len(text)
+        return
+    for i in range(0, len(text), max_chars):
+        piece = text[i : i + max_chars]
+        piece_end = start + len(piece.encode("utf-8"))
+        yield start, piece_end, len(piece)
+        start = piece_end
+
+
+def _split_document(
+    corpus: Corpus, doc_id: int, chunk_size: int, chunk_overlap: int
+) -> Iterator[Chunk]:
+    data = corpus.data(doc_id)
+    boundaries = [offset for offset, _ in corpus.chapters(doc_id)]
+    ends = boundaries + [len(data)]
+    sections = [(-1, 0, ends[0])]
+    sections.extend(
+        (chapter, offset, ends[chapter + 1]) for chapter, offset in enumerate(boundaries)
+    )
+
+    for chapter, section_start, section_end in sections:
+        units = deque()
+        size = 0
+        fresh = False
+        for unit in _sentences(data, section_start, section_end, chunk_size):
+            if units and size + unit[2] > chunk_size:
+                if fresh:
+                    chunk = _make_chunk(data, doc_id, units, chapter)
+                    if chunk:
+                        yield chunk
+                # Carry over trailing sentences as overlap.
+                while units and (
+                    size > chunk_overlap or size + unit[2] > chunk_size
+                ):
+                    size -= units.popleft()[2]
+                fresh = False
+            units.append(unit)
+            size += unit[2]
+            fresh = True
+        if units and fresh:
+            chunk = _make_chunk(data, doc_id, units, chapter)
+            if chunk:
+                yield chunk
+
+
+def _make_chunk(data, doc_id: int, units: deque, chapter: int) -> Chunk | None:
+    start, end = _trim(data, units[0][0], units[-1][1])
+    if start == end:
+        return None
+    return Chunk(doc_id, start, end, chapter)
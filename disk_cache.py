@@ -0,0 +1,143 @@
+import os
+import sqlite3
+import threading
+import time
+
+# SQLite limits the number of bound parameters per statement.
+_MAX_PARAMS = 500
+
+
+class DiskCache:
+    """
+    A SQLite-backed key/value store with LRU eviction and hit/miss counters.
+
+    Entries are grouped by namespace (e.g. an embedding model or an experiment) so
+    that unrelated callers can share one file without colliding. When the total size
+    of stored values exceeds `max_bytes`, the least recently used entries are evicted.
+    """
+
+    def __init__(self, path: str, table: str = "cache", max_bytes: int | None = None):
+        dirname = os.path.dirname(path)
+        if dirname:
+            os.makedirs(dirname, exist_ok=True)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._table = table
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} ("
+            "namespace TEXT NOT NULL, key TEXT NOT NULL, value BLOB NOT NULL, "
+            "size INTEGER NOT NULL, last_access REAL NOT NULL, "
+            "PRIMARY KEY (namespace, key))"
+        )
+        self._conn.execute(
+            f"CREATE INDEX IF NOT EXISTS {table}_last_access ON {table} (last_access)"
+        )
+        self._conn.commit()
+        self._total_bytes = self._conn.execute(
+            f"SELECT COALESCE(SUM(size), 0) FROM {table}"
+        ).fetchone()[0]
+
+    def get(self, namespace: str, key: str) -> bytes | None:
+        return self.get_many(namespace, [key]).get(key)
+
+    def get_many(self, namespace: str, keys: list[str]) -> dict[str, bytes]:
+        keys = list(dict.fromkeys(keys))
+        found = {}
+        with self._lock:
+            for start in range(0, len(keys), _MAX_PARAMS):
+                batch = keys[start : start + _MAX_PARAMS]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, value FROM {self._table} "
+                    f"WHERE namespace = ? AND key IN ({placeholders})",
+                    [namespace, *batch],
+                ).fetchall()
+                found.update(rows)
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    f"UPDATE {self._table} SET last_access = ? "
+                    "WHERE namespace = ? AND key = ?",
+                    [(now, namespace, key) for key in found],
+                )
+                self._conn.commit()
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def put(self, namespace: str, key: str, value: bytes) -> None:
+        self.put_many(namespace, {key: value})
+
+    def put_many(self, namespace: str, items: dict[str, bytes]) -> None:
+        if not items:
+            return
+        now = time.time()
+        with self._lock:
+            for start in range(0, len(items), _MAX_PARAMS):
+                batch = list(items)[start : start + _MAX_PARAMS]
+                placeholders = ",".join("?" * len(batch))
+                (replaced,) = self._conn.execute(
+                    f"SELECT COALESCE(SUM(size), 0) FROM {self._table} "
+                    f"WHERE namespace = ? AND key IN ({placeholders})",
+                    [namespace, *batch],
+                ).fetchone()
+                self._total_bytes -= replaced
+            self._conn.executemany(
+                f"INSERT OR REPLACE INTO {self._table} "
+                "(namespace, key, value, size, last_access) VALUES (?, ?, ?, ?, ?)",
+                [
+                    (namespace, key, value, len(value), now)
+                    for key, value in items.items()
+                ],
+            )
+            self._total_bytes += sum(len(value) for value in items.values())
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self) -> None:
+        if self.max_bytes is None or self._total_bytes <= self.max_bytes:
+            return
+        excess = self._total_bytes - self.max_bytes
+        freed = 0
+        rowids = []
+        for rowid, size in self._conn.execute(
+            f"SELECT rowid, size FROM {self._table} ORDER BY last_access"
+        ):
+            rowids.append((rowid,))
+            freed += size
+            if freed >= excess:
+                break
+        self._conn.executemany(f"DELETE FROM {self._table} WHERE rowid = ?", rowids)
+        self._total_bytes -= freed
+
+    def clear(self, namespace: str | None = None) -> None:
+        with self._lock:
+            if namespace is None:
+                self._conn.execute(f"DELETE FROM {self._table}")
+            else:
+                self._conn.execute(
+                    f"DELETE FROM {self._table} WHERE namespace = ?", (namespace,)
+                )
+            self._conn.commit()
+            self._total_bytes = self._conn.execute(
+                f"SELECT COALESCE(SUM(size), 0) FROM {self._table}"
+            ).fetchone()[0]
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        with self._lock:
+            (entries,) = self._conn.execute(
+                f"SELECT COUNT(*) FROM {self._table}"
+            ).fetchone()
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": entries,
+            "bytes": self._total_bytes,
+        }
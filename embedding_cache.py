@@ -0,0 +1,87 @@
+import hashlib
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from disk_cache import DiskCache
+
+_DEFAULT_CACHE_PATH = "cache/embeddings.sqlite3"
+_DEFAULT_MAX_BYTES = 4 * 1024**3
+
+
+def _model_name(embeddings: Embeddings) -> str:
+    model = getattr(embeddings, "model", None) or getattr(embeddings, "model_name", None)
+    return f"{type(embeddings).__name__}:{model}"
+
+
+def _text_key(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _to_bytes(vector: list[float]) -> bytes:
+    return np.asarray(vector, dtype=np.float32).tobytes()
+
+
+def _from_bytes(value: bytes) -> list[float]:
+    return np.frombuffer(value, dtype=np.float32).tolist()
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Wrap any LangChain `Embeddings` with a persistent cache keyed by
+    (embedding model name, sha256 of the text).
+
+    Only texts that have never been embedded by the same model reach the wrapped
+    model. Vectors are stored as float32, and misses are rounded the same way so
+    results do not depend on whether they came from the cache.
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        cache: DiskCache | None = None,
+        path: str = _DEFAULT_CACHE_PATH,
+        max_bytes: int | None = _DEFAULT_MAX_BYTES,
+    ):
+        self.embeddings = embeddings
+        self.cache = cache or DiskCache(path, table="embeddings", max_bytes=max_bytes)
+        self.model_name = _model_name(embeddings)
+        # Some models embed queries differently from documents.
+        self._doc_namespace = self.model_name
+        self._query_namespace = self.model_name + ":query"
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        keys = [_text_key(text) for text in texts]
+        found = self.cache.get_many(self._doc_namespace, keys)
+
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in missing:
+                missing[key] = text
+        if missing:
+            vectors = self.embeddings.embed_documents(list(missing.values()))
+            new_entries = {
+                key: _to_bytes(vector) for key, vector in zip(missing, vectors)
+            }
+            self.cache.put_many(self._doc_namespace, new_entries)
+            found.update(new_entries)
+        return [_from_bytes(found[key]) for key in keys]
+
+    def embed_query(self, text: str) -> list[float]:
+        key = _text_key(text)
+        value = self.cache.get(self._query_namespace, key)
+        if value is None:
+            value = _to_bytes(self.embeddings.embed_query(text))
+            self.cache.put(self._query_namespace, key, value)
+        return _from_bytes(value)
+
+    def stats(self) -> dict:
+        return self.cache.stats()
+
+    def print_stats(self) -> None:
+        stats = self.stats()
+        print(
+            f"Embedding cache ({self.model_name}): {stats['hits']} hits, "
+            f"{stats['misses']} misses, hit rate {stats['hit_rate']:.2%}, "
+            f"{stats['entries']} entries, {stats['bytes'] / 1024**2:.1f} MiB"
+        )
@@ -0,0 +1,245 @@
+"""
+A local stand-in for the Ollama HTTP API, for benchmarking the pipelines offline.
+
+It serves /api/generate (streaming or not), /api/embed and /api/embeddings for any
+model name, with a configurable per-request latency and generation speed:
+
+    python fake_ollama.py --port 11435 --latency 0.2 --token_rate 40
+    OLLAMA_HOST=http://127.0.0.1:11435 python -m sanguo_exp.exp2_qwen25_rag
+
+Embeddings are deterministic feature-hashed character bigrams, so similar texts get
+similar vectors and retrieval returns stable, plausible results. Grading prompts
+(those asking for a "GRADE:") are answered "GRADE: CORRECT"; everything else gets a
+fixed answer of `completion_tokens` tokens.
+"""
+
+import json
+import math
+import threading
+import time
+import zlib
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import click
+
+_ANSWER = "曹操"
+_GRADE_ANSWER = "GRADE: CORRECT"
+
+
+def embed(text: str, dim: int) -> list[float]:
+    """Feature-hashed, L2-normalized character bigram counts."""
+    vector = [0.0] * dim
+    for i in range(max(len(text) - 1, 1)):
+        h = zlib.crc32(text[i : i + 2].encode("utf-8"))
+        vector[h % dim] += 1.0 if h & 0x80000000 else -1.0
+    norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+    return [x / norm for x in vector]
+
+
+class FakeOllama:
+    """
+    The fake server. `start()` serves it from a background thread; `model_s` in
+    `stats()` is the total simulated model time, which a benchmark can subtract from
+    wall time to isolate the pipeline's own overhead.
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency: float = 0.0,
+        token_rate: float = 0.0,
+        embed_latency: float = 0.0,
+        completion_tokens: int = 16,
+        dim: int = 64,
+    ):
+        self.latency = latency
+        self.token_rate = token_rate
+        self.embed_latency = embed_latency
+        self.completion_tokens = completion_tokens
+        self.dim = dim
+        self._lock = threading.Lock()
+        self._stats = {"generate": 0, "embed": 0, "texts_embedded": 0, "model_s": 0.0}
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def config(self) -> dict:
+        return {
+            "latency": self.latency,
+            "token_rate": self.token_rate,
+            "embed_latency": self.embed_latency,
+            "completion_tokens": self.completion_tokens,
+            "dim": self.dim,
+        }
+
+    def start(self) -> "FakeOllama":
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._stats)
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            for name in self._stats:
+                self._stats[name] = 0
+
+    def _count(self, **increments) -> None:
+        with self._lock:
+            for name, value in increments.items():
+                self._stats[name] += value
+
+    def _sleep(self, seconds: float) -> None:
+        if seconds > 0:
+            time.sleep(seconds)
+            self._count(model_s=seconds)
+
+    def _tokens(self, prompt: str) -> list[str]:
+        if "GRADE:" in prompt:
+            return [_GRADE_ANSWER]
+        return [_ANSWER[i % len(_ANSWER)] for i in range(self.completion_tokens)]
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send_json(self, body: dict) -> None:
+                data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                if self.path == "/api/tags":
+                    self._send_json({"models": []})
+                elif self.path == "/api/version":
+                    self._send_json({"version": "0.0.0-fake"})
+                else:
+                    self.send_error(404)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                request = json.loads(self.rfile.read(length) or b"{}")
+                if self.path == "/api/generate":
+                    self._generate(request)
+                elif self.path == "/api/embed":
+                    texts = request.get("input", [])
+                    if isinstance(texts, str):
+                        texts = [texts]
+                    self._send_json(
+                        {"model": request.get("model"), "embeddings": self._embed(texts)}
+                    )
+                elif self.path == "/api/embeddings":
+                    vectors = self._embed([request.get("prompt", "")])
+                    self._send_json({"embedding": vectors[0]})
+                else:
+                    self.send_error(404)
+
+            def _embed(self, texts: list[str]) -> list[list[float]]:
+                fake._count(embed=1, texts_embedded=len(texts))
+                fake._sleep(fake.embed_latency)
+                return [embed(text, fake.dim) for text in texts]
+
+            def _generate(self, request: dict) -> None:
+                fake._count(generate=1)
+                prompt = request.get("prompt", "")
+                tokens = fake._tokens(prompt)
+                token_s = 1 / fake.token_rate if fake.token_rate else 0.0
+                start = time.perf_counter()
+                fake._sleep(fake.latency)
+
+                def chunk(text: str, done: bool) -> dict:
+                    body = {
+                        "model": request.get("model"),
+                        "created_at": datetime.now(timezone.utc).isoformat(),
+                        "response": text,
+                        "done": done,
+                    }
+                    if done:
+                        body.update(
+                            done_reason="stop",
+                            total_duration=int((time.perf_counter() - start) * 1e9),
+                            prompt_eval_count=len(prompt),
+                            eval_count=len(tokens),
+                            eval_duration=max(int(len(tokens) * token_s * 1e9), 1),
+                        )
+                    return body
+
+                if not request.get("stream", True):
+                    fake._sleep(len(tokens) * token_s)
+                    self._send_json(chunk("".join(tokens), True))
+                    return
+
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                for token in tokens:
+                    fake._sleep(token_s)
+                    self._write_chunk(chunk(token, False))
+                self._write_chunk(chunk("", True))
+                self.wfile.write(b"0\r\n\r\n")
+
+            def _write_chunk(self, body: dict) -> None:
+                data = json.dumps(body, ensure_ascii=False).encode("utf-8") + b"\n"
+                self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+                self.wfile.flush()
+
+        return Handler
+
+
+@click.command()
+@click.option("--host", default="127.0.0.1", help="Address to listen on")
+@click.option("--port", default=11435, help="Port to listen on")
+@click.option("--latency", default=0.0, help="Seconds before the first generated token")
+@click.option("--token_rate", default=0.0, help="Generated tokens per second, 0 for instant")
+@click.option("--embed_latency", default=0.0, help="Seconds per embedding request")
+@click.option("--completion_tokens", default=16, help="Tokens per generated answer")
+@click.option("--dim", default=64, help="Embedding dimension")
+def run(
+    host: str,
+    port: int,
+    latency: float,
+    token_rate: float,
+    embed_latency: float,
+    completion_tokens: int,
+    dim: int,
+) -> None:
+    fake = FakeOllama(
+        host, port, latency, token_rate, embed_latency, completion_tokens, dim
+    )
+    print(f"Fake Ollama listening on {fake.url}")
+    try:
+        fake.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,212 @@
+import json
+import os
+
+import numpy as np
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.retrievers import BaseRetriever
+from pydantic import ConfigDict
+
+_VECTORS_FILE = "vectors.npy"
+_DOCS_FILE = "docs.jsonl"
+_META_FILE = "meta.json"
+# Rows scored per matrix multiply, bounding the float32 working set of fp16 indexes.
+_BLOCK_ROWS = 65536
+
+
+def top_k(scores: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+    """Per-row top-k of a (queries, candidates) score matrix, best first."""
+    k = min(k, scores.shape[1])
+    indices = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    top_scores = np.take_along_axis(scores, indices, axis=1)
+    order = np.argsort(-top_scores, axis=1, kind="stable")
+    return (
+        np.take_along_axis(top_scores, order, axis=1),
+        np.take_along_axis(indices, order, axis=1),
+    )
+
+
+class FlatIndex:
+    """
+    Exact vector search over a single contiguous embedding matrix.
+
+    The matrix is stored as float32 or float16 in a .npy file and memory-mapped on
+    load. A whole batch of queries is scored with one matrix multiply per block of
+    rows, followed by `argpartition`. Scores follow the Chroma distance function of
+    the source collection: "l2" ranks by -||q - x||^2, "ip" by q.x and "cosine" by
+    the cosine similarity, so results match Chroma's ordering.
+
+    Like a Chroma store, the index is bound to the embedding model of its queries,
+    so `as_retriever(search_kwargs=...)` is called the same way on both.
+    """
+
+    def __init__(
+        self,
+        vectors: np.ndarray,
+        ids: list[str],
+        texts: list[str],
+        metadatas: list[dict],
+        metric: str = "l2",
+        embedding_model: Embeddings | None = None,
+    ):
+        if metric not in ("l2", "ip", "cosine"):
+            raise ValueError(f"Unsupported metric: {metric}")
+        self.vectors = vectors
+        self.ids = ids
+        self.texts = texts
+        self.metadatas = metadatas
+        self.metric = metric
+        self.embedding_model = embedding_model
+        # Computed lazily: ||x||^2 for l2 and ||x|| for cosine.
+        self._norms = None
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @classmethod
+    def from_vector_store(cls, vector_store, dtype=np.float32, page_size: int = 5000):
+        """Copy every embedding out of a LangChain Chroma store."""
+        collection = vector_store._collection
+        metric = (collection.metadata or {}).get("hnsw:space", "l2")
+        total = collection.count()
+        vectors = None
+        ids, texts, metadatas = [], [], []
+        for offset in range(0, total, page_size):
+            page = collection.get(
+                include=["embeddings", "documents", "metadatas"],
+                limit=page_size,
+                offset=offset,
+            )
+            embeddings = np.asarray(page["embeddings"], dtype=np.float32)
+            if vectors is None:
+                vectors = np.empty((total, embeddings.shape[1]), dtype=dtype)
+            vectors[offset : offset + len(embeddings)] = embeddings
+            ids.extend(page["ids"])
+            texts.extend(page["documents"])
+            metadatas.extend(page["metadatas"])
+        if vectors is None:
+            vectors = np.empty((0, 0), dtype=dtype)
+        return cls(vectors, ids, texts, metadatas, metric, vector_store.embeddings)
+
+    def save(self, index_dir: str) -> None:
+        os.makedirs(index_dir, exist_ok=True)
+        np.save(os.path.join(index_dir, _VECTORS_FILE), self.vectors)
+        with open(os.path.join(index_dir, _DOCS_FILE), "w") as f:
+            for _id, text, metadata in zip(self.ids, self.texts, self.metadatas):
+                record = {"id": _id, "text": text, "metadata": metadata}
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        with open(os.path.join(index_dir, _META_FILE), "w") as f:
+            json.dump({"metric": self.metric}, f)
+
+    @classmethod
+    def load(
+        cls, index_dir: str, mmap: bool = True, embedding_model: Embeddings | None = None
+    ):
+        vectors = np.load(
+            os.path.join(index_dir, _VECTORS_FILE), mmap_mode="r" if mmap else None
+        )
+        ids, texts, metadatas = [], [], []
+        with open(os.path.join(index_dir, _DOCS_FILE), "r") as f:
+            for line in f:
+                record = json.loads(line)
+                ids.append(record["id"])
+                texts.append(record["text"])
+                metadatas.append(record["metadata"])
+        with open(os.path.join(index_dir, _META_FILE), "r") as f:
+            meta = json.load(f)
+        return cls(vectors, ids, texts, metadatas, meta["metric"], embedding_model)
+
+    def _row_norms(self) -> np.ndarray:
+        if self._norms is None:
+            squared = np.empty(len(self.vectors), dtype=np.float32)
+            for start in range(0, len(self.vectors), _BLOCK_ROWS):
+                block = np.asarray(self.vectors[start : start + _BLOCK_ROWS], np.float32)
+                squared[start : start + len(block)] = np.einsum("ij,ij->i", block, block)
+            self._norms = squared if self.metric == "l2" else np.sqrt(squared)
+        return self._norms
+
+    def score(self, queries: np.ndarray, start: int = 0, end: int | None = None):
+        """Scores of `queries` against rows [start, end), higher is better."""
+        queries = np.asarray(queries, dtype=np.float32)
+        block = np.asarray(self.vectors[start:end], dtype=np.float32)
+        scores = queries @ block.T
+        if self.metric == "l2":
+            scores = 2 * scores - self._row_norms()[start:end]
+        elif self.metric == "cosine":
+            norms = self._row_norms()[start:end]
+            query_norms = np.linalg.norm(queries, axis=1, keepdims=True)
+            scores /= np.maximum(norms * query_norms, 1e-12)
+        return scores
+
+    def search(self, queries: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+        """(scores, row indices) of the top k rows for each query, best first."""
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        best_scores = np.empty((len(queries), 0), dtype=np.float32)
+        best_indices = np.empty((len(queries), 0), dtype=np.int64)
+        for start in range(0, len(self.vectors), _BLOCK_ROWS):
+            scores = self.score(queries, start, start + _BLOCK_ROWS)
+            block_scores, block_indices = top_k(scores, k)
+            best_scores, order = top_k(
+                np.concatenate([best_scores, block_scores], axis=1), k
+            )
+            best_indices = np.take_along_axis(
+                np.concatenate([best_indices, block_indices + start], axis=1),
+                order,
+                axis=1,
+            )
+        return best_scores, best_indices
+
+    def document(self, row: int) -> Document:
+        if row < 0:
+            # Negative rows are padding from approximate search, never the last document.
+            raise IndexError(f"No document at row {row}")
+        return Document(
+            page_content=self.texts[row], metadata=self.metadatas[row], id=self.ids[row]
+        )
+
+    def as_retriever(self, search_kwargs: dict | None = None):
+        return VectorIndexRetriever.for_index(self, search_kwargs)
+
+
+class VectorIndexRetriever(BaseRetriever):
+    """
+    A LangChain retriever over any index with `search(queries, k)` and
+    `document(row)`, such as `FlatIndex`.
+
+    `batch` embeds all queries with a single `embed_documents` call and searches them
+    together; for the Ollama models we use this gives the same vectors as
+    `embed_query`.
+    """
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    index: object
+    embedding_model: Embeddings
+    k: int = 4
+
+    @classmethod
+    def for_index(cls, index, search_kwargs: dict | None = None) -> "VectorIndexRetriever":
+        """A retriever over `index` using the embedding model it was loaded with."""
+        if index.embedding_model is None:
+            raise ValueError("The index was loaded without an embedding model")
+        k = (search_kwargs or {}).get("k", 4)
+        return cls(index=index, embedding_model=index.embedding_model, k=k)
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> list[Document]:
+        query_vector = self.embedding_model.embed_query(query)
+        _, rows = self.index.search(np.asarray([query_vector]), self.k)
+        return self._documents(rows[0])
+
+    def batch(self, inputs: list[str], config=None, **kwargs) -> list[list[Document]]:
+        if not inputs:
+            return []
+        query_vectors = np.asarray(self.embedding_model.embed_documents(list(inputs)))
+        _, rows = self.index.search(query_vectors, self.k)
+        return [self._documents(query_rows) for query_rows in rows]
+
+    def _documents(self, rows) -> list[Document]:
+        # Approximate indexes pad with -1 when they find fewer than k candidates.
+        return [self.index.document(row) for row in rows if row >= 0]
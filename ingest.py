@@ -0,0 +1,119 @@
+import itertools
+import json
+import os
+import time
+from collections.abc import Iterable
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from langchain_chroma import Chroma
+from langchain_core.documents import Document
+from tqdm import tqdm
+
+BATCH_SIZE = 64
+MAX_WORKERS = 4
+
+
+def _load_checkpoint(checkpoint_path: str | None, fingerprint: str) -> set[int]:
+    if not checkpoint_path or not os.path.exists(checkpoint_path):
+        return set()
+    with open(checkpoint_path, "r") as f:
+        lines = [json.loads(line) for line in f if line.strip()]
+    if not lines or lines[0].get("fingerprint") != fingerprint:
+        return set()
+    return {line["batch"] for line in lines[1:]}
+
+
+def checkpoint_matches(checkpoint_path: str, fingerprint: str) -> bool:
+    """Whether an interrupted ingestion with the same inputs can be resumed."""
+    if not os.path.exists(checkpoint_path):
+        return False
+    with open(checkpoint_path, "r") as f:
+        header = f.readline()
+    return bool(header.strip()) and json.loads(header).get("fingerprint") == fingerprint
+
+
+def ingest_documents(
+    vector_store: Chroma,
+    documents: Iterable[Document],
+    batch_size: int = BATCH_SIZE,
+    max_workers: int = MAX_WORKERS,
+    checkpoint_path: str | None = None,
+    fingerprint: str = "",
+) -> int:
+    """
+    Embed and write `documents` to the vector store as a stream of fixed-size batches.
+
+    Up to `max_workers` batches are embedded concurrently, and at most twice that many
+    are held in memory, so the document iterator is only consumed as fast as the
+    embedding server keeps up. Each batch is written to Chroma as soon as its
+    embeddings are ready and recorded in `checkpoint_path`; a rerun with the same
+    `fingerprint` skips the batches that were already committed. Batch numbering
+    relies on `documents` being produced in a deterministic order.
+
+    Returns the number of chunks written.
+    """
+    committed = _load_checkpoint(checkpoint_path, fingerprint)
+    checkpoint = None
+    if checkpoint_path:
+        checkpoint = open(checkpoint_path, "a" if committed else "w")
+        if not committed:
+            checkpoint.write(json.dumps({"fingerprint": fingerprint}) + "\n")
+            checkpoint.flush()
+
+    embedding_model = vector_store.embeddings
+    written = 0
+    skipped = 0
+    start_time = time.perf_counter()
+
+    def commit(future, batch_index: int, batch: tuple[Document, ...]) -> None:
+        nonlocal written
+        vector_store._collection.upsert(
+            ids=[doc.id for doc in batch],
+            embeddings=future.result(),
+            documents=[doc.page_content for doc in batch],
+            metadatas=[doc.metadata for doc in batch],
+        )
+        if checkpoint:
+            checkpoint.write(json.dumps({"batch": batch_index}) + "\n")
+            checkpoint.flush()
+        written += len(batch)
+        progress.update(len(batch))
+
+    in_flight = {}
+    try:
+        with (
+            ThreadPoolExecutor(max_workers=max_workers) as executor,
+            tqdm(unit="chunk", desc="Ingesting") as progress,
+        ):
+            batches = itertools.batched(documents, batch_size)
+            for batch_index, batch in enumerate(batches):
+                if batch_index in committed:
+                    skipped += len(batch)
+                    continue
+                if len(in_flight) >= 2 * max_workers:
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        commit(future, *in_flight.pop(future))
+                future = executor.submit(
+                    embedding_model.embed_documents, [doc.page_content for doc in batch]
+                )
+                in_flight[future] = (batch_index, batch)
+
+            while in_flight:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    commit(future, *in_flight.pop(future))
+    finally:
+        if checkpoint:
+            checkpoint.close()
+
+    if checkpoint_path:
+        os.remove(checkpoint_path)
+
+    elapsed = time.perf_counter() - start_time
+    print(
+        f"Ingested {written} chunks in {elapsed:.1f}s "
+        f"({written / elapsed if elapsed else 0:.1f} chunks/s)"
+        + (f", skipped {skipped} already committed" if skipped else "")
+    )
+    return written
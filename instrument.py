@@ -0,0 +1,132 @@
+"""
+Local, per-question instrumentation for the RAG pipelines.
+
+Wrap the work for one question in `measure()`. Within it, `stage()` timings,
+`TimedEmbeddings` calls and LLM calls made with an `LLMMetricsHandler` callback
+are added to the returned metrics dict, which is stored with the result record:
+
+    query_embedding_s   time spent embedding the query
+    vector_search_s     retrieval time excluding query embedding
+    prompt_tokens       tokens in the rendered prompt
+    completion_tokens   generated tokens
+    ttft_s              time to first streamed token
+    tokens_per_s        generation speed
+    generation_s        total LLM call time
+
+Token counts come from Ollama's generation info and are missing for cached or
+non-Ollama responses.
+"""
+
+import contextlib
+import contextvars
+import threading
+import time
+from collections.abc import Iterator
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.embeddings import Embeddings
+from langchain_core.outputs import LLMResult
+
+_current = contextvars.ContextVar("instrument_metrics", default=None)
+
+
+@contextlib.contextmanager
+def measure() -> Iterator[dict]:
+    metrics = {}
+    token = _current.set(metrics)
+    try:
+        yield metrics
+    finally:
+        _current.reset(token)
+
+
+def record(name: str, value: float) -> None:
+    """Add `value` to metric `name` of the question being measured, if any."""
+    metrics = _current.get()
+    if metrics is not None:
+        metrics[name] = metrics.get(name, 0) + value
+
+
+@contextlib.contextmanager
+def stage(name: str) -> Iterator[None]:
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - start)
+
+
+@contextlib.contextmanager
+def retrieval() -> Iterator[None]:
+    """Time a retriever call, splitting it into query embedding and vector search."""
+    metrics = _current.get()
+    embedding_before = metrics.get("query_embedding_s", 0) if metrics is not None else 0
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if metrics is not None:
+            embedding = metrics.get("query_embedding_s", 0) - embedding_before
+            record("vector_search_s", time.perf_counter() - start - embedding)
+
+
+class TimedEmbeddings(Embeddings):
+    """Records time spent in the wrapped embedding model as `query_embedding_s`."""
+
+    def __init__(self, embeddings: Embeddings):
+        self.embeddings = embeddings
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        with stage("query_embedding_s"):
+            return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text: str) -> list[float]:
+        with stage("query_embedding_s"):
+            return self.embeddings.embed_query(text)
+
+
+class LLMMetricsHandler(BaseCallbackHandler):
+    """Collects token counts, time to first token and generation speed."""
+
+    def __init__(self):
+        self._runs = {}
+        self._lock = threading.Lock()
+
+    def on_llm_start(self, serialized, prompts, *, run_id: UUID, **kwargs) -> None:
+        metrics = _current.get()
+        if metrics is not None:
+            with self._lock:
+                self._runs[run_id] = (metrics, time.perf_counter(), [None])
+
+    def on_llm_new_token(self, token: str, *, run_id: UUID, **kwargs) -> None:
+        run = self._runs.get(run_id)
+        if run and run[2][0] is None:
+            run[2][0] = time.perf_counter()
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs) -> None:
+        with self._lock:
+            run = self._runs.pop(run_id, None)
+        if run is None:
+            return
+        metrics, start, (first_token,) = run
+        end = time.perf_counter()
+        metrics["generation_s"] = metrics.get("generation_s", 0) + end - start
+        if first_token is not None:
+            metrics["ttft_s"] = first_token - start
+
+        info = {}
+        if response.generations and response.generations[0]:
+            info = response.generations[0][0].generation_info or {}
+        if "prompt_eval_count" in info:
+            metrics["prompt_tokens"] = info["prompt_eval_count"]
+        if "eval_count" in info:
+            metrics["completion_tokens"] = info["eval_count"]
+            if info.get("eval_duration"):
+                metrics["tokens_per_s"] = info["eval_count"] / (info["eval_duration"] / 1e9)
+            elif first_token is not None and end > first_token:
+                metrics["tokens_per_s"] = info["eval_count"] / (end - first_token)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs) -> None:
+        with self._lock:
+            self._runs.pop(run_id, None)
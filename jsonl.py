@@ -0,0 +1,28 @@
+"""
+Helpers for the append-only .jsonl checkpoints written one record per line.
+"""
+
+import os
+
+
+def truncate_partial_line(path: str) -> None:
+    """
+    Cut a .jsonl file back to its last newline, dropping a line a crash left
+    unterminated, so the next append starts on a line of its own.
+    """
+    if not os.path.exists(path):
+        return
+    with open(path, "rb+") as f:
+        end = f.seek(0, os.SEEK_END)
+        position = end
+        while position > 0:
+            start = max(0, position - 4096)
+            f.seek(start)
+            block = f.read(position - start)
+            newline = block.rfind(b"\n")
+            if newline >= 0:
+                position = start + newline + 1
+                break
+            position = start
+        if position < end:
+            f.truncate(position)
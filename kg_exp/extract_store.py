@@ -0,0 +1,127 @@
+import hashlib
+import json
+import os
+import threading
+from collections.abc import Iterator
+
+from langchain_community.graphs.graph_document import GraphDocument, Node, Relationship
+from langchain_core.documents import Document
+
+from jsonl import truncate_partial_line
+
+OK = "ok"
+ERROR = "error"
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def _node_record(node: Node) -> dict:
+    return {"id": node.id, "type": node.type, "properties": node.properties}
+
+
+def _node(record: dict) -> Node:
+    return Node(id=record["id"], type=record["type"], properties=record["properties"])
+
+
+class ExtractStore:
+    """
+    Append-only JSONL store of per-chunk knowledge graph extractions.
+
+    Every attempt appends one record: the chunk ID, a hash of the chunk text, the
+    LLM that ran it, its status and either the extracted nodes and relationships or
+    the error. The latest record for a chunk wins, so failed chunks are retried on
+    the next run and a chunk whose text changed is extracted again. A truncated last
+    line left by a crash is ignored, and cut off before the first append.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._repaired = False
+
+    def records(self) -> dict[str, dict]:
+        """The latest record for each chunk ID."""
+        latest = {}
+        if not os.path.exists(self.path):
+            return latest
+        with open(self.path, "r") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                latest[record["chunk_id"]] = record
+        return latest
+
+    def done(self) -> dict[str, str]:
+        """Text hashes of the chunks that were extracted successfully."""
+        return {
+            chunk_id: record["text_sha1"]
+            for chunk_id, record in self.records().items()
+            if record["status"] == OK
+        }
+
+    def _append(self, record: dict) -> None:
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            if not self._repaired:
+                truncate_partial_line(self.path)
+                self._repaired = True
+            with open(self.path, "a") as f:
+                f.write(line)
+                f.flush()
+
+    def add(self, document: Document, graph: GraphDocument, llm: str, elapsed_s: float):
+        self._append(
+            {
+                "chunk_id": document.metadata["source"],
+                "text_sha1": text_hash(document.page_content),
+                "llm": llm,
+                "status": OK,
+                "elapsed_s": elapsed_s,
+                "nodes": [_node_record(node) for node in graph.nodes],
+                "relationships": [
+                    {
+                        "source": _node_record(rel.source),
+                        "target": _node_record(rel.target),
+                        "type": rel.type,
+                        "properties": rel.properties,
+                    }
+                    for rel in graph.relationships
+                ],
+            }
+        )
+
+    def add_error(self, document: Document, error: BaseException, llm: str, elapsed_s: float):
+        self._append(
+            {
+                "chunk_id": document.metadata["source"],
+                "text_sha1": text_hash(document.page_content),
+                "llm": llm,
+                "status": ERROR,
+                "elapsed_s": elapsed_s,
+                "error": f"{type(error).__name__}: {error}",
+            }
+        )
+
+    def graph_documents(self) -> Iterator[GraphDocument]:
+        """The successful extractions as `GraphDocument`s, without the chunk text."""
+        for chunk_id, record in self.records().items():
+            if record["status"] != OK:
+                continue
+            yield GraphDocument(
+                nodes=[_node(node) for node in record["nodes"]],
+                relationships=[
+                    Relationship(
+                        source=_node(rel["source"]),
+                        target=_node(rel["target"]),
+                        type=rel["type"],
+                        properties=rel["properties"],
+                    )
+                    for rel in record["relationships"]
+                ],
+                source=Document(page_content="", metadata={"source": chunk_id}),
+            )
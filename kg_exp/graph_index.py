@@ -0,0 +1,202 @@
+"""
+An in-process, memory-mapped index over the extracted knowledge graph.
+
+Entities (label, name) and relation types are interned to integer IDs. Adjacency is
+stored in CSR form: the edges of entity `e` are rows `indptr[e]:indptr[e + 1]` of
+`neighbors`, `edge_types` and `edge_out` (True when `e` is the source). Every
+relationship is stored from both ends, so k-hop expansion ignores direction while
+facts keep it. Source chunks use a second CSR, `chunk_indptr`/`chunk_rows`, holding
+the chunk numbers of `chunk-{i}` IDs. Entity names in text are found with an
+Aho-Corasick automaton, built on first use, in one pass over the text.
+
+    python -m kg_exp.graph_index --input output/sanguo_kg.jsonl --index_dir graph_index/sanguo
+"""
+
+import json
+import os
+from collections import defaultdict
+
+import click
+import numpy as np
+
+from entity_linker import AhoCorasick
+from kg_exp.extract_store import ExtractStore
+from kg_exp.neo4j_loader import Graph
+
+_META_FILE = "graph_meta.json"
+_ARRAYS = ["indptr", "neighbors", "edge_types", "edge_out", "chunk_indptr", "chunk_rows"]
+
+
+def _chunk_number(chunk_id: str) -> int:
+    return int(chunk_id.rsplit("-", 1)[1])
+
+
+def _csr(rows: list[list], dtype) -> tuple[np.ndarray, np.ndarray]:
+    indptr = np.zeros(len(rows) + 1, dtype=np.int64)
+    indptr[1:] = np.cumsum([len(row) for row in rows])
+    values = np.fromiter((v for row in rows for v in row), dtype=dtype, count=indptr[-1])
+    return indptr, values
+
+
+def _gather(indptr: np.ndarray, entities: np.ndarray) -> np.ndarray:
+    """Positions of all CSR rows of `entities`, concatenated."""
+    starts = indptr[entities]
+    lengths = indptr[entities + 1] - starts
+    offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+    return offsets + np.arange(lengths.sum())
+
+
+class GraphIndex:
+    def __init__(
+        self,
+        entities: list[tuple[str, str]],
+        relation_types: list[str],
+        indptr: np.ndarray,
+        neighbors: np.ndarray,
+        edge_types: np.ndarray,
+        edge_out: np.ndarray,
+        chunk_indptr: np.ndarray,
+        chunk_rows: np.ndarray,
+    ):
+        self.entities = entities
+        self.relation_types = relation_types
+        self.indptr = indptr
+        self.neighbors = neighbors
+        self.edge_types = edge_types
+        self.edge_out = edge_out
+        self.chunk_indptr = chunk_indptr
+        self.chunk_rows = chunk_rows
+        self._by_name = defaultdict(list)
+        for entity, (_, name) in enumerate(entities):
+            self._by_name[name].append(entity)
+        self._names = None
+
+    def __len__(self) -> int:
+        return len(self.entities)
+
+    @classmethod
+    def build(cls, graph: Graph) -> "GraphIndex":
+        entity_ids = {key: i for i, key in enumerate(graph.nodes)}
+        relation_types = sorted({key[2] for key in graph.relationships})
+        type_ids = {name: i for i, name in enumerate(relation_types)}
+
+        edges = [[] for _ in entity_ids]
+        for key in graph.relationships:
+            source, target = entity_ids[key[:2]], entity_ids[key[3:]]
+            edges[source].append((target, type_ids[key[2]], True))
+            edges[target].append((source, type_ids[key[2]], False))
+        indptr, neighbors = _csr([[e[0] for e in row] for row in edges], np.int32)
+        _, edge_types = _csr([[e[1] for e in row] for row in edges], np.int32)
+        _, edge_out = _csr([[e[2] for e in row] for row in edges], bool)
+        chunk_indptr, chunk_rows = _csr(
+            [
+                sorted(_chunk_number(c) for c in properties["chunk_ids"])
+                for properties in graph.nodes.values()
+            ],
+            np.int32,
+        )
+        return cls(
+            list(graph.nodes),
+            relation_types,
+            indptr,
+            neighbors,
+            edge_types,
+            edge_out,
+            chunk_indptr,
+            chunk_rows,
+        )
+
+    def save(self, index_dir: str) -> None:
+        os.makedirs(index_dir, exist_ok=True)
+        for name in _ARRAYS:
+            np.save(os.path.join(index_dir, f"{name}.npy"), getattr(self, name))
+        with open(os.path.join(index_dir, _META_FILE), "w") as f:
+            json.dump(
+                {"entities": self.entities, "relation_types": self.relation_types},
+                f,
+                ensure_ascii=False,
+            )
+
+    @classmethod
+    def load(cls, index_dir: str, mmap: bool = True) -> "GraphIndex":
+        arrays = {
+            name: np.load(
+                os.path.join(index_dir, f"{name}.npy"), mmap_mode="r" if mmap else None
+            )
+            for name in _ARRAYS
+        }
+        with open(os.path.join(index_dir, _META_FILE), "r") as f:
+            meta = json.load(f)
+        entities = [tuple(entity) for entity in meta["entities"]]
+        return cls(entities, meta["relation_types"], **arrays)
+
+    def names(self) -> list[str]:
+        return list(self._by_name)
+
+    def lookup(self, name: str) -> list[int]:
+        """Entity IDs with this name, one per label."""
+        return self._by_name.get(name, [])
+
+    def expand(self, entities, hops: int = 1) -> np.ndarray:
+        """Sorted IDs of all entities within `hops` edges of `entities`, inclusive."""
+        seen = np.unique(np.asarray(entities, dtype=np.int64))
+        frontier = seen
+        for _ in range(hops):
+            if not len(frontier):
+                break
+            reached = np.unique(self.neighbors[_gather(self.indptr, frontier)])
+            frontier = np.setdiff1d(reached, seen, assume_unique=True)
+            seen = np.union1d(seen, frontier)
+        return seen
+
+    def chunks(self, entities) -> np.ndarray:
+        """Sorted chunk numbers the entities were extracted from."""
+        entities = np.asarray(entities, dtype=np.int64)
+        return np.unique(self.chunk_rows[_gather(self.chunk_indptr, entities)])
+
+    def facts(self, entities, limit: int | None = None) -> list[str]:
+        """Relationships incident to `entities` as "(source)-[TYPE]->(target)" lines."""
+        entities = np.unique(np.asarray(entities, dtype=np.int64))
+        positions = _gather(self.indptr, entities)
+        owners = np.repeat(entities, self.indptr[entities + 1] - self.indptr[entities])
+        facts = []
+        seen = set()
+        for owner, position in zip(owners.tolist(), positions.tolist()):
+            other = int(self.neighbors[position])
+            source, target = (owner, other) if self.edge_out[position] else (other, owner)
+            rel_type = int(self.edge_types[position])
+            if (source, rel_type, target) in seen:
+                continue
+            seen.add((source, rel_type, target))
+            facts.append(
+                f"({self.entities[source][1]})-[{self.relation_types[rel_type]}]->"
+                f"({self.entities[target][1]})"
+            )
+            if limit is not None and len(facts) >= limit:
+                break
+        return facts
+
+    def find_entities(self, text: str) -> list[int]:
+        """IDs of entities whose name occurs in `text`, overlapping names included."""
+        if self._names is None:
+            # Single characters are far too ambiguous to match.
+            self._names = AhoCorasick({name: name for name in self._by_name if len(name) > 1})
+        names = dict.fromkeys(name for _, _, name in self._names.iter_matches(text))
+        return [entity for name in names for entity in self._by_name[name]]
+
+
+@click.command()
+@click.option("--input", "input_path", default="output/sanguo_kg.jsonl", help="Extraction store")
+@click.option("--index_dir", default="graph_index/sanguo", help="Output directory")
+def build(input_path: str, index_dir: str) -> None:
+    graph = Graph.from_store(ExtractStore(input_path))
+    index = GraphIndex.build(graph)
+    index.save(index_dir)
+    print(
+        f"Saved {len(index)} entities, {len(graph.relationships)} relationships and "
+        f"{len(index.relation_types)} relation types to {index_dir}"
+    )
+
+
+if __name__ == "__main__":
+    build()
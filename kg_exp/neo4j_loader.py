@@ -0,0 +1,310 @@
+"""
+Bulk-load graphs extracted by `sanguo_extract.py` into Neo4j.
+
+Nodes are deduplicated by (label, id) and relationships by (source, type, target)
+across all chunks, and each keeps the list of chunk IDs it was extracted from in a
+`chunk_ids` property. Loading then runs in three phases:
+
+    1. a uniqueness constraint on `id` for every label, so MERGE uses an index
+    2. nodes, in `UNWIND $rows MERGE` batches grouped by label
+    3. relationships, in batches grouped by (type, source label, target label)
+
+Batches within a phase run on parallel writers. Neo4j retries transient errors such
+as deadlocks between concurrent relationship batches inside `execute_write`.
+
+With --export_dir, the graph is written as CSV files for `neo4j-admin database
+import` instead, which is much faster for an initial load into an empty database.
+With --memory, it is loaded into an in-memory stand-in and only counted.
+"""
+
+import csv
+import os
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import click
+
+from kg_exp.extract_store import ExtractStore
+
+BATCH_SIZE = 1000
+WRITERS = 4
+
+
+def _quote(name: str) -> str:
+    """Quote a label or relationship type for Cypher."""
+    return "`" + name.replace("`", "``") + "`"
+
+
+def _property_value(value):
+    # Neo4j properties are primitives or lists of primitives.
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    if isinstance(value, list) and all(isinstance(v, (str, int, float, bool)) for v in value):
+        return value
+    return str(value)
+
+
+class Graph:
+    """Nodes and relationships merged from many graph documents."""
+
+    def __init__(self):
+        # (label, id) -> properties
+        self.nodes = {}
+        # (source label, source id, type, target label, target id) -> properties
+        self.relationships = {}
+
+    @staticmethod
+    def _merge(properties: dict, new: dict, chunk_id: str) -> None:
+        for key, value in new.items():
+            if key not in ("id", "chunk_ids"):
+                properties[key] = _property_value(value)
+        if chunk_id not in properties["chunk_ids"]:
+            properties["chunk_ids"].append(chunk_id)
+
+    def _add_node(self, node, chunk_id: str) -> tuple[str, str]:
+        key = (node.type, str(node.id))
+        properties = self.nodes.setdefault(key, {"chunk_ids": []})
+        self._merge(properties, node.properties, chunk_id)
+        return key
+
+    def add(self, graph_document) -> None:
+        chunk_id = graph_document.source.metadata["source"]
+        for node in graph_document.nodes:
+            self._add_node(node, chunk_id)
+        for rel in graph_document.relationships:
+            source = self._add_node(rel.source, chunk_id)
+            target = self._add_node(rel.target, chunk_id)
+            key = (*source, rel.type, *target)
+            properties = self.relationships.setdefault(key, {"chunk_ids": []})
+            self._merge(properties, rel.properties, chunk_id)
+
+    @classmethod
+    def from_store(cls, store: ExtractStore) -> "Graph":
+        graph = cls()
+        for graph_document in store.graph_documents():
+            graph.add(graph_document)
+        return graph
+
+    def node_batches(self, batch_size: int):
+        by_label = defaultdict(list)
+        for (label, _id), properties in self.nodes.items():
+            by_label[label].append({"id": _id, "properties": properties})
+        for label, rows in by_label.items():
+            for start in range(0, len(rows), batch_size):
+                yield label, rows[start : start + batch_size]
+
+    def relationship_batches(self, batch_size: int):
+        by_type = defaultdict(list)
+        for key, properties in self.relationships.items():
+            source_label, source, rel_type, target_label, target = key
+            by_type[(rel_type, source_label, target_label)].append(
+                {"source": source, "target": target, "properties": properties}
+            )
+        for group, rows in by_type.items():
+            for start in range(0, len(rows), batch_size):
+                yield group, rows[start : start + batch_size]
+
+
+class Neo4jWriter:
+    def __init__(self, driver, database: str | None = None):
+        self.driver = driver
+        self.database = database
+
+    def _run(self, query: str, **params) -> None:
+        with self.driver.session(database=self.database) as session:
+            session.execute_write(lambda tx: tx.run(query, **params).consume())
+
+    def create_constraint(self, label: str) -> None:
+        self._run(
+            f"CREATE CONSTRAINT IF NOT EXISTS FOR (n:{_quote(label)}) REQUIRE n.id IS UNIQUE"
+        )
+
+    def merge_nodes(self, label: str, rows: list[dict]) -> None:
+        self._run(
+            f"UNWIND $rows AS row MERGE (n:{_quote(label)} {{id: row.id}}) "
+            "SET n += row.properties",
+            rows=rows,
+        )
+
+    def merge_relationships(
+        self, rel_type: str, source_label: str, target_label: str, rows: list[dict]
+    ) -> None:
+        self._run(
+            "UNWIND $rows AS row "
+            f"MATCH (s:{_quote(source_label)} {{id: row.source}}) "
+            f"MATCH (t:{_quote(target_label)} {{id: row.target}}) "
+            f"MERGE (s)-[r:{_quote(rel_type)}]->(t) SET r += row.properties",
+            rows=rows,
+        )
+
+
+class MemoryWriter:
+    """An in-memory stand-in for `Neo4jWriter` with the same MERGE semantics."""
+
+    def __init__(self):
+        self.constraints = set()
+        self.nodes = {}
+        self.relationships = {}
+        self.batches = 0
+
+    def create_constraint(self, label: str) -> None:
+        self.constraints.add(label)
+
+    def merge_nodes(self, label: str, rows: list[dict]) -> None:
+        if label not in self.constraints:
+            raise RuntimeError(f"No uniqueness constraint for {label}")
+        self.batches += 1
+        for row in rows:
+            self.nodes.setdefault((label, row["id"]), {}).update(row["properties"])
+
+    def merge_relationships(
+        self, rel_type: str, source_label: str, target_label: str, rows: list[dict]
+    ) -> None:
+        self.batches += 1
+        for row in rows:
+            source, target = (source_label, row["source"]), (target_label, row["target"])
+            # Like MATCH, rows whose endpoints do not exist create nothing.
+            if source in self.nodes and target in self.nodes:
+                key = (*source, rel_type, *target)
+                self.relationships.setdefault(key, {}).update(row["properties"])
+
+
+def load(graph: Graph, writer, batch_size: int = BATCH_SIZE, writers: int = WRITERS):
+    labels = {label for label, _ in graph.nodes}
+    for label in sorted(labels):
+        writer.create_constraint(label)
+
+    with ThreadPoolExecutor(max_workers=writers) as executor:
+        # list() waits for every batch and re-raises the first failure.
+        list(
+            executor.map(
+                lambda batch: writer.merge_nodes(*batch), graph.node_batches(batch_size)
+            )
+        )
+        list(
+            executor.map(
+                lambda batch: writer.merge_relationships(*batch[0], batch[1]),
+                graph.relationship_batches(batch_size),
+            )
+        )
+
+
+def export_csv(graph: Graph, export_dir: str) -> list[str]:
+    """
+    Write `neo4j-admin database import` CSVs: one node file per label, with all
+    properties as strings and `chunk_ids` as a string array, and one relationship
+    file with its properties the same way. Returns the import command.
+    """
+    os.makedirs(export_dir, exist_ok=True)
+    ids = {key: i for i, key in enumerate(graph.nodes)}
+    by_label = defaultdict(list)
+    for key in graph.nodes:
+        by_label[key[0]].append(key)
+
+    def cell(value) -> str:
+        if isinstance(value, list):
+            return ";".join(str(v) for v in value)
+        return "" if value is None else str(value)
+
+    node_files = []
+    for i, (label, keys) in enumerate(by_label.items()):
+        columns = sorted(
+            {name for key in keys for name in graph.nodes[key]} - {"chunk_ids"}
+        )
+        path = os.path.join(export_dir, f"nodes_{i}.csv")
+        with open(path, "w", newline="") as f:
+            out = csv.writer(f)
+            out.writerow([":ID", "id", ":LABEL", "chunk_ids:string[]", *columns])
+            for key in keys:
+                properties = graph.nodes[key]
+                out.writerow(
+                    [
+                        ids[key],
+                        key[1],
+                        label,
+                        cell(properties["chunk_ids"]),
+                        *(cell(properties.get(name)) for name in columns),
+                    ]
+                )
+        node_files.append(path)
+
+    relationships_file = os.path.join(export_dir, "relationships.csv")
+    columns = sorted(
+        {name for properties in graph.relationships.values() for name in properties}
+        - {"chunk_ids"}
+    )
+    with open(relationships_file, "w", newline="") as f:
+        out = csv.writer(f)
+        out.writerow([":START_ID", ":END_ID", ":TYPE", "chunk_ids:string[]", *columns])
+        for key, properties in graph.relationships.items():
+            source, target = key[:2], key[3:]
+            out.writerow(
+                [
+                    ids[source],
+                    ids[target],
+                    key[2],
+                    cell(properties["chunk_ids"]),
+                    *(cell(properties.get(name)) for name in columns),
+                ]
+            )
+
+    return [
+        "neo4j-admin",
+        "database",
+        "import",
+        "full",
+        *(f"--nodes={path}" for path in node_files),
+        f"--relationships={relationships_file}",
+        "neo4j",
+    ]
+
+
+@click.command()
+@click.option("--input", "input_path", default="output/sanguo_kg.jsonl", help="Extraction store")
+@click.option("--uri", default="bolt://localhost:7687", envvar="NEO4J_URI", help="Neo4j URI")
+@click.option("--user", default="neo4j", envvar="NEO4J_USERNAME", help="Neo4j user")
+@click.option("--password", default="password", envvar="NEO4J_PASSWORD", help="Neo4j password")
+@click.option("--database", default=None, help="Neo4j database, default for the server")
+@click.option("--batch_size", default=BATCH_SIZE, help="Rows per UNWIND transaction")
+@click.option("--writers", default=WRITERS, help="Parallel write sessions")
+@click.option("--export_dir", default=None, help="Write neo4j-admin import CSVs here instead")
+@click.option("--memory", is_flag=True, help="Load into an in-memory stand-in instead")
+def run(
+    input_path: str,
+    uri: str,
+    user: str,
+    password: str,
+    database: str | None,
+    batch_size: int,
+    writers: int,
+    export_dir: str | None,
+    memory: bool,
+) -> None:
+    graph = Graph.from_store(ExtractStore(input_path))
+    print(f"{len(graph.nodes)} nodes, {len(graph.relationships)} relationships")
+
+    if export_dir:
+        command = export_csv(graph, export_dir)
+        print("Import into an empty, stopped database with:")
+        print(" ".join(command))
+        return
+
+    if memory:
+        writer = MemoryWriter()
+        load(graph, writer, batch_size, writers)
+        print(
+            f"Loaded {len(writer.nodes)} nodes and {len(writer.relationships)} "
+            f"relationships in {writer.batches} batches"
+        )
+        return
+
+    from neo4j import GraphDatabase
+
+    with GraphDatabase.driver(uri, auth=(user, password)) as driver:
+        driver.verify_connectivity()
+        load(graph, Neo4jWriter(driver, database), batch_size, writers)
+    print(f"Loaded into {uri}")
+
+
+if __name__ == "__main__":
+    run()
@@ -1,62 +1,195 @@
+import itertools
 import os
+import queue
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 import click
 import dotenv
 from langchain_experimental.graph_transformers import LLMGraphTransformer
 from langchain_ollama import OllamaLLM
 from langchain_core.documents import Document
-from langchain_text_splitters import RecursiveCharacterTextSplitter
+from tqdm import tqdm
 
-from langfuse.callback import CallbackHandler
+import chunking
+from kg_exp.extract_store import ExtractStore, text_hash
 
 dotenv.load_dotenv()
 
+# Seconds a backend is held back after a failure, doubled on each retry.
+_RETRY_BACKOFF_S = 1.0
+
+
+def _parse_llm(spec: str) -> OllamaLLM:
+    """`model` or `model@base_url`, e.g. `qwen3:8b@http://gpu2:11434`."""
+    model, _, base_url = spec.partition("@")
+    return OllamaLLM(model=model, base_url=base_url or None, temperature=0)
+
+
+def extract_chunks(
+    documents: list[Document],
+    transformers: dict[str, LLMGraphTransformer],
+    store: ExtractStore,
+    concurrency: int,
+    max_retries: int,
+    callbacks: list,
+) -> tuple[Counter, Counter]:
+    """
+    Extract every document and append the results to `store` as they finish.
+
+    Each backend in `transformers` runs at most `concurrency` chunks at a time, and a
+    chunk goes to whichever backend frees a slot first, so faster backends take more
+    of the work. Failed chunks are retried up to `max_retries` times, on any backend,
+    and a backend that fails is given no new work until its backoff expires.
+
+    Returns the final outcome per chunk (True/False counts) and the outcome of every
+    attempt per backend ((backend, True/False) counts).
+    """
+    slots = queue.Queue()
+    for name in itertools.chain.from_iterable(
+        itertools.repeat(list(transformers), concurrency)
+    ):
+        slots.put(name)
+
+    def extract(document: Document) -> list[tuple[str, bool]]:
+        attempts = []
+        for attempt in range(max_retries + 1):
+            name = slots.get()
+            start = time.perf_counter()
+            try:
+                graph = transformers[name].process_response(
+                    document, config={"callbacks": callbacks}
+                )
+            except Exception as e:
+                store.add_error(document, e, name, time.perf_counter() - start)
+                attempts.append((name, False))
+                # Keep the failing backend's slot for a while, so retries and other
+                # chunks go to healthy backends first.
+                if attempt < max_retries:
+                    time.sleep(_RETRY_BACKOFF_S * 2**attempt)
+            else:
+                store.add(document, graph, name, time.perf_counter() - start)
+                attempts.append((name, True))
+                break
+            finally:
+                slots.put(name)
+        return attempts
+
+    chunks = Counter()
+    attempts = Counter()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency * len(transformers)) as executor:
+        futures = [executor.submit(extract, document) for document in documents]
+        progress = tqdm(as_completed(futures), total=len(futures))
+        try:
+            for future in progress:
+                chunk_attempts = future.result()
+                attempts.update(chunk_attempts)
+                chunks[chunk_attempts[-1][1]] += 1
+                done = chunks.total()
+                progress.set_postfix(
+                    chunks_per_min=f"{done / (time.perf_counter() - start) * 60:.1f}",
+                    failed=chunks[False],
+                )
+        except BaseException:
+            executor.shutdown(cancel_futures=True)
+            raise
+    return chunks, attempts
+
+
+def _print_report(chunks: Counter, attempts: Counter, elapsed_s: float) -> None:
+    total = chunks.total()
+    if not total:
+        return
+    print(
+        f"Extracted {chunks[True]}/{total} chunks in {elapsed_s:.1f}s, "
+        f"{total / elapsed_s * 60:.1f} chunks/min, failure rate {chunks[False] / total:.2%}"
+    )
+    for name in sorted({name for name, _ in attempts}):
+        ok, failed = attempts[(name, True)], attempts[(name, False)]
+        print(
+            f"  {name}: {ok} extracted, {failed} failed attempts "
+            f"({failed / (ok + failed):.2%})"
+        )
+
 
 @click.command()
 @click.option("--input_file", default="data/sanguo.txt", help="Input text file")
-@click.option("--model", default="qwen3:8b", help="Model name")
+@click.option(
+    "--llm",
+    "llms",
+    multiple=True,
+    default=["qwen3:8b"],
+    help="Model name, optionally with @base_url; repeat to spread chunks over backends",
+)
+@click.option("--concurrency", default=2, help="Chunks in flight per backend")
+@click.option("--max_retries", default=1, help="Retries for a failed chunk")
+@click.option(
+    "--output", default="output/sanguo_kg.jsonl", help="Append-only extraction store"
+)
+@click.option("--restart", is_flag=True, help="Discard earlier extractions")
 @click.option("--debug", is_flag=True, help="Enable debug mode")
 @click.option(
     "--max_chunks", default=None, type=int, help="Maximum number of chunks to process"
 )
-def extract(input_file: str, model: str, debug: bool, max_chunks: int) -> None:
+def extract(
+    input_file: str,
+    llms: tuple[str, ...],
+    concurrency: int,
+    max_retries: int,
+    output: str,
+    restart: bool,
+    debug: bool,
+    max_chunks: int,
+) -> None:
     """
-    Extract knowledge graph from the input text file and print the nodes and relationships.
+    Extract a knowledge graph from every chunk of the input text file into an
+    append-only store. Chunks already extracted from the same text are skipped, so an
+    interrupted run resumes where it stopped.
     """
+    callbacks = []
+    if debug:
+        from langfuse.callback import CallbackHandler
 
-    langfuse_handler = CallbackHandler(
-        secret_key=os.environ.get("LANGFUSE_SECRET_KEY"),
-        public_key=os.environ.get("LANGFUSE_PUBLIC_KEY"),
-        host="https://us.cloud.langfuse.com",  # 🇺🇸 US region
-    )
-
-    llm = OllamaLLM(model=model)
-
-    llm_transformer = LLMGraphTransformer(llm=llm)
+        callbacks.append(
+            CallbackHandler(
+                secret_key=os.environ.get("LANGFUSE_SECRET_KEY"),
+                public_key=os.environ.get("LANGFUSE_PUBLIC_KEY"),
+                host="https://us.cloud.langfuse.com",  # 🇺🇸 US region
+            )
+        )
 
-    with open(input_file, "r") as f:
-        text = f.read()
+    transformers = {spec: LLMGraphTransformer(llm=_parse_llm(spec)) for spec in llms}
 
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=1000, chunk_overlap=200, separators=["\n\n", "\n", " ", "。", ""]
-    )
-    texts = text_splitter.split_text(text)
+    corpus = chunking.Corpus([input_file])
+    chunks = corpus.chunks()
     if max_chunks is not None:
-        texts = texts[:max_chunks]
+        chunks = chunks[:max_chunks]
 
     documents = [
-        Document(page_content=text, metadata={"source": f"chunk-{i}"})
-        for i, text in enumerate(texts)
+        Document(page_content=corpus.text(chunk), metadata={"source": f"chunk-{i}"})
+        for i, chunk in enumerate(chunks)
     ]
 
-    callbacks = []
-    if debug:
-        callbacks.append(langfuse_handler)
-    graph_documents = llm_transformer.convert_to_graph_documents(
-        documents, config={"callbacks": [langfuse_handler]}
+    if restart and os.path.exists(output):
+        os.remove(output)
+    store = ExtractStore(output)
+    done = store.done()
+    pending = [
+        document
+        for document in documents
+        if done.get(document.metadata["source"]) != text_hash(document.page_content)
+    ]
+    if len(pending) < len(documents):
+        print(f"Resuming: {len(documents) - len(pending)} chunks already extracted")
+
+    start = time.perf_counter()
+    chunks, attempts = extract_chunks(
+        pending, transformers, store, concurrency, max_retries, callbacks
     )
-    print(f"Nodes:{graph_documents[0].nodes}")
-    print(f"Relationships:{graph_documents[0].relationships}")
+    _print_report(chunks, attempts, time.perf_counter() - start)
+    print(f"Extractions saved to {output}")
 
 
 if __name__ == "__main__":
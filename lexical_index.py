@@ -0,0 +1,312 @@
+"""
+BM25 over character bigrams and trigrams, for Chinese text without a tokenizer.
+
+Text is folded to simplified Chinese and split into runs of word characters; every
+bigram and trigram inside a run is a term. Posting lists hold (document, term
+frequency) pairs, stored as delta-encoded document IDs followed by the frequencies,
+all LEB128 varint-encoded into a single byte blob that is memory-mapped on load.
+
+`HybridRetriever` combines it with any vector retriever by reciprocal-rank fusion,
+or serves lexical results alone, which needs no embedding call at all.
+"""
+
+import json
+import os
+import re
+from collections import Counter
+
+import numpy as np
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from pydantic import ConfigDict
+
+from flat_index import top_k
+from text_normalization import fold
+
+_TERMS_FILE = "terms.txt"
+_POSTINGS_FILE = "postings.bin"
+_DOCS_FILE = "docs.jsonl"
+_META_FILE = "lexical_meta.json"
+_ARRAYS = ["offsets", "doc_freqs", "doc_lengths"]
+_RUN_RE = re.compile(r"\w+")
+_NGRAMS = (2, 3)
+# BM25 parameters.
+K1 = 1.2
+B = 0.75
+# Reciprocal-rank fusion constant.
+RRF_K = 60
+
+
+def terms(text: str) -> list[str]:
+    result = []
+    for run in _RUN_RE.findall(fold(text)):
+        for n in _NGRAMS:
+            result.extend(run[i : i + n] for i in range(len(run) - n + 1))
+    return result
+
+
+def varint_sizes(values: np.ndarray) -> np.ndarray:
+    values = np.asarray(values, dtype=np.uint64)
+    sizes = np.ones(len(values), dtype=np.int64)
+    for bits in (7, 14, 21, 28):
+        sizes += values >= (1 << bits)
+    return sizes
+
+
+def encode_varints(values: np.ndarray) -> np.ndarray:
+    """LEB128-encode non-negative integers (< 2**35) into a uint8 array."""
+    values = np.asarray(values, dtype=np.uint64)
+    sizes = varint_sizes(values)
+    starts = np.cumsum(sizes) - sizes
+    out = np.empty(int(sizes.sum()), dtype=np.uint8)
+    for i in range(5):
+        mask = sizes > i
+        byte = (values[mask] >> np.uint64(7 * i)) & np.uint64(0x7F)
+        more = (sizes[mask] > i + 1).astype(np.uint64) << np.uint64(7)
+        out[starts[mask] + i] = (byte | more).astype(np.uint8)
+    return out
+
+
+def decode_varints(data: np.ndarray) -> np.ndarray:
+    data = np.asarray(data, dtype=np.uint8)
+    if not len(data):
+        return np.empty(0, dtype=np.int64)
+    ends = np.flatnonzero(data < 0x80)
+    starts = np.concatenate([[0], ends[:-1] + 1])
+    group = np.repeat(np.arange(len(starts)), ends - starts + 1)
+    shifts = (7 * (np.arange(len(data)) - starts[group])).astype(np.uint64)
+    parts = (data & 0x7F).astype(np.uint64) << shifts
+    return np.add.reduceat(parts, starts).astype(np.int64)
+
+
+class LexicalIndex:
+    def __init__(
+        self,
+        terms: list[str],
+        offsets: np.ndarray,
+        doc_freqs: np.ndarray,
+        postings: np.ndarray,
+        doc_lengths: np.ndarray,
+        ids: list[str],
+        texts: list[str],
+        metadatas: list[dict],
+    ):
+        self.terms = terms
+        self.offsets = offsets
+        self.doc_freqs = doc_freqs
+        self.postings = postings
+        self.doc_lengths = doc_lengths
+        self.ids = ids
+        self.texts = texts
+        self.metadatas = metadatas
+        self._term_ids = {term: i for i, term in enumerate(terms)}
+        self._avg_length = float(np.mean(doc_lengths)) if len(doc_lengths) else 0.0
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @classmethod
+    def build(cls, ids: list[str], texts: list[str], metadatas: list[dict]):
+        term_ids = {}
+        triples = []
+        doc_lengths = np.empty(len(texts), dtype=np.int32)
+        for doc, text in enumerate(texts):
+            counts = Counter(terms(text))
+            doc_lengths[doc] = sum(counts.values())
+            rows = [
+                [term_ids.setdefault(term, len(term_ids)), doc, tf]
+                for term, tf in counts.items()
+            ]
+            triples.append(np.array(rows, dtype=np.int64).reshape(-1, 3))
+        triples = np.concatenate(triples) if triples else np.empty((0, 3), np.int64)
+
+        # Renumber terms in sorted order and sort the postings by (term, doc).
+        vocabulary = sorted(term_ids)
+        rank = np.empty(len(vocabulary), dtype=np.int64)
+        rank[[term_ids[term] for term in vocabulary]] = np.arange(len(vocabulary))
+        term, doc, tf = rank[triples[:, 0]], triples[:, 1], triples[:, 2]
+        order = np.lexsort((doc, term))
+        term, doc, tf = term[order], doc[order], tf[order]
+
+        doc_freqs = np.bincount(term, minlength=len(vocabulary)).astype(np.int32)
+        first = np.concatenate([[0], np.cumsum(doc_freqs)[:-1]])
+        deltas = np.diff(doc, prepend=0)
+        deltas[first[doc_freqs > 0]] = doc[first[doc_freqs > 0]]
+
+        # Per term: its df document deltas, then its df frequencies.
+        values = np.empty(2 * len(term), dtype=np.int64)
+        position = np.arange(len(term)) - first[term]
+        values[2 * first[term] + position] = deltas
+        values[2 * first[term] + doc_freqs[term] + position] = tf
+
+        sizes = np.add.reduceat(varint_sizes(values), 2 * first) if len(values) else []
+        offsets = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(sizes)
+        return cls(
+            vocabulary,
+            offsets,
+            doc_freqs,
+            encode_varints(values),
+            doc_lengths,
+            ids,
+            texts,
+            metadatas,
+        )
+
+    @classmethod
+    def from_vector_store(cls, vector_store, page_size: int = 5000):
+        """Index every document of a LangChain Chroma store."""
+        collection = vector_store._collection
+        ids, texts, metadatas = [], [], []
+        for offset in range(0, collection.count(), page_size):
+            page = collection.get(
+                include=["documents", "metadatas"], limit=page_size, offset=offset
+            )
+            ids.extend(page["ids"])
+            texts.extend(page["documents"])
+            metadatas.extend(page["metadatas"])
+        return cls.build(ids, texts, metadatas)
+
+    def save(self, index_dir: str) -> None:
+        os.makedirs(index_dir, exist_ok=True)
+        for name in _ARRAYS:
+            np.save(os.path.join(index_dir, f"{name}.npy"), getattr(self, name))
+        self.postings.tofile(os.path.join(index_dir, _POSTINGS_FILE))
+        with open(os.path.join(index_dir, _TERMS_FILE), "w") as f:
+            f.write("\n".join(self.terms))
+        with open(os.path.join(index_dir, _DOCS_FILE), "w") as f:
+            for _id, text, metadata in zip(self.ids, self.texts, self.metadatas):
+                record = {"id": _id, "text": text, "metadata": metadata}
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        with open(os.path.join(index_dir, _META_FILE), "w") as f:
+            json.dump({"ngrams": _NGRAMS, "k1": K1, "b": B}, f)
+
+    @classmethod
+    def load(cls, index_dir: str):
+        arrays = {
+            name: np.load(os.path.join(index_dir, f"{name}.npy"), mmap_mode="r")
+            for name in _ARRAYS
+        }
+        postings_path = os.path.join(index_dir, _POSTINGS_FILE)
+        if os.path.getsize(postings_path):
+            postings = np.memmap(postings_path, dtype=np.uint8, mode="r")
+        else:
+            postings = np.empty(0, dtype=np.uint8)
+        with open(os.path.join(index_dir, _TERMS_FILE), "r") as f:
+            vocabulary = f.read().split("\n")
+        if vocabulary == [""]:
+            vocabulary = []
+        ids, texts, metadatas = [], [], []
+        with open(os.path.join(index_dir, _DOCS_FILE), "r") as f:
+            for line in f:
+                record = json.loads(line)
+                ids.append(record["id"])
+                texts.append(record["text"])
+                metadatas.append(record["metadata"])
+        return cls(
+            vocabulary,
+            postings=postings,
+            ids=ids,
+            texts=texts,
+            metadatas=metadatas,
+            **arrays,
+        )
+
+    def term_postings(self, term: str) -> tuple[np.ndarray, np.ndarray]:
+        """(document rows, term frequencies) of a term."""
+        i = self._term_ids.get(term)
+        if i is None:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        values = decode_varints(self.postings[self.offsets[i] : self.offsets[i + 1]])
+        df = int(self.doc_freqs[i])
+        return np.cumsum(values[:df]), values[df:]
+
+    def scores(self, query: str) -> np.ndarray:
+        """BM25 score of every document for `query`."""
+        docs, weights = [], []
+        for term, query_tf in Counter(terms(query)).items():
+            rows, tfs = self.term_postings(term)
+            if not len(rows):
+                continue
+            idf = np.log(1 + (len(self) - len(rows) + 0.5) / (len(rows) + 0.5))
+            norm = K1 * (1 - B + B * self.doc_lengths[rows] / self._avg_length)
+            docs.append(rows)
+            weights.append(query_tf * idf * tfs * (K1 + 1) / (tfs + norm))
+        if not docs:
+            return np.zeros(len(self), dtype=np.float64)
+        return np.bincount(
+            np.concatenate(docs), weights=np.concatenate(weights), minlength=len(self)
+        )
+
+    def search(self, queries: list[str], k: int) -> tuple[np.ndarray, np.ndarray]:
+        """(scores, rows) of the top k documents per query, -1 rows for no match."""
+        all_scores = np.zeros((len(queries), k))
+        all_rows = np.full((len(queries), k), -1, dtype=np.int64)
+        for i, query in enumerate(queries):
+            scores = self.scores(query)
+            top_scores, rows = top_k(scores[None, :], k)
+            matched = top_scores[0] > 0
+            n = int(matched.sum())
+            all_scores[i, :n] = top_scores[0][matched]
+            all_rows[i, :n] = rows[0][matched]
+        return all_scores, all_rows
+
+    def document(self, row: int) -> Document:
+        return Document(
+            page_content=self.texts[row], metadata=self.metadatas[row], id=self.ids[row]
+        )
+
+
+def _document_key(document: Document) -> str:
+    return document.id or document.page_content
+
+
+def reciprocal_rank_fusion(rankings: list[list[Document]], k: int) -> list[Document]:
+    """Merge ranked lists by the sum of 1 / (RRF_K + rank) over the lists."""
+    scores = Counter()
+    documents = {}
+    for ranking in rankings:
+        for rank, document in enumerate(ranking):
+            key = _document_key(document)
+            scores[key] += 1 / (RRF_K + rank + 1)
+            documents.setdefault(key, document)
+    return [documents[key] for key, _ in scores.most_common(k)]
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    Lexical BM25 retrieval, fused with `vector_retriever` by reciprocal-rank fusion
+    when one is given. Each side contributes its top `fetch_k` documents; the vector
+    retriever should be configured to return that many.
+    """
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    index: LexicalIndex
+    vector_retriever: BaseRetriever | None = None
+    k: int = 4
+    fetch_k: int = 20
+
+    def _lexical(self, queries: list[str], k: int) -> list[list[Document]]:
+        _, rows = self.index.search(queries, k)
+        return [
+            [self.index.document(row) for row in query_rows if row >= 0]
+            for query_rows in rows
+        ]
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> list[Document]:
+        return self.batch([query])[0]
+
+    def batch(self, inputs: list[str], config=None, **kwargs) -> list[list[Document]]:
+        inputs = list(inputs)
+        if self.vector_retriever is None:
+            return self._lexical(inputs, self.k)
+        lexical = self._lexical(inputs, self.fetch_k)
+        vector = self.vector_retriever.batch(inputs, config, **kwargs)
+        return [
+            reciprocal_rank_fusion([vector_docs, lexical_docs], self.k)
+            for vector_docs, lexical_docs in zip(vector, lexical)
+        ]
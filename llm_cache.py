@@ -0,0 +1,76 @@
+import hashlib
+import json
+
+from langchain_core.caches import RETURN_VAL_TYPE, BaseCache
+from langchain_core.globals import get_llm_cache, set_llm_cache
+from langchain_core.outputs import Generation
+
+from disk_cache import DiskCache
+
+_DEFAULT_CACHE_PATH = "cache/llm.sqlite3"
+_DEFAULT_MAX_BYTES = 1024**3
+
+
+class DiskLLMCache(BaseCache):
+    """
+    A persistent LangChain LLM cache backed by `DiskCache`.
+
+    Entries are keyed by LangChain's `llm_string`, which covers the backend, model,
+    temperature and other sampling parameters, plus the full rendered prompt. They
+    are stored under `namespace`, so experiments can be cached (and cleared)
+    independently. Only text completions are stored, which is all the completion
+    models used here produce.
+    """
+
+    def __init__(
+        self,
+        namespace: str = "default",
+        path: str = _DEFAULT_CACHE_PATH,
+        max_bytes: int | None = _DEFAULT_MAX_BYTES,
+    ):
+        self.namespace = namespace
+        self.cache = DiskCache(path, table="llm", max_bytes=max_bytes)
+
+    @staticmethod
+    def _key(prompt: str, llm_string: str) -> str:
+        return hashlib.sha256(f"{llm_string}\0{prompt}".encode("utf-8")).hexdigest()
+
+    def lookup(self, prompt: str, llm_string: str) -> RETURN_VAL_TYPE | None:
+        value = self.cache.get(self.namespace, self._key(prompt, llm_string))
+        if value is None:
+            return None
+        return [Generation(**generation) for generation in json.loads(value)]
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        value = json.dumps(
+            [
+                {"text": generation.text, "generation_info": generation.generation_info}
+                for generation in return_val
+            ],
+            ensure_ascii=False,
+        ).encode("utf-8")
+        self.cache.put(self.namespace, self._key(prompt, llm_string), value)
+
+    def clear(self, **kwargs) -> None:
+        self.cache.clear(self.namespace)
+
+    def print_stats(self) -> None:
+        stats = self.cache.stats()
+        print(
+            f"LLM cache ({self.namespace}): {stats['hits']} hits, "
+            f"{stats['misses']} misses, hit rate {stats['hit_rate']:.2%}, "
+            f"{stats['entries']} entries, {stats['bytes'] / 1024**2:.1f} MiB"
+        )
+
+
+def enable(namespace: str, path: str = _DEFAULT_CACHE_PATH) -> DiskLLMCache:
+    """Route every LangChain LLM call in this process through a disk cache."""
+    cache = DiskLLMCache(namespace, path=path)
+    set_llm_cache(cache)
+    return cache
+
+
+def print_stats() -> None:
+    cache = get_llm_cache()
+    if isinstance(cache, DiskLLMCache):
+        cache.print_stats()
@@ -0,0 +1,110 @@
+"""
+Near-duplicate detection for short texts with MinHash and LSH banding.
+
+Texts are folded to simplified Chinese, stripped of punctuation and whitespace and
+split into overlapping character shingles. A `MinHasher` signature estimates the
+Jaccard similarity of two shingle sets; `NearDuplicateIndex` buckets signatures by
+band so only texts sharing a band are compared, and confirms candidates with the
+exact Jaccard similarity.
+"""
+
+import re
+import zlib
+from collections import defaultdict
+
+import numpy as np
+
+from text_normalization import fold
+
+_NON_WORD_RE = re.compile(r"[\W_]+")
+_MASK_32 = np.uint64(0xFFFFFFFF)
+
+
+def shingles(text: str, n: int = 2) -> set[str]:
+    text = _NON_WORD_RE.sub("", fold(text))
+    if len(text) <= n:
+        return {text} if text else set()
+    return {text[i : i + n] for i in range(len(text) - n + 1)}
+
+
+def jaccard(a: set, b: set) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+class MinHasher:
+    """`num_perm` multiply-shift hash functions over 32-bit shingle hashes."""
+
+    def __init__(self, num_perm: int = 128, seed: int = 0):
+        rng = np.random.default_rng(seed)
+        self.num_perm = num_perm
+        # Odd multipliers make (a * x + b) mod 2**64 >> 32 a universal hash family.
+        self.a = rng.integers(0, 2**63, num_perm, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+        self.b = rng.integers(0, 2**63, num_perm, dtype=np.uint64)
+
+    def signature(self, shingle_set: set[str]) -> np.ndarray:
+        if not shingle_set:
+            return np.full(self.num_perm, _MASK_32, dtype=np.uint64)
+        hashes = np.fromiter(
+            (zlib.crc32(s.encode("utf-8")) for s in shingle_set),
+            dtype=np.uint64,
+            count=len(shingle_set),
+        )
+        permuted = (hashes[:, None] * self.a + self.b) >> np.uint64(32)
+        return permuted.min(axis=0)
+
+
+class NearDuplicateIndex:
+    """
+    Texts whose shingle Jaccard similarity reaches `threshold` are duplicates.
+    Signatures are split into `bands` bands of num_perm / bands rows; the default
+    32 x 4 makes a pair at similarity 0.5 a candidate with probability 0.87, and one
+    at 0.7 with probability 0.9998.
+    """
+
+    def __init__(
+        self, threshold: float = 0.7, num_perm: int = 128, bands: int = 32, seed: int = 0
+    ):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.threshold = threshold
+        self.bands = bands
+        self.hasher = MinHasher(num_perm, seed)
+        self._buckets = [defaultdict(list) for _ in range(bands)]
+        self._shingles = []
+
+    def __len__(self) -> int:
+        return len(self._shingles)
+
+    def _band_keys(self, signature: np.ndarray) -> list[bytes]:
+        return [band.tobytes() for band in np.split(signature, self.bands)]
+
+    def _match(self, shingle_set: set[str], keys: list[bytes]) -> int | None:
+        seen = set()
+        for bucket, key in zip(self._buckets, keys):
+            for item in bucket.get(key, ()):
+                if item in seen:
+                    continue
+                seen.add(item)
+                if jaccard(shingle_set, self._shingles[item]) >= self.threshold:
+                    return item
+        return None
+
+    def find(self, text: str) -> int | None:
+        """Index of an added text that `text` duplicates, if any."""
+        shingle_set = shingles(text)
+        return self._match(shingle_set, self._band_keys(self.hasher.signature(shingle_set)))
+
+    def add(self, text: str) -> int | None:
+        """Add `text` unless it duplicates an added text; returns that text's index."""
+        shingle_set = shingles(text)
+        keys = self._band_keys(self.hasher.signature(shingle_set))
+        duplicate = self._match(shingle_set, keys)
+        if duplicate is not None:
+            return duplicate
+        item = len(self._shingles)
+        self._shingles.append(shingle_set)
+        for bucket, key in zip(self._buckets, keys):
+            bucket[key].append(item)
+        return None
@@ -0,0 +1,250 @@
+"""
+End-to-end pipeline benchmark that runs without a real Ollama.
+
+By default the benchmark starts a `FakeOllama` server, points OLLAMA_HOST at it and
+times four stages on the Sanguo corpus and the manual question set:
+
+    ingest      build_db_with_chrunking into a fresh collection (no embedding cache)
+    retrieval   per-query Chroma search, and batched search on the exported FlatIndex
+    answer      exp2-style retrieve + generate, `concurrency` questions at a time
+    grade       run_eval_chain over the answers
+
+Each stage reports wall time and the simulated model time spent inside the fake
+server. `overhead_s` is the wall time left after dividing the model time by the
+stage's concurrency: the cost of our own pipeline, independent of model speed.
+Results are printed as JSON and compared against `--baseline` if it exists; use
+`--update_baseline` to record a new one. Pass `--ollama_host` to run against a real
+server instead, in which case model time is unknown and only wall times are reported.
+"""
+
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import click
+import numpy as np
+from langchain_ollama.llms import OllamaLLM
+
+import chroma_lib
+import context_packing
+from fake_ollama import FakeOllama
+from sanguo_exp import eval, retrieval
+
+_MODEL = "qwen2.5:7b"
+_CORPUS = "data/sanguo.txt"
+_COLLECTION_NAME = "sanguo"
+# Overhead changes below this many seconds are treated as noise.
+_MIN_REGRESSION_S = 0.05
+
+
+def _questions(num_questions: int) -> list[dict]:
+    # The manual set is checked in, so runs are comparable across checkouts.
+    questions = eval._load_manual_questions()
+    return [dict(questions[i % len(questions)]) for i in range(num_questions)]
+
+
+def _timed_stage(fake: FakeOllama | None, concurrency: int, fn) -> dict:
+    if fake:
+        fake.reset_stats()
+    start = time.perf_counter()
+    metrics = fn() or {}
+    wall_s = time.perf_counter() - start
+    stage = {"wall_s": wall_s, "concurrency": concurrency, **metrics}
+    if fake:
+        stats = fake.stats()
+        stage["model_s"] = stats["model_s"]
+        stage["overhead_s"] = max(wall_s - stats["model_s"] / concurrency, 0.0)
+        stage["requests"] = stats["generate"] + stats["embed"]
+    return stage
+
+
+def _latency_percentiles(latencies: list[float]) -> dict:
+    latencies = np.asarray(latencies) * 1000
+    return {
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+    }
+
+
+def run_benchmark(
+    work_dir: str,
+    fake: FakeOllama | None,
+    num_questions: int,
+    concurrency: int,
+    batch_size: int,
+    workers: int,
+) -> dict:
+    db_dir = os.path.join(work_dir, "chroma_db")
+    flat_dir = os.path.join(work_dir, "flat_index")
+    questions = _questions(num_questions)
+    queries = [question["query"] for question in questions]
+    stages = {}
+
+    def ingest():
+        embedding_model = chroma_lib.embedding_model(_MODEL, cache_path=None)
+        chroma_lib.build_db_with_chrunking(
+            [_CORPUS],
+            db_dir,
+            _COLLECTION_NAME,
+            embedding_model=embedding_model,
+            batch_size=batch_size,
+            max_workers=workers,
+        )
+        vector_store = chroma_lib.get_vector_store(db_dir, _COLLECTION_NAME, None)
+        return {"chunks": vector_store._collection.count()}
+
+    stages["ingest"] = _timed_stage(fake, workers, ingest)
+    stages["ingest"]["chunks_per_s"] = stages["ingest"]["chunks"] / stages["ingest"]["wall_s"]
+
+    embedding_model = chroma_lib.embedding_model(_MODEL, cache_path=None)
+    vector_store = chroma_lib.get_vector_store(db_dir, _COLLECTION_NAME, embedding_model)
+    retriever = vector_store.as_retriever(search_kwargs={"k": 5})
+
+    def chroma_retrieval():
+        latencies = []
+        for query in queries:
+            start = time.perf_counter()
+            retriever.invoke(query)
+            latencies.append(time.perf_counter() - start)
+        return _latency_percentiles(latencies)
+
+    stages["retrieval_chroma"] = _timed_stage(fake, 1, chroma_retrieval)
+
+    flat_retriever = chroma_lib.export_flat_index(
+        db_dir, _COLLECTION_NAME, flat_dir, embedding_model=embedding_model
+    ).as_retriever(search_kwargs={"k": 5})
+
+    def flat_retrieval():
+        flat_retriever.batch(queries)
+
+    stages["retrieval_flat"] = _timed_stage(fake, 1, flat_retrieval)
+    for name in ("retrieval_chroma", "retrieval_flat"):
+        stages[name]["qps"] = len(queries) / stages[name]["wall_s"]
+
+    chain = retrieval.QA_PROMPT | OllamaLLM(model=_MODEL, temperature=0)
+    answers = []
+
+    def answer():
+        def answer_one(question):
+            docs = retriever.invoke(question["query"])
+            material = context_packing.pack(docs).text
+            predict = chain.invoke({"material": material, "question": question["query"]})
+            return {**question, "predict": predict}
+
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            answers.extend(executor.map(answer_one, questions))
+
+    stages["answer"] = _timed_stage(fake, concurrency, answer)
+    stages["answer"]["qps"] = len(questions) / stages["answer"]["wall_s"]
+
+    def grade():
+        results = eval.run_eval_chain(
+            answers, OllamaLLM(model=_MODEL, temperature=0), concurrency=concurrency
+        )
+        return {"llm_graded": sum(result["grader"] == "llm" for result in results)}
+
+    stages["grade"] = _timed_stage(fake, concurrency, grade)
+    return stages
+
+
+def compare(stages: dict, baseline: dict, tolerance: float) -> dict:
+    """Relative change of each stage's overhead (or wall time) against the baseline."""
+    comparison = {}
+    for name, stage in stages.items():
+        base = baseline.get("stages", {}).get(name)
+        if not base:
+            continue
+        metric = "overhead_s" if "overhead_s" in stage and "overhead_s" in base else "wall_s"
+        diff = stage[metric] - base[metric]
+        comparison[name] = {
+            "metric": metric,
+            "baseline": base[metric],
+            "current": stage[metric],
+            "change": diff / base[metric] if base[metric] else None,
+            "regression": diff > max(tolerance * base[metric], _MIN_REGRESSION_S),
+        }
+    return comparison
+
+
+@click.command()
+@click.option("--num_questions", default=100, help="Questions answered and graded")
+@click.option("--concurrency", default=4, help="Parallel questions in answer and grade")
+@click.option("--batch_size", default=64, help="Ingestion batch size")
+@click.option("--workers", default=4, help="Ingestion embedding workers")
+@click.option("--latency", default=0.0, help="Fake server seconds before the first token")
+@click.option("--token_rate", default=0.0, help="Fake server tokens per second, 0 for instant")
+@click.option("--embed_latency", default=0.0, help="Fake server seconds per embedding request")
+@click.option("--ollama_host", default=None, help="Benchmark a real Ollama server instead")
+@click.option("--output", default=None, help="Also write the JSON report to this file")
+@click.option("--baseline", default="bench/baseline.json", help="Baseline report to compare against")
+@click.option("--update_baseline", is_flag=True, help="Save this run as the new baseline")
+@click.option("--tolerance", default=0.2, help="Relative overhead increase flagged as a regression")
+def run(
+    num_questions: int,
+    concurrency: int,
+    batch_size: int,
+    workers: int,
+    latency: float,
+    token_rate: float,
+    embed_latency: float,
+    ollama_host: str | None,
+    output: str | None,
+    baseline: str,
+    update_baseline: bool,
+    tolerance: float,
+) -> None:
+    fake = None
+    if ollama_host is None:
+        fake = FakeOllama(
+            latency=latency, token_rate=token_rate, embed_latency=embed_latency
+        ).start()
+        ollama_host = fake.url
+    # Every Ollama client created from here on talks to this host.
+    os.environ["OLLAMA_HOST"] = ollama_host
+
+    config = {
+        "num_questions": num_questions,
+        "concurrency": concurrency,
+        "batch_size": batch_size,
+        "workers": workers,
+        "server": fake.config() if fake else ollama_host,
+    }
+    try:
+        with tempfile.TemporaryDirectory() as work_dir:
+            stages = run_benchmark(
+                work_dir, fake, num_questions, concurrency, batch_size, workers
+            )
+    finally:
+        if fake:
+            fake.stop()
+
+    report = {"config": config, "stages": stages}
+    if os.path.exists(baseline) and not update_baseline:
+        with open(baseline, "r") as f:
+            baseline_report = json.load(f)
+        if baseline_report.get("config") != config:
+            click.echo(f"Warning: {baseline} was recorded with a different config", err=True)
+        report["comparison"] = compare(stages, baseline_report, tolerance)
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    if output:
+        with open(output, "w") as f:
+            f.write(text)
+    if update_baseline:
+        os.makedirs(os.path.dirname(baseline) or ".", exist_ok=True)
+        with open(baseline, "w") as f:
+            f.write(text)
+        print(f"Baseline saved to {baseline}")
+
+    regressions = [
+        name for name, item in report.get("comparison", {}).items() if item["regression"]
+    ]
+    if regressions:
+        raise click.ClickException(f"Overhead regressions: {', '.join(regressions)}")
+
+
+if __name__ == "__main__":
+    run()
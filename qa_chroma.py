@@ -9,21 +9,31 @@ from langchain_core.prompts import ChatPromptTemplate
 from langfuse.callback import CallbackHandler
 
 import chroma_lib
+import context_packing
+import instrument
 
 load_dotenv()
 
+# Token budget for the retrieved text in the prompt.
+_CONTEXT_TOKENS = 4000
+
 
 @click.command()
 def run() -> None:
-    langfuse_handler = CallbackHandler(
-        secret_key=os.environ.get("LANGFUSE_SECRET_KEY"),
-        public_key=os.environ.get("LANGFUSE_PUBLIC_KEY"),
-        host="https://us.cloud.langfuse.com", # 🇺🇸 US region
-    )
-
-    embedding_model = chroma_lib.default_embedding_model()
+    callbacks = [instrument.LLMMetricsHandler()]
+    if os.environ.get("LANGFUSE_SECRET_KEY"):
+        callbacks.append(
+            CallbackHandler(
+                secret_key=os.environ.get("LANGFUSE_SECRET_KEY"),
+                public_key=os.environ.get("LANGFUSE_PUBLIC_KEY"),
+                host="https://us.cloud.langfuse.com", # 🇺🇸 US region
+            )
+        )
+
+    embedding_model = instrument.TimedEmbeddings(chroma_lib.default_embedding_model())
     retriever = chroma_lib.get_sci_fi_retriever(embedding_model)
-    docs = retriever.invoke("一本讲述太空贸易的小说")
+    with instrument.measure() as metrics, instrument.retrieval():
+        docs = retriever.invoke("一本讲述太空贸易的小说")
     for doc in docs:
         print(doc.metadata["source"])
 
@@ -35,13 +45,16 @@ def run() -> None:
     )
     model = OllamaLLM(model="deepseek-r1:7b")
     chain = prompt | model
-    result = chain.invoke({
-        "material": docs[0],
-        "question": "小说的主要人物有哪些？",
-    }, config={
-        "callbacks": [langfuse_handler],
-    })
+    with instrument.measure() as llm_metrics:
+        result = chain.invoke({
+            "material": context_packing.pack(docs, _CONTEXT_TOKENS).text,
+            "question": "小说的主要人物有哪些？",
+        }, config={
+            "callbacks": callbacks,
+        })
+    metrics.update(llm_metrics)
     print(result)
+    print(metrics)
 
 
 if __name__ == "__main__":
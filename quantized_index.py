@@ -0,0 +1,216 @@
+import json
+import os
+
+import numpy as np
+
+from flat_index import FlatIndex, VectorIndexRetriever, top_k
+
+_META_FILE = "quantized_meta.json"
+_ARRAYS = ["projection", "codes", "scales", "offsets", "norms"]
+# Rows per top-k pass, and rows decoded to float32 at a time so the converted
+# block stays in cache.
+_BLOCK_ROWS = 65536
+_DECODE_ROWS = 2048
+
+
+def _prepare(flat: FlatIndex, vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if flat.metric != "cosine":
+        return vectors
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+
+def learn_projection(train: np.ndarray, dim: int, method: str, seed: int = 0) -> np.ndarray:
+    """A (d, dim) matrix with orthonormal columns: top principal axes or random."""
+    if method == "pca":
+        centered = train - train.mean(axis=0)
+        _, _, vt = np.linalg.svd(centered, full_matrices=False)
+        return np.ascontiguousarray(vt[:dim].T, dtype=np.float32)
+    if method == "random":
+        rng = np.random.default_rng(seed)
+        q, _ = np.linalg.qr(rng.standard_normal((train.shape[1], dim)))
+        return q.astype(np.float32)
+    raise ValueError(f"Unsupported projection: {method}")
+
+
+class QuantizedIndex:
+    """
+    Exact search over compressed copies of a `FlatIndex`'s vectors.
+
+    Vectors (normalized first for the cosine metric) are optionally projected to
+    `dim` dimensions with a projection learned at build time, then stored as float32,
+    float16 or int8. Int8 codes use a per-dimension affine scale, x = offset + scale *
+    code, so a query is scored against the codes directly after scaling it once.
+    Projection is orthonormal, so inner products and L2 distances keep their
+    meaning and rankings follow the flat index's metric.
+
+    The best `rerank` candidates can be re-scored exactly against the flat index.
+    Rows refer to the flat index, so this is interchangeable with it behind
+    `VectorIndexRetriever`. All arrays are memory-mapped on load.
+    """
+
+    def __init__(
+        self,
+        flat: FlatIndex,
+        codes: np.ndarray,
+        norms: np.ndarray,
+        projection: np.ndarray | None = None,
+        scales: np.ndarray | None = None,
+        offsets: np.ndarray | None = None,
+        rerank: int = 0,
+    ):
+        self.flat = flat
+        self.metric = flat.metric
+        self.codes = codes
+        # ||x||^2 of the decoded vectors, for the l2 metric.
+        self.norms = norms
+        self.projection = projection
+        self.scales = scales
+        self.offsets = offsets
+        self.rerank = rerank
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def describe(self) -> str:
+        dim = self.codes.shape[1]
+        return f"{self.codes.dtype.name} dim={dim}" + (
+            " projected" if self.projection is not None else ""
+        )
+
+    @classmethod
+    def build(
+        cls,
+        flat: FlatIndex,
+        dtype: str = "int8",
+        dim: int = 0,
+        projection: str = "pca",
+        train_size: int = 20000,
+        seed: int = 0,
+    ):
+        if dtype not in ("float32", "float16", "int8"):
+            raise ValueError(f"Unsupported dtype: {dtype}")
+        rng = np.random.default_rng(seed)
+        train_rows = np.sort(
+            rng.choice(len(flat), min(train_size, len(flat)), replace=False)
+        )
+        train = _prepare(flat, flat.vectors[train_rows])
+
+        matrix = None
+        if dim and dim < train.shape[1]:
+            matrix = learn_projection(train, dim, projection, seed)
+            train = train @ matrix
+
+        scales = offsets = None
+        if dtype == "int8":
+            # Codes -128..127 map onto the [min, max] range seen in training.
+            low, high = train.min(axis=0), train.max(axis=0)
+            scales = np.maximum(high - low, 1e-12).astype(np.float32) / 255
+            offsets = (low + 128 * scales).astype(np.float32)
+
+        codes = np.empty((len(flat), train.shape[1]), dtype=dtype)
+        norms = np.empty(len(flat), dtype=np.float32)
+        for start in range(0, len(flat), _BLOCK_ROWS):
+            block = _prepare(flat, flat.vectors[start : start + _BLOCK_ROWS])
+            if matrix is not None:
+                block = block @ matrix
+            if scales is not None:
+                block = np.clip(np.rint((block - offsets) / scales), -128, 127)
+            codes[start : start + len(block)] = block
+            decoded = cls._decode(codes[start : start + len(block)], scales, offsets)
+            norms[start : start + len(block)] = np.einsum("ij,ij->i", decoded, decoded)
+        return cls(flat, codes, norms, matrix, scales, offsets)
+
+    @staticmethod
+    def _decode(codes: np.ndarray, scales, offsets) -> np.ndarray:
+        vectors = np.asarray(codes, dtype=np.float32)
+        if scales is None:
+            return vectors
+        return vectors * scales + offsets
+
+    def save(self, index_dir: str) -> None:
+        os.makedirs(index_dir, exist_ok=True)
+        for name in _ARRAYS:
+            array = getattr(self, name)
+            if array is not None:
+                np.save(os.path.join(index_dir, f"{name}.npy"), array)
+        with open(os.path.join(index_dir, _META_FILE), "w") as f:
+            json.dump({"rerank": self.rerank}, f)
+
+    @classmethod
+    def load(cls, index_dir: str, flat: FlatIndex, **search_params):
+        arrays = {}
+        for name in _ARRAYS:
+            path = os.path.join(index_dir, f"{name}.npy")
+            arrays[name] = np.load(path, mmap_mode="r") if os.path.exists(path) else None
+        with open(os.path.join(index_dir, _META_FILE), "r") as f:
+            params = json.load(f)
+        params.update(search_params)
+        return cls(flat, **arrays, **params)
+
+    def _score(self, queries: np.ndarray, bias: np.ndarray, start: int, end: int):
+        end = min(end, len(self))
+        scores = np.empty((len(queries), end - start), dtype=np.float32)
+        for offset in range(start, end, _DECODE_ROWS):
+            block = np.asarray(
+                self.codes[offset : min(offset + _DECODE_ROWS, end)], dtype=np.float32
+            )
+            scores[:, offset - start : offset - start + len(block)] = queries @ block.T
+        scores += bias[:, None]
+        if self.metric == "l2":
+            scores = 2 * scores - self.norms[start:end]
+        return scores
+
+    def search(self, queries: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+        queries = _prepare(self.flat, np.atleast_2d(queries))
+        projected = queries if self.projection is None else queries @ self.projection
+        # q.x = q.offsets + (q * scales).codes for int8 codes.
+        bias = np.zeros(len(queries), dtype=np.float32)
+        scaled = projected
+        if self.scales is not None:
+            bias = projected @ self.offsets
+            scaled = projected * self.scales
+
+        num_candidates = max(k, self.rerank)
+        best_scores = np.empty((len(queries), 0), dtype=np.float32)
+        best_rows = np.empty((len(queries), 0), dtype=np.int64)
+        for start in range(0, len(self), _BLOCK_ROWS):
+            scores = self._score(scaled, bias, start, start + _BLOCK_ROWS)
+            block_scores, block_rows = top_k(scores, num_candidates)
+            best_scores, order = top_k(
+                np.concatenate([best_scores, block_scores], axis=1), num_candidates
+            )
+            best_rows = np.take_along_axis(
+                np.concatenate([best_rows, block_rows + start], axis=1), order, axis=1
+            )
+        if not self.rerank:
+            return best_scores[:, :k], best_rows[:, :k]
+
+        all_scores = np.empty((len(queries), min(k, best_rows.shape[1])), np.float32)
+        all_rows = np.empty(all_scores.shape, dtype=np.int64)
+        for i, rows in enumerate(best_rows):
+            # Exact re-scoring on the original vectors (in sorted row order for
+            # sequential mmap reads).
+            by_row = np.argsort(rows)
+            exact = np.empty(len(rows), dtype=np.float32)
+            exact[by_row] = self._exact_scores(queries[i], rows[by_row])
+            scores, order = top_k(exact[None, :], k)
+            all_scores[i] = scores[0]
+            all_rows[i] = rows[order[0]]
+        return all_scores, all_rows
+
+    def _exact_scores(self, query: np.ndarray, rows: np.ndarray) -> np.ndarray:
+        vectors = _prepare(self.flat, self.flat.vectors[rows])
+        if self.metric == "l2":
+            return -np.einsum("ij,ij->i", vectors - query, vectors - query)
+        return vectors @ query
+
+    def document(self, row: int):
+        return self.flat.document(row)
+
+    @property
+    def embedding_model(self):
+        return self.flat.embedding_model
+
+    def as_retriever(self, search_kwargs: dict | None = None):
+        return VectorIndexRetriever.for_index(self, search_kwargs)
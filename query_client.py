@@ -0,0 +1,102 @@
+"""
+A thin client for `query_server.py`. It only imports the standard library and
+click, so it starts in milliseconds:
+
+    python query_client.py health
+    python query_client.py answer "刘备的字是什么？"
+    python query_client.py answer --json < questions.txt > answers.jsonl
+
+Queries are read one per line from stdin when none are given on the command line.
+The server URL comes from --url or QUERY_SERVER_URL.
+"""
+
+import json
+import sys
+import urllib.error
+import urllib.request
+
+import click
+
+_DEFAULT_URL = "http://127.0.0.1:8765"
+
+
+def _request(url: str, path: str, body: dict | None = None):
+    data = None if body is None else json.dumps(body, ensure_ascii=False).encode("utf-8")
+    request = urllib.request.Request(
+        url.rstrip("/") + path, data=data, headers={"Content-Type": "application/json"}
+    )
+    try:
+        return urllib.request.urlopen(request)
+    except urllib.error.HTTPError as e:
+        raise click.ClickException(e.read().decode("utf-8", errors="replace"))
+    except urllib.error.URLError as e:
+        raise click.ClickException(f"Cannot reach the query server at {url}: {e.reason}")
+
+
+def _get(url: str, path: str, body: dict | None = None) -> dict:
+    with _request(url, path, body) as response:
+        return json.load(response)
+
+
+def _queries(queries: tuple[str, ...]) -> list[str]:
+    if queries:
+        return list(queries)
+    return [line.strip() for line in sys.stdin if line.strip()]
+
+
+def _print_json(body: dict) -> None:
+    print(json.dumps(body, ensure_ascii=False), flush=True)
+
+
+@click.group()
+@click.option("--url", envvar="QUERY_SERVER_URL", default=_DEFAULT_URL, help="Server URL")
+@click.pass_context
+def cli(ctx, url: str) -> None:
+    ctx.obj = url
+
+
+@cli.command()
+@click.pass_obj
+def health(url: str) -> None:
+    _print_json(_get(url, "/health"))
+
+
+@cli.command()
+@click.pass_obj
+def metrics(url: str) -> None:
+    print(json.dumps(_get(url, "/metrics"), ensure_ascii=False, indent=2))
+
+
+@cli.command()
+@click.argument("queries", nargs=-1)
+@click.pass_obj
+def retrieve(url: str, queries: tuple[str, ...]) -> None:
+    """Print the retrieved documents of each query as a JSON line."""
+    for query in _queries(queries):
+        _print_json({"query": query, **_get(url, "/retrieve", {"query": query})})
+
+
+@cli.command()
+@click.argument("queries", nargs=-1)
+@click.option("--json", "as_json", is_flag=True, help="One JSON line per query, not streamed")
+@click.pass_obj
+def answer(url: str, queries: tuple[str, ...], as_json: bool) -> None:
+    """Answer each query, streaming tokens to the terminal as they are generated."""
+    for query in _queries(queries):
+        if as_json:
+            _print_json({"query": query, **_get(url, "/answer", {"query": query})})
+            continue
+        with _request(url, "/answer", {"query": query, "stream": True}) as response:
+            for line in response:
+                event = json.loads(line)
+                if "error" in event:
+                    raise click.ClickException(event["error"])
+                if event.get("done"):
+                    total = event["metrics"].get("total_s", 0)
+                    print(f"\n[{len(event['sources'])} sources, {total:.2f}s]", flush=True)
+                else:
+                    print(event["token"], end="", flush=True)
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,411 @@
+"""
+A resident query service for the Sanguo RAG pipeline.
+
+Startup imports LangChain, opens the vector store and builds the retriever and the
+prompt chain once; requests are then served concurrently over localhost HTTP:
+
+    GET  /health     liveness and configuration
+    GET  /metrics    request counts and per-stage latency percentiles
+    POST /retrieve   {"query": ...} -> retrieved documents
+    POST /answer     {"query": ..., "stream": false} -> answer and sources
+
+With "stream": true, /answer returns NDJSON lines of {"token": ...} as the model
+generates them, then a final {"done": true, "sources": ..., "metrics": ...}.
+Each response carries the request's `instrument` metrics plus `total_s`. The
+retriever is configured with the same options as the experiments (see
+`sanguo_exp.retrieval`), e.g. --backend flat --retrieval hybrid.
+
+With --semantic_cache, repeated and paraphrased queries are served from a
+`semantic_cache.SemanticCache`, which is dropped when the index files change;
+/metrics reports its hit rate and the time it saved.
+
+    python query_server.py --backend flat --port 8765
+    python query_client.py answer "刘备的字是什么？"
+"""
+
+import contextlib
+import json
+import threading
+import time
+from collections import Counter, deque
+from collections.abc import Iterator
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import click
+import numpy as np
+from langchain_ollama.llms import OllamaLLM
+
+import chroma_lib
+import context_packing
+import instrument
+from sanguo_exp import retrieval
+from semantic_cache import SemanticCache, path_fingerprint
+
+# Requests kept for the latency percentiles in /metrics.
+_RECENT_REQUESTS = 1000
+_PERCENTILES = (50, 95, 99)
+
+
+def _document(document) -> dict:
+    return {"id": document.id, "text": document.page_content, "metadata": document.metadata}
+
+
+def _source(document) -> dict:
+    return {key: document.metadata.get(key) for key in ("source", "slice", "chapter")}
+
+
+class QueryService:
+    """Retrieval and answering with everything loaded once, safe to call from threads."""
+
+    def __init__(
+        self,
+        retriever,
+        chain,
+        context_tokens: int = 0,
+        config: dict | None = None,
+        cache: SemanticCache | None = None,
+    ):
+        self.retriever = retriever
+        self.chain = chain
+        self.context_tokens = context_tokens
+        self.config = config or {}
+        self.cache = cache
+        self.started = time.time()
+        self._llm_metrics = instrument.LLMMetricsHandler()
+        self._lock = threading.Lock()
+        self._requests = Counter()
+        self._errors = Counter()
+        self._in_flight = 0
+        self._recent = deque(maxlen=_RECENT_REQUESTS)
+
+    def warm_up(self) -> None:
+        """Run one retrieval so lazily loaded indexes and connections are ready."""
+        self.retriever.invoke("三国")
+
+    @contextlib.contextmanager
+    def _track(self, endpoint: str) -> Iterator[dict]:
+        with self._lock:
+            self._in_flight += 1
+        start = time.perf_counter()
+        failed = False
+        try:
+            with instrument.measure() as metrics:
+                yield metrics
+        except Exception:
+            failed = True
+            raise
+        finally:
+            metrics["total_s"] = time.perf_counter() - start
+            with self._lock:
+                self._in_flight -= 1
+                self._requests[endpoint] += 1
+                if failed:
+                    self._errors[endpoint] += 1
+                else:
+                    self._recent.append((endpoint, dict(metrics)))
+
+    def _retrieve(self, query: str) -> list:
+        with instrument.retrieval():
+            return self.retriever.invoke(query)
+
+    def _cached_retrieve(self, query: str, answer: bool = False) -> tuple:
+        """The cache entry (None without a cache) and documents for `query`."""
+        if self.cache is None:
+            return None, self._retrieve(query)
+        entry = self.cache.lookup(query, answer=answer)
+        if entry is not None:
+            instrument.record("semantic_cache_hit", 1)
+            return entry, entry.documents
+        start = time.perf_counter()
+        docs = self._retrieve(query)
+        return self.cache.put(query, docs, time.perf_counter() - start), docs
+
+    def _inputs(self, query: str, docs: list) -> dict:
+        material = context_packing.pack(docs, self.context_tokens).text
+        return {"material": material, "question": query}
+
+    def retrieve(self, query: str) -> dict:
+        with self._track("retrieve") as metrics:
+            _, docs = self._cached_retrieve(query)
+        return {"documents": [_document(doc) for doc in docs], "metrics": metrics}
+
+    def answer(self, query: str) -> dict:
+        with self._track("answer") as metrics:
+            entry, docs = self._cached_retrieve(query, answer=True)
+            if entry is not None and entry.answer is not None:
+                answer = entry.answer
+            else:
+                start = time.perf_counter()
+                answer = self.chain.invoke(
+                    self._inputs(query, docs), config={"callbacks": [self._llm_metrics]}
+                )
+                if entry is not None:
+                    self.cache.add_answer(entry, answer, time.perf_counter() - start)
+        return {
+            "answer": answer,
+            "sources": [_source(doc) for doc in docs],
+            "metrics": metrics,
+        }
+
+    def stream_answer(self, query: str) -> Iterator[dict]:
+        """{"token": ...} dicts as they are generated, then a final "done" one."""
+        with self._track("answer") as metrics:
+            entry, docs = self._cached_retrieve(query, answer=True)
+            if entry is not None and entry.answer is not None:
+                yield {"token": entry.answer}
+            else:
+                start = time.perf_counter()
+                tokens = []
+                for token in self.chain.stream(
+                    self._inputs(query, docs), config={"callbacks": [self._llm_metrics]}
+                ):
+                    tokens.append(token)
+                    yield {"token": token}
+                if entry is not None:
+                    self.cache.add_answer(entry, "".join(tokens), time.perf_counter() - start)
+        yield {"done": True, "sources": [_source(doc) for doc in docs], "metrics": metrics}
+
+    def health(self) -> dict:
+        return {
+            "status": "ok",
+            "uptime_s": time.time() - self.started,
+            "config": self.config,
+        }
+
+    def metrics(self) -> dict:
+        with self._lock:
+            requests = dict(self._requests)
+            errors = dict(self._errors)
+            in_flight = self._in_flight
+            recent = list(self._recent)
+        stages = {}
+        for endpoint in sorted({endpoint for endpoint, _ in recent}):
+            values = {}
+            for name, value in (
+                item for e, metrics in recent if e == endpoint for item in metrics.items()
+            ):
+                values.setdefault(name, []).append(value)
+            stages[endpoint] = {
+                name: {
+                    "count": len(samples),
+                    "mean": float(np.mean(samples)),
+                    **{
+                        f"p{q}": float(np.percentile(samples, q))
+                        for q in _PERCENTILES
+                    },
+                }
+                for name, samples in sorted(values.items())
+            }
+        metrics = {
+            "requests": requests,
+            "errors": errors,
+            "in_flight": in_flight,
+            "stages": stages,
+        }
+        if self.cache is not None:
+            metrics["semantic_cache"] = self.cache.stats()
+        return metrics
+
+
+class QueryServer:
+    """Serves a `QueryService` over HTTP; `start()` runs it on a background thread."""
+
+    def __init__(self, service: QueryService, host: str = "127.0.0.1", port: int = 8765):
+        self.service = service
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "QueryServer":
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _handler(self):
+        service = self.service
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send_json(self, body: dict, status: int = 200) -> None:
+                data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                if self.path == "/health":
+                    self._send_json(service.health())
+                elif self.path == "/metrics":
+                    self._send_json(service.metrics())
+                else:
+                    self._send_json({"error": f"Unknown path {self.path}"}, 404)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                try:
+                    request = json.loads(self.rfile.read(length) or b"{}")
+                    query = request["query"]
+                except (json.JSONDecodeError, KeyError, TypeError):
+                    self._send_json({"error": 'Expected a JSON body with a "query"'}, 400)
+                    return
+                try:
+                    if self.path == "/retrieve":
+                        self._send_json(service.retrieve(query))
+                    elif self.path == "/answer" and request.get("stream"):
+                        self._stream(service.stream_answer(query))
+                    elif self.path == "/answer":
+                        self._send_json(service.answer(query))
+                    else:
+                        self._send_json({"error": f"Unknown path {self.path}"}, 404)
+                except Exception as e:
+                    self._send_json({"error": f"{type(e).__name__}: {e}"}, 500)
+
+            def _stream(self, events: Iterator[dict]) -> None:
+                # Pull the first event before committing to a 200 response, so
+                # retrieval errors still get a proper error status.
+                first = next(events)
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                try:
+                    self._write_chunk(first)
+                    for event in events:
+                        self._write_chunk(event)
+                except (BrokenPipeError, ConnectionResetError):
+                    events.close()
+                    return
+                except Exception as e:
+                    self._write_chunk({"error": f"{type(e).__name__}: {e}"})
+                self.wfile.write(b"0\r\n\r\n")
+
+            def _write_chunk(self, body: dict) -> None:
+                data = json.dumps(body, ensure_ascii=False).encode("utf-8") + b"\n"
+                self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+                self.wfile.flush()
+
+        return Handler
+
+
+def build_service(
+    k: int,
+    model: str,
+    context_tokens: int,
+    backend: str,
+    retrieval_mode: str,
+    lexical_index_dir: str,
+    flat_index_dir: str,
+    ann_index_dir: str,
+    nprobe: int | None,
+    quantized_index_dir: str,
+    rerank: int | None,
+    entity_index_dir: str | None,
+    entity_filter: bool,
+    semantic_cache: bool = False,
+    cache_threshold: float = 0.92,
+    cache_ttl: float = 3600.0,
+    cache_entries: int = 1024,
+) -> QueryService:
+    embedding_model = instrument.TimedEmbeddings(chroma_lib.embedding_model(model))
+    retriever = retrieval.build_retriever(
+        embedding_model,
+        k,
+        backend,
+        retrieval_mode,
+        lexical_index_dir,
+        flat_index_dir,
+        ann_index_dir,
+        nprobe,
+        quantized_index_dir,
+        rerank,
+        entity_index_dir,
+        entity_filter,
+    )
+    chain = retrieval.QA_PROMPT | OllamaLLM(model=model, temperature=0)
+    config = {
+        "backend": backend,
+        "retrieval": retrieval_mode,
+        "k": k,
+        "model": model,
+        "context_tokens": context_tokens,
+    }
+
+    cache = None
+    if semantic_cache:
+        index_paths = [entity_index_dir] if entity_index_dir else []
+        if retrieval_mode != "vector":
+            index_paths.append(lexical_index_dir)
+        if retrieval_mode != "lexical":
+            index_paths += {
+                "chroma": [chroma_lib.manifest_path("chroma_db/sanguo")],
+                "flat": [flat_index_dir],
+                "ivf": [ann_index_dir, flat_index_dir],
+                "quantized": [quantized_index_dir, flat_index_dir],
+            }[backend]
+        cache = SemanticCache(
+            embedding_model,
+            threshold=cache_threshold,
+            ttl_s=cache_ttl,
+            max_entries=cache_entries,
+            fingerprint=lambda: path_fingerprint(index_paths),
+        )
+        config["semantic_cache"] = {
+            "threshold": cache_threshold,
+            "ttl_s": cache_ttl,
+            "max_entries": cache_entries,
+        }
+    return QueryService(retriever, chain, context_tokens, config, cache)
+
+
+@click.command()
+@click.option("--host", default="127.0.0.1", help="Address to listen on")
+@click.option("--port", default=8765, help="Port to listen on")
+@click.option("--k", default=5, help="Documents retrieved per query")
+@click.option("--model", default="qwen2.5:7b", help="Ollama model for embeddings and answers")
+@click.option("--context_tokens", default=0, help="Token budget for retrieved text, 0 for none")
+@retrieval.retriever_options
+@click.option(
+    "--semantic_cache", is_flag=True, help="Serve repeated and paraphrased queries from memory"
+)
+@click.option(
+    "--cache_threshold",
+    default=0.92,
+    help="Query embedding cosine similarity for a semantic cache hit",
+)
+@click.option("--cache_ttl", default=3600.0, help="Seconds a semantic cache entry is kept")
+@click.option("--cache_entries", default=1024, help="Semantic cache size, least recently used evicted")
+def run(host: str, port: int, **options) -> None:
+    start = time.perf_counter()
+    service = build_service(**options)
+    service.warm_up()
+    server = QueryServer(service, host, port)
+    print(f"Query server ready on {server.url} after {time.perf_counter() - start:.1f}s")
+    try:
+        server.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,286 @@
+"""
+Answer and grade a growing random sample of the questions, and stop once the result
+is clear.
+
+Questions are taken in a stratified random order, so every prefix holds auto and
+manual questions in their overall proportions. After each batch the graded sample
+gives a Wilson interval for accuracy, by source and overall, and with a baseline a
+stratified paired bootstrap interval for the accuracy difference on the questions
+both have graded. Intervals use the finite population correction, so they shrink to
+the full run's exact numbers as the sample reaches the whole question set. The run
+stops when
+
+    with a baseline     the difference interval excludes 0 (better or worse), or
+                        is narrower than ±precision (no difference that large)
+    without a baseline  the accuracy interval is narrower than ±precision
+
+Every look at the data spends part of `alpha` (Bonferroni over the planned looks),
+so stopping at the first clear look keeps the overall error rate below `alpha`.
+"""
+
+import math
+import random
+from collections import defaultdict
+from statistics import NormalDist
+from typing import NamedTuple
+
+import click
+import numpy as np
+import pandas as pd
+
+from sanguo_exp import eval, runner
+from sanguo_exp.results_store import question_id
+
+_BOOTSTRAP_SAMPLES = 4000
+_OPTIONS = [
+    click.option(
+        "--adaptive",
+        is_flag=True,
+        help="Answer and grade a random sample, stopping once the result is clear",
+    ),
+    click.option(
+        "--baseline",
+        default=None,
+        help="Experiment whose graded results to compare against, with --adaptive",
+    ),
+    click.option(
+        "--precision",
+        default=0.05,
+        help="Stop when the accuracy (or difference) interval is within ±this",
+    ),
+    click.option("--alpha", default=0.05, help="Error rate of the stopping decision"),
+]
+
+
+def adaptive_options(function):
+    """Add the options taken by `run_adaptive` to a click command."""
+    for option in reversed(_OPTIONS):
+        function = option(function)
+    return function
+
+
+class Estimate(NamedTuple):
+    value: float
+    low: float
+    high: float
+
+    @property
+    def half_width(self) -> float:
+        return (self.high - self.low) / 2
+
+
+def stratified_order(questions: list[dict], seed: int = 0) -> list[int]:
+    """
+    Question indices in random order, with each source spread evenly: the i-th of
+    n questions of a source lands at a random point of the i-th n-th of the order.
+    """
+    rng = random.Random(seed)
+    by_source = defaultdict(list)
+    for i, question in enumerate(questions):
+        by_source[question["source"]].append(i)
+    keyed = []
+    for indices in by_source.values():
+        rng.shuffle(indices)
+        keyed += [((rank + rng.random()) / len(indices), i) for rank, i in enumerate(indices)]
+    return [i for _, i in sorted(keyed)]
+
+
+def wilson_interval(successes: int, n: int, population: int, z: float) -> Estimate:
+    """Wilson score interval for a proportion sampled without replacement."""
+    if n == 0:
+        return Estimate(math.nan, 0.0, 1.0)
+    p = successes / n
+    if n >= population:
+        return Estimate(p, p, p)
+    # The finite population correction, as an effective sample size.
+    n = n * (population - 1) / (population - n)
+    denominator = 1 + z * z / n
+    center = (p + z * z / (2 * n)) / denominator
+    half_width = z * math.sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / denominator
+    return Estimate(p, max(0.0, center - half_width), min(1.0, center + half_width))
+
+
+def accuracy_table(graded: list[dict], populations: dict[str, int], z: float) -> pd.DataFrame:
+    """Sampled and total questions, accuracy and its interval, by source and overall."""
+    passes = pd.DataFrame(
+        {"source": [r["source"] for r in graded], "pass": [bool(r["pass"]) for r in graded]}
+    )
+    counts = passes.groupby("source")["pass"].agg(["size", "sum"])
+    rows = {}
+    for source, population in [*populations.items(), ("all", sum(populations.values()))]:
+        n, correct = (
+            (len(passes), int(passes["pass"].sum()))
+            if source == "all"
+            else (int(counts["size"].get(source, 0)), int(counts["sum"].get(source, 0)))
+        )
+        estimate = wilson_interval(correct, n, population, z)
+        rows[source] = {
+            "questions": n,
+            "of": population,
+            "accuracy": estimate.value,
+            "low": estimate.low,
+            "high": estimate.high,
+        }
+    return pd.DataFrame.from_dict(rows, orient="index")
+
+
+def paired_difference(
+    graded: list[dict],
+    baseline: dict[str, bool],
+    populations: dict[str, int],
+    confidence: float,
+    rng: np.random.Generator,
+) -> Estimate | None:
+    """
+    Accuracy minus the baseline's over the questions in `populations` (questions
+    the baseline graded, by source), with a stratified bootstrap interval. Each
+    source's per-question differences (-1, 0 or 1) are resampled from their counts
+    plus the Agresti-Min half count per cell, so a small sample without any
+    disagreement still gets an honest interval. None until every source is sampled.
+    """
+    diffs = defaultdict(list)
+    for result in graded:
+        base = baseline.get(question_id(result))
+        if base is not None:
+            diffs[result["source"]].append(int(bool(result["pass"])) - int(base))
+    if any(not diffs[source] for source in populations):
+        return None
+
+    total = sum(populations.values())
+    value = 0.0
+    samples = np.zeros(_BOOTSTRAP_SAMPLES)
+    for source, population in populations.items():
+        d = np.array(diffs[source])
+        n = len(d)
+        counts = np.array([(d == -1).sum(), (d == 0).sum(), (d == 1).sum()], dtype=float)
+        mean = (counts[2] - counts[0]) / n
+        smoothed = (counts + [0.5, 1.0, 0.5]) / (n + 2)
+        draws = rng.multinomial(n, smoothed, size=_BOOTSTRAP_SAMPLES)
+        boot = (draws[:, 2] - draws[:, 0]) / n
+        fpc = math.sqrt((population - n) / (population - 1)) if population > 1 else 0.0
+        weight = population / total
+        value += weight * mean
+        samples += weight * (mean + fpc * (boot - boot.mean()))
+    low, high = np.quantile(samples, [(1 - confidence) / 2, (1 + confidence) / 2])
+    return Estimate(value, float(low), float(high))
+
+
+def _decision(accuracy: Estimate, difference: Estimate | None, baseline, precision) -> str | None:
+    if baseline is None:
+        if accuracy.half_width <= precision:
+            return f"accuracy known within ±{precision:.1%}"
+        return None
+    if difference is None:
+        return None
+    if difference.low > 0:
+        return f"better than {baseline}"
+    if difference.high < 0:
+        return f"worse than {baseline}"
+    if difference.half_width <= precision:
+        return f"within ±{precision:.1%} of {baseline}"
+    return None
+
+
+def run_adaptive(
+    questions: list[dict],
+    answer_fn,
+    experiment_name: str,
+    baseline: str | None = None,
+    precision: float = 0.05,
+    alpha: float = 0.05,
+    batch_size: int = 20,
+    min_questions: int = 40,
+    concurrency: int = 4,
+    restart: bool = False,
+    pre_grade: bool = True,
+    seed: int = 0,
+) -> list[dict]:
+    """
+    Answer (as `runner.run_questions` does) and grade questions in stratified
+    random order, `batch_size` at a time after the first `min_questions`, until the
+    result is clear. Saves the answered and graded samples as `experiment_name`
+    and `experiment_name`_eval, and returns the graded sample.
+
+    `baseline` is an experiment name as passed to display.py; its graded results
+    are compared question by question.
+    """
+    order = stratified_order(questions, seed)
+    populations = defaultdict(int)
+    for question in questions:
+        populations[question["source"]] += 1
+
+    baseline_passes = None
+    paired_populations = None
+    if baseline:
+        baseline_passes = {
+            question_id(r): bool(r["pass"])
+            for r in eval.load_results(baseline + "_eval")
+            if r.get("pass") is not None
+        }
+        paired_populations = defaultdict(int)
+        for question in questions:
+            if question_id(question) in baseline_passes:
+                paired_populations[question["source"]] += 1
+        if not paired_populations:
+            raise click.ClickException(f"{baseline} graded none of these questions")
+
+    looks = [*range(min(min_questions, len(order)), len(order), batch_size), len(order)]
+    confidence = 1 - alpha / len(looks)
+    z = NormalDist().inv_cdf(1 - alpha / (2 * len(looks)))
+    rng = np.random.default_rng(seed)
+    llm_model = eval.eval_model()
+
+    answered, graded = [], []
+    decision = None
+    start = 0
+    for end in dict.fromkeys(looks):
+        batch = [questions[i] for i in order[start:end]]
+        results = runner.answer_questions(
+            batch, answer_fn, experiment_name, concurrency, restart=restart and start == 0
+        )
+        answered += results
+        graded += eval.run_eval_chain(
+            results, llm_model, concurrency=concurrency, pre_grade=pre_grade
+        )
+        start = end
+
+        table = accuracy_table(graded, populations, z)
+        overall = Estimate(*table.loc["all", ["accuracy", "low", "high"]])
+        difference = None
+        line = (
+            f"{end}/{len(order)} questions: accuracy {overall.value:.1%} "
+            f"[{overall.low:.1%}, {overall.high:.1%}]"
+        )
+        if baseline_passes is not None:
+            difference = paired_difference(
+                graded, baseline_passes, paired_populations, confidence, rng
+            )
+            if difference is not None:
+                line += (
+                    f", vs {baseline} {difference.value:+.1%} "
+                    f"[{difference.low:+.1%}, {difference.high:+.1%}]"
+                )
+        print(line)
+        if end < len(order):
+            decision = _decision(overall, difference, baseline, precision)
+            if decision:
+                break
+
+    print(
+        f"Stopped after {len(graded)} of {len(order)} questions "
+        f"({1 - len(graded) / len(order):.0%} skipped): {decision or 'all questions run'}"
+    )
+    print(f"Accuracy with {confidence:.2%} intervals:")
+    print(
+        table.to_string(
+            float_format=lambda x: f"{x:.2%}", formatters={"questions": str, "of": str}
+        )
+    )
+
+    # Keep the question set's order, as a full run would.
+    positions = {question_id(q): i for i, q in enumerate(questions)}
+    answered.sort(key=lambda r: positions[question_id(r)])
+    graded.sort(key=lambda r: positions[question_id(r)])
+    eval.save_results(answered, experiment_name)
+    eval.save_results(graded, experiment_name + "_eval")
+    return graded
@@ -1,5 +1,4 @@
 import click
-from langchain_ollama import OllamaEmbeddings
 
 import chroma_lib
 
@@ -8,15 +7,40 @@ import chroma_lib
 @click.option("--db_dir", default="chroma_db/sanguo", help="Directory to save the Chroma database")
 @click.option("--collection_name", default="sanguo", help="Name of the Chroma collection")
 @click.option("--embedding_model", default="qwen2.5:7b", help="Embedding model to use")
-def build_db(db_dir: str, collection_name: str, embedding_model: str) -> None:
-    embedding_model = OllamaEmbeddings(model=embedding_model)
+@click.option(
+    "--embedding_cache",
+    default="cache/embeddings.sqlite3",
+    help="Embedding cache file. Pass an empty string to disable the cache.",
+)
+@click.option(
+    "--incremental",
+    is_flag=True,
+    help="Update the existing collection in place instead of rebuilding it",
+)
+@click.option("--batch_size", default=64, help="Number of chunks per embedding request")
+@click.option("--workers", default=4, help="Number of concurrent embedding requests")
+def build_db(
+    db_dir: str,
+    collection_name: str,
+    embedding_model: str,
+    embedding_cache: str,
+    incremental: bool,
+    batch_size: int,
+    workers: int,
+) -> None:
+    embedding_model = chroma_lib.embedding_model(
+        embedding_model, cache_path=embedding_cache or None
+    )
     chroma_lib.build_db_with_chrunking(
         doc_paths=["data/sanguo.txt"],
         db_dir=db_dir,
         collection_name=collection_name,
         embedding_model=embedding_model,
+        incremental=incremental,
+        batch_size=batch_size,
+        max_workers=workers,
     )
 
 
 if __name__ == "__main__":
-    build_db()
\ No newline at end of file
+    build_db()
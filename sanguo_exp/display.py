@@ -4,19 +4,37 @@ from sanguo_exp import eval
 
 
 @click.command()
-@click.option("--experiment_name", required=True, help="Experiment name")
-def show_results(experiment_name: str) -> None:
-    results = eval.load_results(experiment_name + "_eval")
-    eval.analyze_results(results)
+@click.option(
+    "--experiment_name",
+    required=True,
+    multiple=True,
+    help="Experiment name; repeat to compare experiments against the first",
+)
+@click.option("--diff", is_flag=True, help="List the questions that flipped")
+def show_results(experiment_name: tuple[str, ...], diff: bool) -> None:
+    experiments = [name + "_eval" for name in experiment_name]
+    if len(experiments) == 1:
+        results = eval.load_results(experiments[0])
+        eval.analyze_results(results)
 
-    # for result in results:
-    #     print(f"Query: {result['query']}")
-    #     print(f"Answer: {result['answer']}")
-    #     print(f"Prediction: {result['predict']}")
-    #     print(f"Eval: {result['eval']}")
-    #     print(f"Pass: {result['pass']}")
-    #     print("-" * 20)
+        # for result in results:
+        #     print(f"Query: {result['query']}")
+        #     print(f"Answer: {result['answer']}")
+        #     print(f"Prediction: {result['predict']}")
+        #     print(f"Eval: {result['eval']}")
+        #     print(f"Pass: {result['pass']}")
+        #     print("-" * 20)
+        return
+
+    # Make sure every experiment is in the results store.
+    for experiment in experiments:
+        eval.load_results(experiment)
+    eval.print_comparison(experiments)
+    if diff:
+        for experiment in experiments[1:]:
+            print(f"\n{experiments[0]} -> {experiment}")
+            eval.print_diff(experiments[0], experiment)
 
 
 if __name__ == "__main__":
-    show_results()
\ No newline at end of file
+    show_results()
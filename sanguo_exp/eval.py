@@ -1,12 +1,17 @@
 import copy
 import os
 import json
+from concurrent.futures import ThreadPoolExecutor
 
 import pandas as pd
+from tqdm import tqdm
 from langchain.evaluation.qa import QAEvalChain
 from langchain.output_parsers.regex import RegexParser
 from langchain_ollama.llms import OllamaLLM
 
+from sanguo_exp import pre_grader
+from sanguo_exp.results_store import ResultsStore, pass_flips, question_id
+
 
 def load_questions():
     auto_questions = _load_auto_questions()
@@ -36,43 +41,83 @@ def _load_manual_questions():
 
 
 def save_results(results, experiment_name) -> None:
+    """Append a run to the results store, and write output/{experiment_name}.json."""
     os.makedirs("output", exist_ok=True)
     output_path = os.path.join("output", f"{experiment_name}.json")
     with open(output_path, "w") as f:
         json.dump(results, f, ensure_ascii=False, indent=4)
-
-
-def load_results(experiment_name) -> None:
-    output_path = os.path.join("output", f"{experiment_name}.json")
-    with open(output_path, "r") as f:
-        results = json.load(f)
-    return results
+    ResultsStore().append_run(experiment_name, results)
+
+
+def load_results(experiment_name) -> list[dict]:
+    """
+    The latest stored run of an experiment. Experiments saved before the store
+    existed are imported from their JSON file on first load, and so is a JSON file
+    written (e.g. edited by hand) after the latest stored run.
+    """
+    store = ResultsStore()
+    path = os.path.join("output", f"{experiment_name}.json")
+    run_id = store.latest_run(experiment_name)
+    if run_id is None:
+        store.import_json(experiment_name, path)
+    elif os.path.exists(path) and os.path.getmtime(path) > store.run_created(run_id):
+        print(f"{path} is newer than the stored run of {experiment_name}; importing it")
+        store.import_json(experiment_name, path)
+    return store.load(experiment_name)
 
 
 def eval_model():
     return OllamaLLM(model="qwen2.5:7b", temperature=0)
 
 
-def run_eval_chain(questions, llm_model):
+def _set_grade(result, grade: str, grader: str) -> None:
+    result["eval"] = grade
+    result["grader"] = grader
+    if "INCORRECT" in grade:
+        result["pass"] = False
+    elif "CORRECT" in grade:
+        result["pass"] = True
+    else:
+        raise ValueError(f"Invalid grade: {grade}")
+
+
+def run_eval_chain(
+    questions, llm_model, concurrency: int = 4, batch_size: int = 8, pre_grade=True
+):
+    """
+    Grade predictions in two tiers. The deterministic pre-grader settles obviously
+    correct short answers ("rule"), and the rest go to `QAEvalChain` in concurrent
+    batches ("llm"). Each result records the tier that decided it in "grader".
+    """
     results = copy.deepcopy(questions)
 
-    eval_chain = QAEvalChain.from_llm(llm=llm_model)
-    eval_results = eval_chain.evaluate(
-        results,
-        results,
-        question_key="query",
-        prediction_key="predict",
-        answer_key="answer",
-    )
-    # TODO: Optimize prompt and bring back the regex parser
-    for i, result in enumerate(results):
-        result["eval"] = eval_results[i]["results"]
-        if "INCORRECT" in result["eval"]:
-            result["pass"] = False
-        elif "CORRECT" in result["eval"]:
-            result["pass"] = True
+    settled = pre_grader.pre_grade(results) if pre_grade else [False] * len(results)
+    pending = []
+    for result, is_correct in zip(results, settled):
+        if is_correct:
+            _set_grade(result, "CORRECT", "rule")
         else:
-            raise ValueError(f"Invalid grade: {result['eval']}")
+            pending.append(result)
+
+    eval_chain = QAEvalChain.from_llm(llm=llm_model)
+
+    def evaluate(batch):
+        return eval_chain.evaluate(
+            batch,
+            batch,
+            question_key="query",
+            prediction_key="predict",
+            answer_key="answer",
+        )
+
+    batches = [pending[i : i + batch_size] for i in range(0, len(pending), batch_size)]
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        # TODO: Optimize prompt and bring back the regex parser
+        for batch, eval_results in zip(
+            batches, tqdm(executor.map(evaluate, batches), total=len(batches))
+        ):
+            for result, eval_result in zip(batch, eval_results):
+                _set_grade(result, eval_result["results"], "llm")
     return results
 
 
@@ -104,36 +149,82 @@ def analyze_results(results):
         f"Manual questions: {manual_count}, Correct: {manual_correct}, Accuracy: {manual_correct / manual_count:.2%}"
     )
 
+    graders = [result["grader"] for result in results if "grader" in result]
+    if graders:
+        rule_count = graders.count("rule")
+        print(
+            f"Graded by rule: {rule_count}, by LLM: {graders.count('llm')}, "
+            f"LLM calls saved: {rule_count} ({rule_count / len(graders):.2%})"
+        )
+
+    metrics = [
+        {"source": result["source"], **result["metrics"]}
+        for result in results
+        if result.get("metrics")
+    ]
+    if metrics:
+        print_metrics(pd.DataFrame(metrics))
+
+
+_PERCENTILES = {"p50": 0.5, "p95": 0.95, "p99": 0.99}
+
+
+def print_metrics(metrics: pd.DataFrame) -> None:
+    """Per-stage latency and token percentiles, overall and by question source."""
+    for source, group in [("all", metrics), *metrics.groupby("source")]:
+        stages = group.drop(columns="source")
+        table = pd.DataFrame(
+            {name: stages.quantile(q) for name, q in _PERCENTILES.items()}
+        )
+        table["mean"] = stages.mean()
+        print(f"Stage metrics ({source}, {len(group)} questions):")
+        print(table.round(3).to_string())
+
 
 def diff_results(results_base, results_new):
-    _ERROR_MSG = "Results lists must be from the same questions in the same order"
-    assert len(results_base) == len(results_new), _ERROR_MSG
-
-    new_passing = []
-    new_failing = []
-    for a, b in zip(results_base, results_new):
-        assert a["query"] == b["query"], _ERROR_MSG
-        if a["pass"] != b["pass"]:
-            if b["pass"]:
-                new_passing.append((a, b))
-            else:
-                new_failing.append((a, b))
-    return new_passing, new_failing
-
-
-def print_diff(new_passing, new_failing):
+    """
+    (new passing, new failing) pairs of (base, new) results, matched by question ID
+    so the lists may differ in order and coverage. A repeated question is matched
+    by its last result, as in `ResultsStore.compare`.
+    """
+
+    def frame(results):
+        return pd.DataFrame(
+            {
+                "question_id": [question_id(r) for r in results],
+                "pass": [r["pass"] for r in results],
+                "position": range(len(results)),
+            }
+        ).drop_duplicates("question_id", keep="last")
+
+    flipped = pass_flips(frame(results_base), frame(results_new))
+    pairs = [
+        (results_base[a], results_new[b])
+        for a, b in zip(flipped["position_base"], flipped["position_new"])
+    ]
+    return [p for p in pairs if p[1]["pass"]], [p for p in pairs if not p[1]["pass"]]
+
+
+def print_comparison(experiments: list[str]) -> None:
+    """Accuracy by source and pass/fail flips of experiments against the first."""
+    comparison = ResultsStore().compare(experiments)
+    print("Accuracy (questions graded in every experiment):")
+    print(comparison["accuracy"].to_string(float_format=lambda x: f"{x:.2%}"))
+    print(f"Accuracy delta against {experiments[0]}:")
+    print(comparison["delta"].to_string(float_format=lambda x: f"{x:+.2%}"))
+    print(comparison["flips"].to_string())
+
+
+def print_diff(base_experiment: str, new_experiment: str) -> None:
+    flipped = ResultsStore().flips(base_experiment, new_experiment)
+    new_passing = flipped[flipped["pass_new"]]
+    new_failing = flipped[~flipped["pass_new"]]
     print(f"New passing: {len(new_passing)}")
     print(f"New failing: {len(new_failing)}")
-    print("=================== New failing ===============")
-    for a, b in new_failing:
-        print(f"Query: {a['query']}")
-        print(f"Old: {a['eval']}, New: {b['eval']}")
-        print(f"Old: {a['predict']}, New: {b['predict']}")
-        print()
-
-    print("=================== New passing ===============")
-    for a, b in new_passing:
-        print(f"Query: {a['query']}")
-        print(f"Old: {a['eval']}, New: {b['eval']}")
-        print(f"Old: {a['predict']}, New: {b['predict']}")
-        print()
+    for title, rows in [("New failing", new_failing), ("New passing", new_passing)]:
+        print(f"=================== {title} ===============")
+        for row in rows.itertuples():
+            print(f"Query: {row.query_base}")
+            print(f"Old: {row.eval_base}, New: {row.eval_new}")
+            print(f"Old: {row.predict_base}, New: {row.predict_new}")
+            print()
@@ -1,18 +1,58 @@
 import click
 from langchain_ollama.llms import OllamaLLM
-from sanguo_exp import eval
+import llm_cache
+from sanguo_exp import adaptive_eval, eval, runner
 
 @click.command()
 @click.option("--experiment_name", default="baseline", help="Experiment name")
 @click.option("--model", default="qwen2.5:7b", help="Model name")
 @click.option("--temperature", default=0, help="Temperature for the model")
-def run_baseline(experiment_name: str, model: str, temperature: float) -> None:
+@click.option("--concurrency", default=4, help="Number of questions answered in parallel")
+@click.option("--restart", is_flag=True, help="Ignore results from a previous run")
+@adaptive_eval.adaptive_options
+@click.option(
+    "--llm_cache/--no_llm_cache",
+    "use_llm_cache",
+    default=True,
+    help="Reuse LLM responses cached from earlier runs with identical prompts",
+)
+def run_baseline(
+    experiment_name: str,
+    model: str,
+    temperature: float,
+    concurrency: int,
+    restart: bool,
+    adaptive: bool,
+    baseline: str | None,
+    precision: float,
+    alpha: float,
+    use_llm_cache: bool,
+) -> None:
+    if use_llm_cache:
+        llm_cache.enable(experiment_name)
     model = OllamaLLM(model=model, temperature=temperature)
     questions = eval.load_questions()
-    for q in questions:
-        q["predict"] = model.invoke(q["query"])
-    eval.save_results(questions, experiment_name)
+
+    def answer(question):
+        return {"predict": model.invoke(question["query"])}
+
+    if adaptive:
+        adaptive_eval.run_adaptive(
+            questions,
+            answer,
+            experiment_name,
+            baseline=baseline,
+            precision=precision,
+            alpha=alpha,
+            concurrency=concurrency,
+            restart=restart,
+        )
+    else:
+        runner.run_questions(
+            questions, answer, experiment_name, concurrency=concurrency, restart=restart
+        )
+    llm_cache.print_stats()
     print(f"Results saved to output/{experiment_name}.json")
 
 if __name__ == "__main__":
-    run_baseline()
\ No newline at end of file
+    run_baseline()
@@ -1,43 +1,176 @@
+import time
+
 import click
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_ollama import OllamaEmbeddings
 from langchain_ollama.llms import OllamaLLM
-from tqdm import tqdm
 
-from sanguo_exp import eval
+from kg_exp.graph_index import GraphIndex
+from sanguo_exp import adaptive_eval, eval, retrieval, runner
 import chroma_lib
+import context_packing
+import instrument
+import llm_cache
+from semantic_cache import SemanticCache
 
 
 @click.command()
-def run():
-    embedding_model = OllamaEmbeddings(model="qwen2.5:7b")
+@click.option("--experiment_name", default="qwen25_rag", help="Experiment name")
+@click.option("--concurrency", default=4, help="Number of questions answered in parallel")
+@click.option("--restart", is_flag=True, help="Ignore results from a previous run")
+@adaptive_eval.adaptive_options
+@retrieval.retriever_options
+@click.option(
+    "--graph_index_dir",
+    default=None,
+    help="Add knowledge graph facts about the question's entities from this index",
+)
+@click.option(
+    "--graph_hops",
+    default=1,
+    type=click.IntRange(min=0),
+    help="Facts up to this many hops from the entities, 0 for none",
+)
+@click.option("--graph_facts", default=20, help="Maximum number of graph facts per question")
+@click.option(
+    "--context_tokens",
+    default=0,
+    help="Token budget for the retrieved text after merging overlapping chunks, 0 for none",
+)
+@click.option(
+    "--semantic_cache_threshold",
+    default=0.0,
+    help="Reuse the answer of an earlier question at least this similar (query "
+    "embedding cosine), 0 for off",
+)
+@click.option(
+    "--llm_cache/--no_llm_cache",
+    "use_llm_cache",
+    default=True,
+    help="Reuse LLM responses cached from earlier runs with identical prompts",
+)
+def run(
+    experiment_name: str,
+    concurrency: int,
+    restart: bool,
+    adaptive: bool,
+    baseline: str | None,
+    precision: float,
+    alpha: float,
+    backend: str,
+    retrieval_mode: str,
+    lexical_index_dir: str,
+    flat_index_dir: str,
+    ann_index_dir: str,
+    nprobe: int | None,
+    quantized_index_dir: str,
+    rerank: int | None,
+    entity_index_dir: str | None,
+    entity_filter: bool,
+    graph_index_dir: str | None,
+    graph_hops: int,
+    graph_facts: int,
+    context_tokens: int,
+    semantic_cache_threshold: float,
+    use_llm_cache: bool,
+):
+    if use_llm_cache:
+        llm_cache.enable(experiment_name)
+    embedding_model = instrument.TimedEmbeddings(chroma_lib.embedding_model("qwen2.5:7b"))
     llm_model = OllamaLLM(model="qwen2.5:7b", temperature=0)
     questions = eval.load_questions()
 
-    qa_prompt = ChatPromptTemplate.from_messages(
-        [
-            ("system", "你是一名三国演义的专家"),
-            (
-                "human",
-                "阅读下面的内容 {material}, 回答问题。回答要简短。\n问题: {question}",
-            ),
-        ]
+    chain = retrieval.QA_PROMPT | llm_model
+    retriver = retrieval.build_retriever(
+        embedding_model,
+        5,
+        backend,
+        retrieval_mode,
+        lexical_index_dir,
+        flat_index_dir,
+        ann_index_dir,
+        nprobe,
+        quantized_index_dir,
+        rerank,
+        entity_index_dir,
+        entity_filter,
     )
-    chain = qa_prompt | llm_model
-    retriver = chroma_lib.get_vector_store(
-        "chroma_db/sanguo", "sanguo", embedding_model
-    ).as_retriever(search_kwargs={"k": 5})
-    for question in tqdm(questions):
-        docs = retriver.invoke(question["query"])
-        question["predict"] = chain.invoke(
-            {
-                "material": "\n\n".join([doc.page_content for doc in docs]),
-                "question": question["query"],
-            }
+
+    # In-process indexes embed and search the whole question set in one batch; the
+    # batch timings are split evenly across questions.
+    retrieved = {}
+    batch_metrics = {}
+    if retrieval.batched(backend, retrieval_mode):
+        queries = [question["query"] for question in questions]
+        with instrument.measure() as metrics, instrument.retrieval():
+            retrieved = dict(zip(queries, retriver.batch(queries)))
+        batch_metrics = {name: value / len(queries) for name, value in metrics.items()}
+
+    graph = GraphIndex.load(graph_index_dir) if graph_index_dir and graph_hops else None
+
+    def material(question, docs) -> str:
+        text = context_packing.pack(docs, context_tokens).text
+        if graph is None:
+            return text
+        with instrument.stage("graph_s"):
+            entities = graph.find_entities(question["query"])
+            facts = graph.facts(graph.expand(entities, graph_hops - 1), graph_facts)
+        if not facts:
+            return text
+        return text + "\n\n已知关系:\n" + "\n".join(facts)
+
+    llm_metrics = instrument.LLMMetricsHandler()
+    cache = None
+    if semantic_cache_threshold:
+        cache = SemanticCache(
+            embedding_model, threshold=semantic_cache_threshold, max_entries=len(questions)
         )
 
-    eval.save_results(questions, "qwen25_rag")
-    print("Results saved to output/qwen25_rag.json")
+    def answer(question):
+        with instrument.measure() as metrics:
+            metrics.update(batch_metrics)
+            if cache is not None:
+                entry = cache.lookup(question["query"], answer=True)
+                if entry is not None and entry.answer is not None:
+                    instrument.record("semantic_cache_hit", 1)
+                    return {"predict": entry.answer, "metrics": metrics}
+            docs = retrieved.get(question["query"])
+            if docs is None:
+                with instrument.retrieval():
+                    docs = retriver.invoke(question["query"])
+            start = time.perf_counter()
+            predict = chain.invoke(
+                {
+                    "material": material(question, docs),
+                    "question": question["query"],
+                },
+                config={"callbacks": [llm_metrics]},
+            )
+            if cache is not None:
+                retrieval_s = metrics.get("query_embedding_s", 0) + metrics.get(
+                    "vector_search_s", 0
+                )
+                entry = cache.put(question["query"], docs, retrieval_s)
+                cache.add_answer(entry, predict, time.perf_counter() - start)
+        return {"predict": predict, "metrics": metrics}
+
+    if adaptive:
+        adaptive_eval.run_adaptive(
+            questions,
+            answer,
+            experiment_name,
+            baseline=baseline,
+            precision=precision,
+            alpha=alpha,
+            concurrency=concurrency,
+            restart=restart,
+        )
+    else:
+        runner.run_questions(
+            questions, answer, experiment_name, concurrency=concurrency, restart=restart
+        )
+    llm_cache.print_stats()
+    if cache is not None:
+        cache.print_stats()
+    print(f"Results saved to output/{experiment_name}.json")
 
 
 if __name__ == "__main__":
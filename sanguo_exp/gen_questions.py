@@ -1,53 +1,31 @@
 import json
 import random
 import os
+import time
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
 
 import click
+from tqdm import tqdm
 
 from langchain.output_parsers.regex import RegexParser
-from langchain_core.documents import Document
 from langchain_core.prompts import PromptTemplate
 from langchain_ollama.llms import OllamaLLM
-from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+import chunking
+import llm_cache
+from jsonl import truncate_partial_line
+from minhash import NearDuplicateIndex
 
 
 _QA_OUTPUT_PARSER = RegexParser(
     regex=r"QUESTION: (.*?)\n+ANSWER: (.*)", output_keys=["query", "answer"]
 )
 
-
-@click.command()
-@click.option("--model", default="qwen2.5:7b", help="Model name")
-@click.option("--num", default=10, help="Number of questions to generate")
-@click.option(
-    "--output_file",
-    default="output/sanguo_auto_questions.json",
-    help="Output file path",
-)
-def generate(model: str, num: int, output_file: str) -> None:
-    """
-    Generate questions using the specified model.
-    """
-    llm_model = OllamaLLM(model=model)
-
-    with open("data/sanguo.txt", "r") as f:
-        content = f.read()
-
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=1000, chunk_overlap=200, separators=["\n\n", "\n", " ", "。", ""]
-    )
-    texts = text_splitter.split_text(content)
-
-    docs = [
-        Document(page_content=text, metadata={"source": f"chunk-{i}"})
-        for i, text in enumerate(texts)
-    ]
-    random.shuffle(docs)
-
-    # 默认的Question Generation Chain 使用英文提示词，会造成的问答是英文的。
-    # 我们从新用中文实现这个chain。
-    template = PromptTemplate.from_template(
-        """\
+# 默认的Question Generation Chain 使用英文提示词，会造成的问答是英文的。
+# 我们从新用中文实现这个chain。
+_QA_PROMPT = PromptTemplate.from_template(
+    """\
 你是一位历史老师，下面是《三国演义》的内容，请根据内容生成1个问题，请用中文回答。
 例子:
 <Begin Document>
@@ -64,27 +42,189 @@ ANSWER: 答案内容
 {doc}
 <End Document>                                 
 """
-    )
-    gen_qa_chain = template | llm_model
+)
 
-    questions = []
-    for doc in docs:
-        if len(questions) >= num:
-            break
 
-        result = gen_qa_chain.invoke({"doc": doc.page_content})
+def _load_checkpoint(path: str) -> list[dict]:
+    if not os.path.exists(path):
+        return []
+    questions = []
+    with open(path, "r") as f:
+        for line in f:
+            # A crash can leave a truncated last line behind.
+            try:
+                questions.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+    return questions
+
+
+def _generate_one(
+    chains: list, chunk_index: int, content: str, pass_index: int
+) -> tuple[dict | None, int]:
+    """The parsed question for a chunk and the number of attempts it took."""
+    for attempt, chain in enumerate(chains):
+        result = chain.invoke({"doc": content})
         try:
             parsed = _QA_OUTPUT_PARSER.parse(result)
-            parsed["content"] = doc.page_content
-            parsed["metadata"] = doc.metadata
-            questions.append(parsed)
         except ValueError:
-            print(f"Failed to parse result: {result}")
             continue
+        parsed["content"] = content
+        parsed["metadata"] = {"source": f"chunk-{chunk_index}", "pass": pass_index}
+        return parsed, attempt + 1
+    return None, len(chains)
+
 
+@click.command()
+@click.option("--model", default="qwen2.5:7b", help="Model name")
+@click.option(
+    "--num",
+    default=10,
+    help="Number of questions to generate, at most one per chunk and pass",
+)
+@click.option(
+    "--output_file",
+    default="output/sanguo_auto_questions.json",
+    help="Output file path",
+)
+@click.option("--concurrency", default=4, help="Generation requests in flight")
+@click.option("--max_retries", default=2, help="Extra attempts for unparseable outputs")
+@click.option("--seed", default=0, help="Seed for chunk sampling and generation")
+@click.option(
+    "--passes",
+    default=10,
+    help="Maximum passes over the chunks, each with new generation seeds",
+)
+@click.option(
+    "--dedupe_threshold",
+    default=0.6,
+    help="Character-bigram Jaccard similarity above which questions are duplicates",
+)
+@click.option("--restart", is_flag=True, help="Ignore questions from a previous run")
+@click.option(
+    "--llm_cache/--no_llm_cache",
+    "use_llm_cache",
+    default=True,
+    help="Reuse LLM responses cached from earlier runs with identical prompts",
+)
+def generate(
+    model: str,
+    num: int,
+    output_file: str,
+    concurrency: int,
+    max_retries: int,
+    seed: int,
+    passes: int,
+    dedupe_threshold: float,
+    restart: bool,
+    use_llm_cache: bool,
+) -> None:
+    """
+    Generate questions using the specified model.
+
+    Chunks are sampled in a seeded order and `concurrency` requests run at once;
+    results are accepted in chunk order, so a seed gives the same question set at
+    any concurrency. A retry uses a different generation seed, which also gives it
+    a different LLM cache key. Once every chunk has been tried, another pass over
+    the chunks in a new order uses new generation seeds, so a chunk can give
+    several questions. Questions that nearly duplicate an accepted one are
+    dropped. Accepted questions are appended to a .jsonl checkpoint next to
+    `output_file` as they arrive, and an interrupted run resumes from it.
+    """
+    if use_llm_cache:
+        llm_cache.enable("gen_questions")
+    attempts = max_retries + 1
+    chains = [
+        [
+            _QA_PROMPT | OllamaLLM(model=model, seed=seed + pass_index * attempts + attempt)
+            for attempt in range(attempts)
+        ]
+        for pass_index in range(passes)
+    ]
+
+    corpus = chunking.Corpus(["data/sanguo.txt"])
+    chunks = list(enumerate(corpus.chunks()))
+
+    checkpoint_path = os.path.splitext(output_file)[0] + ".jsonl"
+    if restart and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    truncate_partial_line(checkpoint_path)
+    questions = _load_checkpoint(checkpoint_path)
+    if questions:
+        print(f"Resuming from {checkpoint_path}: {len(questions)} questions")
+    dedupe = NearDuplicateIndex(dedupe_threshold, seed=seed)
+    for question in questions:
+        dedupe.add(question["query"])
+    done = {
+        (question["metadata"].get("pass", 0), question["metadata"]["source"])
+        for question in questions
+    }
+
+    def chunks_to_try():
+        rng = random.Random(seed)
+        for pass_index in range(passes):
+            rng.shuffle(chunks)
+            for i, chunk in chunks:
+                if (pass_index, f"chunk-{i}") not in done:
+                    yield pass_index, i, chunk
+
+    pending = chunks_to_try()
+
+    stats = Counter()
+    start = time.perf_counter()
     os.makedirs(os.path.dirname(output_file), exist_ok=True)
+    with (
+        open(checkpoint_path, "a") as checkpoint,
+        ThreadPoolExecutor(max_workers=concurrency) as executor,
+        tqdm(total=num, initial=min(len(questions), num)) as progress,
+    ):
+        # Keep twice `concurrency` requests queued so workers stay busy while the
+        # oldest one, which is accepted first, finishes.
+        window = deque()
+
+        def submit() -> None:
+            item = next(pending, None)
+            if item is not None:
+                pass_index, i, chunk = item
+                window.append(
+                    executor.submit(
+                        _generate_one, chains[pass_index], i, corpus.text(chunk), pass_index
+                    )
+                )
+
+        for _ in range(2 * concurrency):
+            submit()
+        while window and len(questions) < num:
+            parsed, attempts = window.popleft().result()
+            submit()
+            stats["chunks"] += 1
+            stats["retries"] += attempts - 1
+            if parsed is None:
+                stats["parse_failures"] += 1
+            elif dedupe.add(parsed["query"]) is not None:
+                stats["duplicates"] += 1
+            else:
+                questions.append(parsed)
+                checkpoint.write(json.dumps(parsed, ensure_ascii=False) + "\n")
+                checkpoint.flush()
+                progress.update()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    elapsed = time.perf_counter() - start
+    print(
+        f"{len(questions)} questions from {stats['chunks']} chunks in {elapsed:.0f}s: "
+        f"{stats['duplicates']} near-duplicates and {stats['parse_failures']} parse "
+        f"failures dropped, {stats['retries']} retries"
+    )
+    if len(questions) < num:
+        print(
+            f"Only {len(questions)} of {num} questions: ran out of chunks after "
+            f"{passes} passes"
+        )
+
     with open(output_file, "w") as f:
-        json.dump(questions, f, ensure_ascii=False, indent=4)
+        json.dump(questions[:num], f, ensure_ascii=False, indent=4)
+    llm_cache.print_stats()
 
 
 if __name__ == "__main__":
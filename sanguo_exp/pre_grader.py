@@ -0,0 +1,95 @@
+"""
+A deterministic first-tier grader that settles obviously correct answers without an
+LLM call.
+
+Answers and predictions are normalized (NFKC width folding, traditional to
+simplified Chinese, lowercase, no whitespace or punctuation). A prediction is
+CORRECT when it equals the normalized answer or one of its aliases from
+data/sanguo_aliases.tsv, optionally after a framing prefix such as "答案是"
+(punctuation and quotes are already gone). Any other extra characters can change
+the meaning ("曹操之子"), so such predictions go to the LLM grader, as do
+one-character and numeric answers ("三", "二十万"). This tier never marks an answer
+as INCORRECT.
+"""
+
+import re
+
+import pandas as pd
+
+from text_normalization import FOLD_TABLE
+
+_ALIASES_PATH = "data/sanguo_aliases.tsv"
+# Only short, name-like answers are checked.
+_MIN_ANSWER_LEN = 2
+_MAX_ANSWER_LEN = 12
+_MIN_ALIAS_LEN = 2
+_NUMERIC_RE = re.compile(r"[\d〇零一二两三四五六七八九十百千万亿第]+")
+# The only text a settled prediction may add before the name, after normalization.
+_FRAMING_PREFIXES = ("答案是", "答案为", "答案", "答", "是", "为")
+
+def normalize(texts: pd.Series) -> pd.Series:
+    return (
+        texts.fillna("")
+        .astype(str)
+        .str.normalize("NFKC")
+        .str.translate(FOLD_TABLE)
+        .str.lower()
+        .str.replace(r"[\W_]+", "", regex=True)
+    )
+
+
+def alias_groups(path: str = _ALIASES_PATH) -> list[list[str]]:
+    """The alias table as [canonical name, *aliases] lists, unnormalized."""
+    df = pd.read_csv(path, sep="\t", dtype=str).fillna("")
+    return [
+        [name, *filter(None, aliases.split("|"))]
+        for name, aliases in zip(df["name"], df["aliases"])
+    ]
+
+
+def load_aliases(
+    path: str = _ALIASES_PATH, groups: list[list[str]] | None = None
+) -> dict[str, set[str]]:
+    """Map every normalized name to the normalized names of the same entity."""
+    if groups is None:
+        groups = alias_groups(path)
+    aliases = {}
+    for group in groups:
+        names = set(normalize(pd.Series(group))) - {""}
+        names = {name for name in names if len(name) >= _MIN_ALIAS_LEN}
+        for name in names:
+            aliases.setdefault(name, set()).update(names)
+    return aliases
+
+
+def _settles(answer: str, prediction: str, aliases: dict[str, set[str]]) -> bool:
+    names = aliases.get(answer, set()) | {answer}
+    if prediction in names:
+        return True
+    return any(
+        prediction.removeprefix(prefix) in names
+        for prefix in _FRAMING_PREFIXES
+        if prediction.startswith(prefix)
+    )
+
+
+def pre_grade(
+    results: list[dict], aliases: dict[str, set[str]] | None = None
+) -> list[bool]:
+    """Whether each result is settled as CORRECT without the LLM grader."""
+    if not results:
+        return []
+    if aliases is None:
+        aliases = load_aliases()
+    df = pd.DataFrame(results)
+    answers = normalize(df["answer"])
+    predictions = normalize(df["predict"])
+    eligible = (
+        (answers.str.len() >= _MIN_ANSWER_LEN)
+        & (answers.str.len() <= _MAX_ANSWER_LEN)
+        & ~answers.str.fullmatch(_NUMERIC_RE)
+    )
+    return [
+        bool(ok) and _settles(answer, prediction, aliases)
+        for ok, answer, prediction in zip(eligible, answers, predictions)
+    ]
@@ -0,0 +1,245 @@
+"""
+A SQLite store of experiment results, keyed by a stable question ID.
+
+Every `save_results` call appends a run; an experiment's latest run is what is
+loaded and compared unless a run ID is given. Every result of a run is kept, in
+order, even when a question repeats; comparisons between experiments use the last
+result of a repeated question. Results are stored whole as JSON,
+with the query, source, prediction and grade in indexed columns, so a question can
+be looked up across experiments and comparisons are a join plus pandas operations
+instead of loops over files.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import pandas as pd
+
+_DEFAULT_PATH = "output/results.sqlite3"
+# SQLite limits the number of bound parameters per statement.
+_MAX_PARAMS = 500
+_RESULTS_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS results ("
+    "run_id INTEGER NOT NULL, question_id TEXT NOT NULL, position INTEGER NOT NULL, "
+    "source TEXT, query TEXT, answer TEXT, predict TEXT, eval TEXT, "
+    "pass INTEGER, grader TEXT, record TEXT NOT NULL, "
+    "PRIMARY KEY (run_id, position))"
+)
+_COLUMNS = ["question_id", "source", "query", "answer", "predict", "eval", "pass", "grader"]
+
+
+def question_id(question) -> str:
+    """A stable ID for a question, independent of its position in the question set."""
+    key = f"{question['source']}\0{question['query']}"
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+
+
+def pass_flips(base: pd.DataFrame, new: pd.DataFrame) -> pd.DataFrame:
+    """
+    Questions whose pass flag differs between two frames with `question_id` and
+    `pass` columns. Other columns get "_base" and "_new" suffixes.
+    """
+    joined = base.merge(new, on="question_id", suffixes=("_base", "_new"))
+    return joined[joined["pass_base"] != joined["pass_new"]]
+
+
+class ResultsStore:
+    def __init__(self, path: str = _DEFAULT_PATH):
+        dirname = os.path.dirname(path)
+        if dirname:
+            os.makedirs(dirname, exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS runs ("
+            "run_id INTEGER PRIMARY KEY AUTOINCREMENT, experiment TEXT NOT NULL, "
+            "created REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS runs_experiment ON runs (experiment, run_id)"
+        )
+        self._migrate()
+        self._conn.execute(_RESULTS_SCHEMA)
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS results_question ON results (question_id)"
+        )
+        self._conn.commit()
+
+    def _migrate(self) -> None:
+        # Stores created before repeated questions were kept keyed results by
+        # (run_id, question_id).
+        ((old,),) = self._conn.execute(
+            "SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name = 'results' "
+            "AND sql LIKE '%PRIMARY KEY (run_id, question_id)%'"
+        ).fetchall()
+        if not old:
+            return
+        self._conn.execute("ALTER TABLE results RENAME TO results_by_question")
+        self._conn.execute(_RESULTS_SCHEMA)
+        self._conn.execute("INSERT INTO results SELECT * FROM results_by_question")
+        self._conn.execute("DROP TABLE results_by_question")
+        self._conn.commit()
+
+    def append_run(self, experiment: str, results: list[dict]) -> int:
+        rows = []
+        for position, result in enumerate(results):
+            passed = result.get("pass")
+            answer = result.get("answer")
+            rows.append(
+                (
+                    question_id(result),
+                    position,
+                    result.get("source"),
+                    result.get("query"),
+                    None if answer is None else str(answer),
+                    result.get("predict"),
+                    result.get("eval"),
+                    None if passed is None else int(passed),
+                    result.get("grader"),
+                    json.dumps(result, ensure_ascii=False),
+                )
+            )
+        with self._lock:
+            run_id = self._conn.execute(
+                "INSERT INTO runs (experiment, created) VALUES (?, ?)",
+                (experiment, time.time()),
+            ).lastrowid
+            self._conn.executemany(
+                "INSERT INTO results (run_id, question_id, position, source, "
+                "query, answer, predict, eval, pass, grader, record) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [(run_id, *row) for row in rows],
+            )
+            self._conn.commit()
+        repeated = len(rows) - len({row[0] for row in rows})
+        if repeated:
+            print(
+                f"{experiment}: {repeated} results repeat an earlier question (same "
+                "source and query); all are stored, comparisons use the last"
+            )
+        return run_id
+
+    def _query(self, sql: str, params=()) -> list[tuple]:
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def latest_run(self, experiment: str) -> int | None:
+        (run_id,) = self._query(
+            "SELECT MAX(run_id) FROM runs WHERE experiment = ?", (experiment,)
+        )[0]
+        return run_id
+
+    def run_created(self, run_id: int) -> float:
+        """When a run was stored, in seconds since the epoch."""
+        (created,) = self._query("SELECT created FROM runs WHERE run_id = ?", (run_id,))[0]
+        return created
+
+    def runs(self) -> pd.DataFrame:
+        """Every run with its experiment, time and number of results."""
+        with self._lock:
+            return pd.read_sql_query(
+                "SELECT runs.run_id, experiment, created, COUNT(question_id) AS results "
+                "FROM runs LEFT JOIN results USING (run_id) "
+                "GROUP BY runs.run_id ORDER BY runs.run_id",
+                self._conn,
+            )
+
+    def load(self, experiment: str, run_id: int | None = None) -> list[dict] | None:
+        """The results of a run, in saved order; None if the experiment has no runs."""
+        if run_id is None:
+            run_id = self.latest_run(experiment)
+            if run_id is None:
+                return None
+        rows = self._query(
+            "SELECT record FROM results WHERE run_id = ? ORDER BY position", (run_id,)
+        )
+        return [json.loads(record) for (record,) in rows]
+
+    def lookup(self, question_id: str) -> pd.DataFrame:
+        """Results of one question in the latest run of every experiment."""
+        with self._lock:
+            return pd.read_sql_query(
+                "SELECT experiment, results.* FROM results JOIN runs USING (run_id) "
+                "WHERE question_id = ? AND run_id IN "
+                "(SELECT MAX(run_id) FROM runs GROUP BY experiment)",
+                self._conn,
+                params=(question_id,),
+            ).drop(columns=["record"])
+
+    def frame(self, experiments: list[str]) -> pd.DataFrame:
+        """Result columns of the experiments' latest runs, one row per result."""
+        run_ids = {}
+        for experiment in experiments:
+            run_id = self.latest_run(experiment)
+            if run_id is None:
+                raise KeyError(f"No results stored for {experiment}")
+            run_ids[run_id] = experiment
+        frames = []
+        ids = list(run_ids)
+        with self._lock:
+            for start in range(0, len(ids), _MAX_PARAMS):
+                batch = ids[start : start + _MAX_PARAMS]
+                frames.append(
+                    pd.read_sql_query(
+                        f"SELECT run_id, {', '.join(_COLUMNS)} FROM results "
+                        f"WHERE run_id IN ({','.join('?' * len(batch))}) "
+                        "ORDER BY run_id, position",
+                        self._conn,
+                        params=batch,
+                    )
+                )
+        df = pd.concat(frames, ignore_index=True)
+        df.insert(0, "experiment", df.pop("run_id").map(run_ids))
+        df["pass"] = df["pass"].astype("boolean")
+        return df
+
+    def compare(self, experiments: list[str]) -> dict[str, pd.DataFrame]:
+        """
+        Compare experiments on the questions graded in all of them; the first is the
+        baseline. Returns:
+
+            accuracy  accuracy by source (and "all"), one column per experiment
+            delta     accuracy minus the baseline's
+            flips     per experiment, questions newly passing and newly failing
+        """
+        df = self.frame(experiments).drop_duplicates(
+            ["experiment", "question_id"], keep="last"
+        )
+        passes = df.pivot(index="question_id", columns="experiment", values="pass")
+        passes = passes[experiments].dropna().astype(bool)
+        sources = df.drop_duplicates("question_id").set_index("question_id")["source"]
+        sources = sources.loc[passes.index]
+
+        accuracy = passes.groupby(sources).mean()
+        accuracy.loc["all"] = passes.mean()
+        accuracy.insert(0, "questions", [*passes.groupby(sources).size(), len(passes)])
+        delta = accuracy[experiments].sub(accuracy[experiments[0]], axis=0)
+
+        base = passes[experiments[0]]
+        flips = pd.DataFrame(
+            {
+                "new_passing": [int((~base & passes[e]).sum()) for e in experiments],
+                "new_failing": [int((base & ~passes[e]).sum()) for e in experiments],
+            },
+            index=experiments,
+        )
+        return {"accuracy": accuracy, "delta": delta, "flips": flips}
+
+    def flips(self, base_experiment: str, new_experiment: str) -> pd.DataFrame:
+        df = self.frame([base_experiment, new_experiment]).drop_duplicates(
+            ["experiment", "question_id"], keep="last"
+        )
+        df = df.dropna(subset=["pass"])
+        base = df[df["experiment"] == base_experiment].drop(columns="experiment")
+        new = df[df["experiment"] == new_experiment].drop(columns="experiment")
+        return pass_flips(base, new)
+
+    def import_json(self, experiment: str, path: str) -> int:
+        with open(path, "r") as f:
+            return self.append_run(experiment, json.load(f))
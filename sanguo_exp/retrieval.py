@@ -0,0 +1,144 @@
+"""
+Retriever configuration shared by the experiments: the click options selecting an
+index and retrieval mode, `build_retriever` turning them into a retriever, and the
+prompt that answers a question from the retrieved text.
+"""
+
+import click
+from langchain_core.prompts import ChatPromptTemplate
+
+import chroma_lib
+import entity_linker
+import lexical_index
+
+QA_PROMPT = ChatPromptTemplate.from_messages(
+    [
+        ("system", "你是一名三国演义的专家"),
+        (
+            "human",
+            "阅读下面的内容 {material}, 回答问题。回答要简短。\n问题: {question}",
+        ),
+    ]
+)
+_OPTIONS = [
+    click.option(
+        "--backend",
+        type=click.Choice(["chroma", "flat", "ivf", "quantized"]),
+        default="chroma",
+        help="Vector store used for retrieval",
+    ),
+    click.option(
+        "--retrieval",
+        "retrieval_mode",
+        type=click.Choice(["vector", "hybrid", "lexical"]),
+        default="vector",
+        help="Vector search, BM25 fused with it by reciprocal rank, or BM25 alone",
+    ),
+    click.option(
+        "--lexical_index_dir",
+        default="lexical_index/sanguo",
+        help="Index built by build_lexical_index.py, used with --retrieval hybrid or lexical",
+    ),
+    click.option(
+        "--flat_index_dir",
+        default="flat_index/sanguo",
+        help="Index exported by build_flat_index.py, used with --backend flat or ivf",
+    ),
+    click.option(
+        "--ann_index_dir",
+        default="ann_index/sanguo",
+        help="Index built by build_ann_index.py, used with --backend ivf",
+    ),
+    click.option("--nprobe", default=None, type=int, help="Override the IVF nprobe"),
+    click.option(
+        "--quantized_index_dir",
+        default="quantized_index/sanguo",
+        help="Index built by build_quantized_index.py, used with --backend quantized",
+    ),
+    click.option(
+        "--rerank",
+        default=None,
+        type=int,
+        help="Override the number of candidates re-scored exactly by --backend ivf or quantized",
+    ),
+    click.option(
+        "--entity_index_dir",
+        default=None,
+        help="Boost retrieved chunks that mention the question's entities, using this index",
+    ),
+    click.option(
+        "--entity_filter", is_flag=True, help="Keep only chunks mentioning the entities"
+    ),
+]
+
+
+def retriever_options(function):
+    """Add the options taken by `build_retriever` to a click command."""
+    for option in reversed(_OPTIONS):
+        function = option(function)
+    return function
+
+
+def batched(backend: str, retrieval_mode: str) -> bool:
+    """
+    Whether to retrieve the whole question set in one batch: in-process indexes
+    embed and search all queries at once, while Chroma is queried per question.
+    """
+    return backend != "chroma" or retrieval_mode == "lexical"
+
+
+def build_retriever(
+    embedding_model,
+    k: int,
+    backend: str,
+    retrieval_mode: str,
+    lexical_index_dir: str,
+    flat_index_dir: str,
+    ann_index_dir: str,
+    nprobe: int | None,
+    quantized_index_dir: str,
+    rerank: int | None,
+    entity_index_dir: str | None,
+    entity_filter: bool,
+):
+    # Entity boosting and hybrid fusion re-rank a larger candidate set down to k.
+    candidates = 4 * k if entity_index_dir else k
+    search_kwargs = {"k": 4 * k if entity_index_dir or retrieval_mode == "hybrid" else k}
+    if retrieval_mode == "lexical":
+        # BM25 alone needs no vector store or query embedding.
+        retriver = None
+    else:
+        if backend == "flat":
+            vector_store = chroma_lib.get_flat_index(flat_index_dir, embedding_model)
+        elif backend == "ivf":
+            search_params = {"nprobe": nprobe} if nprobe else {}
+            if rerank is not None:
+                search_params["rerank"] = rerank
+            vector_store = chroma_lib.get_ann_index(
+                ann_index_dir, flat_index_dir, embedding_model, **search_params
+            )
+        elif backend == "quantized":
+            search_params = {"rerank": rerank} if rerank is not None else {}
+            vector_store = chroma_lib.get_quantized_index(
+                quantized_index_dir, flat_index_dir, embedding_model, **search_params
+            )
+        else:
+            vector_store = chroma_lib.get_vector_store(
+                "chroma_db/sanguo", "sanguo", embedding_model
+            )
+        retriver = vector_store.as_retriever(search_kwargs=search_kwargs)
+    if retrieval_mode != "vector":
+        retriver = lexical_index.HybridRetriever(
+            index=chroma_lib.get_lexical_index(lexical_index_dir),
+            vector_retriever=retriver,
+            k=candidates,
+            fetch_k=search_kwargs["k"],
+        )
+    if entity_index_dir:
+        retriver = entity_linker.EntityBoostRetriever(
+            retriever=retriver,
+            index=entity_linker.EntityIndex.load(entity_index_dir),
+            k=k,
+            filter=entity_filter,
+        )
+    return retriver
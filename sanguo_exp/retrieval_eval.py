@@ -0,0 +1,256 @@
+"""
+Evaluate retrieval alone, without calling an LLM.
+
+Every question is retrieved in one batch at the largest k. A retrieved chunk is
+relevant to a generated question if it covers at least half of the chunk the
+question was generated from (by byte offsets, so indexes chunked differently still
+match), and to a manual question if it contains the folded answer string. An auto
+question whose recorded chunk text differs from that chunk (questions generated with
+other chunking) falls back to answer containment too. Answers of a single character
+match almost any chunk, so such questions are left out. With a single relevant chunk
+per question, the rank r of the first hit gives
+
+    recall@k = 1 if r <= k    MRR = 1 / r    nDCG@k = 1 / log2(r + 1) if r <= k
+
+Single-query latency is measured separately on a sample of questions.
+
+    python -m sanguo_exp.retrieval_eval --backend flat --k 1,3,5,10
+"""
+
+import json
+import os
+import time
+
+import click
+import numpy as np
+import pandas as pd
+
+import chroma_lib
+import chunking
+import instrument
+from sanguo_exp import eval, retrieval
+from sanguo_exp.results_store import question_id
+from text_normalization import fold
+
+# Fraction of the gold chunk, or of the retrieved chunk if shorter, that must overlap.
+_MIN_OVERLAP = 0.5
+# Shorter answers are contained in too many chunks to identify a relevant one.
+_MIN_ANSWER_CHARS = 2
+_PERCENTILES = [50, 90, 95, 99]
+
+
+class GoldChunks:
+    """The chunks auto questions were generated from, by `chunk-{i}` source."""
+
+    def __init__(self, doc_path: str, chunk_size: int, chunk_overlap: int):
+        self.corpus = chunking.Corpus([doc_path])
+        self.chunks = self.corpus.chunks(chunk_size, chunk_overlap)
+        # Auto questions whose recorded content is not the chunk at their index.
+        self.mismatched = set()
+
+    def get(self, question) -> chunking.Chunk | None:
+        source = question.get("metadata", {}).get("source", "")
+        if not source.startswith("chunk-"):
+            return None
+        index = int(source.removeprefix("chunk-"))
+        gold = self.chunks[index] if index < len(self.chunks) else None
+        content = question.get("content")
+        if gold is None or (
+            content is not None and content.strip() != self.corpus.text(gold).strip()
+        ):
+            self.mismatched.add(question_id(question))
+            return None
+        return gold
+
+    def matches(self, gold: chunking.Chunk, index: int, doc) -> bool:
+        metadata = doc.metadata
+        if metadata.get("source") != self.corpus.source(gold):
+            return False
+        if "start" not in metadata or "end" not in metadata:
+            return metadata.get("slice") == str(index)
+        start, end = int(metadata["start"]), int(metadata["end"])
+        overlap = min(end, gold.end) - max(start, gold.start)
+        return overlap >= _MIN_OVERLAP * min(gold.end - gold.start, end - start)
+
+
+def relevance(question, gold_chunks: GoldChunks):
+    """Whether a document is relevant to `question`, None if that cannot be told."""
+    gold = gold_chunks.get(question)
+    if gold is not None:
+        index = int(question["metadata"]["source"].removeprefix("chunk-"))
+        return lambda doc: gold_chunks.matches(gold, index, doc)
+    answer = fold(str(question.get("answer", ""))).strip()
+    if len(answer) < _MIN_ANSWER_CHARS:
+        return None
+    return lambda doc: answer in fold(doc.page_content)
+
+
+def first_relevant_rank(docs, relevant) -> int | None:
+    """1-based rank of the first relevant document, None if none is."""
+    for rank, doc in enumerate(docs, 1):
+        if relevant(doc):
+            return rank
+    return None
+
+
+def score(ranks: pd.DataFrame, ks: list[int]) -> pd.DataFrame:
+    """recall@k, nDCG@k and MRR by source and overall, from a frame of ranks."""
+    rank = ranks["rank"].astype(float)
+    metrics = pd.DataFrame({"source": ranks["source"]})
+    for k in ks:
+        metrics[f"recall@{k}"] = (rank <= k).astype(float)
+    metrics["mrr"] = (1 / rank).fillna(0.0)
+    for k in ks:
+        metrics[f"ndcg@{k}"] = np.where(rank <= k, 1 / np.log2(rank + 1), 0.0)
+    table = metrics.groupby("source").mean()
+    table.loc["all"] = metrics.drop(columns="source").mean()
+    table.insert(0, "questions", [*metrics.groupby("source").size(), len(metrics)])
+    return table
+
+
+def latency(retriever, queries: list[str]) -> pd.DataFrame:
+    """Percentiles in milliseconds of single-query retrieval and its stages."""
+    rows = []
+    for query in queries:
+        with instrument.measure() as metrics, instrument.retrieval():
+            start = time.perf_counter()
+            retriever.invoke(query)
+            metrics["total_s"] = time.perf_counter() - start
+        rows.append(metrics)
+    frame = pd.DataFrame(rows).fillna(0.0) * 1000
+    frame.columns = [name.removesuffix("_s") + "_ms" for name in frame.columns]
+    return frame.describe(percentiles=[p / 100 for p in _PERCENTILES]).T[
+        ["mean"] + [f"{p}%" for p in _PERCENTILES] + ["max"]
+    ]
+
+
+@click.command()
+@click.option("--k", "ks", default="1,3,5,10", help="Comma-separated cutoffs")
+@click.option("--embedding_model", default="qwen2.5:7b", help="Query embedding model")
+@retrieval.retriever_options
+@click.option("--doc_path", default="data/sanguo.txt", help="Document the questions came from")
+@click.option(
+    "--chunk_size",
+    default=chunking.CHUNK_SIZE,
+    help="Chunk size the questions were generated with",
+)
+@click.option(
+    "--chunk_overlap",
+    default=chunking.CHUNK_OVERLAP,
+    help="Chunk overlap the questions were generated with",
+)
+@click.option(
+    "--latency_queries", default=100, help="Questions retrieved one at a time for latency"
+)
+@click.option("--output", default=None, help="Save metrics and per-question ranks as JSON")
+def run(
+    ks: str,
+    embedding_model: str,
+    backend: str,
+    retrieval_mode: str,
+    lexical_index_dir: str,
+    flat_index_dir: str,
+    ann_index_dir: str,
+    nprobe: int | None,
+    quantized_index_dir: str,
+    rerank: int | None,
+    entity_index_dir: str | None,
+    entity_filter: bool,
+    doc_path: str,
+    chunk_size: int,
+    chunk_overlap: int,
+    latency_queries: int,
+    output: str | None,
+) -> None:
+    cutoffs = sorted({int(k) for k in ks.split(",") if k.strip()})
+    retriever = retrieval.build_retriever(
+        instrument.TimedEmbeddings(chroma_lib.embedding_model(embedding_model)),
+        cutoffs[-1],
+        backend,
+        retrieval_mode,
+        lexical_index_dir,
+        flat_index_dir,
+        ann_index_dir,
+        nprobe,
+        quantized_index_dir,
+        rerank,
+        entity_index_dir,
+        entity_filter,
+    )
+    questions = eval.load_questions()
+    queries = [question["query"] for question in questions]
+    gold_chunks = GoldChunks(doc_path, chunk_size, chunk_overlap)
+
+    # Warm up model loading and index paging before anything is timed.
+    retriever.invoke(queries[0])
+    with instrument.measure() as batch_metrics, instrument.retrieval():
+        start = time.perf_counter()
+        retrieved = retriever.batch(queries)
+        batch_s = time.perf_counter() - start
+
+    rows = []
+    excluded = 0
+    for question, docs in zip(questions, retrieved):
+        relevant = relevance(question, gold_chunks)
+        if relevant is None:
+            excluded += 1
+            continue
+        rows.append(
+            {
+                "question_id": question_id(question),
+                "source": question["source"],
+                "query": question["query"],
+                "rank": first_relevant_rank(docs, relevant),
+            }
+        )
+    ranks = pd.DataFrame(rows, columns=["question_id", "source", "query", "rank"])
+    table = score(ranks, cutoffs)
+    print(table.to_string(float_format=lambda x: f"{x:.3f}"))
+    if gold_chunks.mismatched:
+        print(
+            f"{len(gold_chunks.mismatched)} auto questions do not match their chunk-{{i}} "
+            f"text at chunk size {chunk_size}, overlap {chunk_overlap}; scored by answer "
+            "containment instead"
+        )
+    if excluded:
+        print(f"{excluded} questions left out: answer too short to locate")
+    missed = int(ranks["rank"].isna().sum())
+    print(f"{missed} of {len(ranks)} questions have no relevant chunk in the top {cutoffs[-1]}")
+
+    print(
+        f"\nBatch of {len(queries)}: {batch_s:.2f}s, {len(queries) / batch_s:.1f} queries/s "
+        f"(embedding {batch_metrics.get('query_embedding_s', 0):.2f}s, "
+        f"search {batch_metrics.get('vector_search_s', 0):.2f}s)"
+    )
+    timings = None
+    if latency_queries:
+        timings = latency(retriever, queries[:latency_queries])
+        print(f"\nSingle-query latency over {min(latency_queries, len(queries))} questions:")
+        print(timings.to_string(float_format=lambda x: f"{x:.2f}"))
+
+    if output:
+        os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+        record = {
+            "config": {
+                "backend": backend,
+                "retrieval": retrieval_mode,
+                "k": cutoffs,
+                "embedding_model": embedding_model,
+            },
+            "metrics": json.loads(table.to_json(orient="index")),
+            "gold_mismatches": len(gold_chunks.mismatched),
+            "excluded": excluded,
+            "batch_s": batch_s,
+            "latency_ms": None if timings is None else json.loads(timings.to_json(orient="index")),
+            "ranks": [
+                {**row, "rank": None if pd.isna(row["rank"]) else int(row["rank"])}
+                for row in ranks.to_dict(orient="records")
+            ],
+        }
+        with open(output, "w") as f:
+            json.dump(record, f, ensure_ascii=False, indent=4)
+        print(f"Saved to {output}")
+
+
+if __name__ == "__main__":
+    run()
@@ -1,14 +1,37 @@
 import click
 
+import llm_cache
 from sanguo_exp import eval
 
 @click.command()
 @click.option("--experiment_name", required=True, help="Experiment name")
-def run_experiment(experiment_name: str) -> None:
+@click.option(
+    "--llm_cache/--no_llm_cache",
+    "use_llm_cache",
+    default=True,
+    help="Reuse LLM responses cached from earlier runs with identical prompts",
+)
+@click.option("--concurrency", default=4, help="Number of concurrent LLM grading batches")
+@click.option(
+    "--pre_grade/--no_pre_grade",
+    default=True,
+    help="Settle obviously correct answers without an LLM call",
+)
+def run_experiment(
+    experiment_name: str, use_llm_cache: bool, concurrency: int, pre_grade: bool
+) -> None:
+    if use_llm_cache:
+        llm_cache.enable(experiment_name + "_eval")
     results = eval.load_results(experiment_name)
     llm_model = eval.eval_model()
-    eval_results = eval.run_eval_chain(questions=results, llm_model=llm_model)
+    eval_results = eval.run_eval_chain(
+        questions=results,
+        llm_model=llm_model,
+        concurrency=concurrency,
+        pre_grade=pre_grade,
+    )
     eval.save_results(eval_results, experiment_name + "_eval")
+    llm_cache.print_stats()
 
 
 if __name__ == "__main__":
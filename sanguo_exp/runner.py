@@ -0,0 +1,86 @@
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from tqdm import tqdm
+
+from jsonl import truncate_partial_line
+from sanguo_exp import eval
+
+
+def checkpoint_path(experiment_name: str) -> str:
+    return os.path.join("output", f"{experiment_name}.jsonl")
+
+
+def load_checkpoint(experiment_name: str) -> dict[str, dict]:
+    path = checkpoint_path(experiment_name)
+    if not os.path.exists(path):
+        return {}
+    done = {}
+    with open(path, "r") as f:
+        for line in f:
+            # A crash can leave a truncated last line behind.
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            done[eval.question_id(record)] = record
+    return done
+
+
+def run_questions(
+    questions: list[dict],
+    answer_fn,
+    experiment_name: str,
+    concurrency: int = 1,
+    restart: bool = False,
+) -> list[dict]:
+    """
+    Answer every question with `answer_fn` and save the results for `run_eval`.
+
+    `answer_fn(question)` returns a dict of fields to add to the question, e.g.
+    `{"predict": ...}`. Questions run on `concurrency` threads. Each finished record
+    is appended to output/{experiment_name}.jsonl, and questions already in that
+    checkpoint are skipped, so an interrupted run resumes where it stopped. Pass
+    `restart` to discard the checkpoint.
+    """
+    results = answer_questions(questions, answer_fn, experiment_name, concurrency, restart)
+    eval.save_results(results, experiment_name)
+    return results
+
+
+def answer_questions(
+    questions: list[dict],
+    answer_fn,
+    experiment_name: str,
+    concurrency: int = 1,
+    restart: bool = False,
+) -> list[dict]:
+    """`run_questions` without saving the results, for answering in increments."""
+    path = checkpoint_path(experiment_name)
+    if restart and os.path.exists(path):
+        os.remove(path)
+    truncate_partial_line(path)
+    done = load_checkpoint(experiment_name)
+    pending = [q for q in questions if eval.question_id(q) not in done]
+    if len(pending) < len(questions):
+        print(f"Resuming {experiment_name}: {len(questions) - len(pending)} done")
+
+    os.makedirs("output", exist_ok=True)
+    with (
+        open(path, "a") as checkpoint,
+        ThreadPoolExecutor(max_workers=concurrency) as executor,
+    ):
+        futures = {executor.submit(answer_fn, q): q for q in pending}
+        try:
+            for future in tqdm(as_completed(futures), total=len(futures)):
+                question = futures[future]
+                record = {**question, **future.result()}
+                checkpoint.write(json.dumps(record, ensure_ascii=False) + "\n")
+                checkpoint.flush()
+                done[eval.question_id(question)] = record
+        except BaseException:
+            executor.shutdown(cancel_futures=True)
+            raise
+
+    return [done[eval.question_id(q)] for q in questions]
@@ -0,0 +1,297 @@
+"""
+Run a grid of RAG configurations as a DAG of shared stages.
+
+    index     one Chroma collection and flat export per (chunk size, overlap,
+              embedding model)
+    retrieve  one batched retrieval of every question per (index, k)
+    answer    one experiment per (retrieval, answer model)
+    grade     one graded experiment per answer stage
+
+A stage runs once however many configurations share it, and stages whose output
+already exists are skipped, so growing a sweep only runs the new stages. Retrieve
+stages, and so the experiments after them, are keyed by a hash of the question IDs:
+a changed question set runs them again instead of reusing results for other
+questions.
+Independent stages run on parallel workers. The graded experiments go into the
+results store and the sweep ends with one comparison table.
+
+    python -m sanguo_exp.sweep --chunk_size 500,1000 --k 3,5 \\
+        --answer_model qwen2.5:7b,deepseek-r1:7b
+"""
+
+import hashlib
+import json
+import os
+import re
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, NamedTuple
+
+import click
+import pandas as pd
+from langchain_core.documents import Document
+from langchain_ollama.llms import OllamaLLM
+
+import chroma_lib
+import context_packing
+import instrument
+import llm_cache
+from sanguo_exp import eval, retrieval, runner
+from sanguo_exp.results_store import ResultsStore
+
+_SWEEP_DIR = "sweep"
+
+
+class Stage(NamedTuple):
+    key: str
+    run: Callable[[], None]
+    deps: tuple[str, ...] = ()
+
+
+def run_stages(stages: list[Stage], workers: int) -> list[str]:
+    """
+    Run stages as soon as their dependencies finish, on `workers` threads. A failed
+    stage's dependents are skipped; returns the keys of failed and skipped stages.
+    """
+    pending = {stage.key: stage for stage in stages}
+    done, failed = set(), []
+    running = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while pending or running:
+            for key, stage in list(pending.items()):
+                if any(dep in failed for dep in stage.deps):
+                    print(f"[skipped] {key}")
+                    failed.append(pending.pop(key).key)
+                elif all(dep in done for dep in stage.deps):
+                    running[executor.submit(_timed, pending.pop(key))] = key
+            if not running:
+                break
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                key = running.pop(future)
+                try:
+                    future.result()
+                    done.add(key)
+                except Exception as e:
+                    print(f"[failed] {key}: {type(e).__name__}: {e}")
+                    failed.append(key)
+    return failed
+
+
+def _timed(stage: Stage) -> None:
+    start = time.perf_counter()
+    stage.run()
+    print(f"[done] {stage.key} in {time.perf_counter() - start:.1f}s")
+
+
+def _slug(*parts) -> str:
+    return re.sub(r"[^\w.-]+", "_", "-".join(str(part) for part in parts))
+
+
+def _split(values: str, type_=str) -> list:
+    return [type_(value.strip()) for value in values.split(",") if value.strip()]
+
+
+def _questions_key(questions) -> str:
+    ids = sorted(eval.question_id(question) for question in questions)
+    return hashlib.sha1("\n".join(ids).encode("utf-8")).hexdigest()[:8]
+
+
+def _index_stage(chunk_size: int, chunk_overlap: int, embedding_model: str) -> Stage:
+    key = "index-" + _slug(chunk_size, chunk_overlap, embedding_model)
+    index_dir = os.path.join(_SWEEP_DIR, key)
+
+    def run() -> None:
+        flat_dir = os.path.join(index_dir, "flat")
+        if os.path.exists(os.path.join(flat_dir, "meta.json")):
+            return
+        db_dir = os.path.join(index_dir, "chroma")
+        chroma_lib.build_db_with_chrunking(
+            doc_paths=["data/sanguo.txt"],
+            db_dir=db_dir,
+            collection_name="sanguo",
+            embedding_model=chroma_lib.embedding_model(embedding_model),
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap,
+        )
+        chroma_lib.export_flat_index(db_dir, "sanguo", flat_dir)
+
+    return Stage(key, run)
+
+
+def _retrieve_stage(
+    index: Stage, embedding_model: str, k: int, questions
+) -> tuple[Stage, str]:
+    questions_key = _questions_key(questions)
+    key = f"retrieve-k{k}-q{questions_key}-{index.key}"
+    path = os.path.join(_SWEEP_DIR, index.key, f"retrieved_k{k}_q{questions_key}.json")
+
+    def run() -> None:
+        if os.path.exists(path):
+            return
+        embeddings = instrument.TimedEmbeddings(chroma_lib.embedding_model(embedding_model))
+        flat = chroma_lib.get_flat_index(
+            os.path.join(_SWEEP_DIR, index.key, "flat"), embeddings
+        )
+        retriever = flat.as_retriever(search_kwargs={"k": k})
+        queries = [question["query"] for question in questions]
+        with instrument.measure() as metrics, instrument.retrieval():
+            retrieved = retriever.batch(queries)
+        # Batch timings are split evenly across questions, as in exp2.
+        record = {
+            "metrics": {name: value / len(queries) for name, value in metrics.items()},
+            "documents": {
+                eval.question_id(question): [
+                    {"text": doc.page_content, "metadata": doc.metadata} for doc in docs
+                ]
+                for question, docs in zip(questions, retrieved)
+            },
+        }
+        with open(path + ".tmp", "w") as f:
+            json.dump(record, f, ensure_ascii=False)
+        os.replace(path + ".tmp", path)
+
+    return Stage(key, run, (index.key,)), path
+
+
+def _answer_stage(
+    retrieve: Stage, retrieved_path: str, answer_model: str, questions, concurrency: int
+) -> Stage:
+    experiment = "sweep-" + _slug(answer_model, retrieve.key)
+
+    def run() -> None:
+        if os.path.exists(os.path.join("output", f"{experiment}.json")):
+            return
+        with open(retrieved_path, "r") as f:
+            retrieved = json.load(f)
+        chain = retrieval.QA_PROMPT | OllamaLLM(model=answer_model, temperature=0)
+        llm_metrics = instrument.LLMMetricsHandler()
+
+        def answer(question):
+            with instrument.measure() as metrics:
+                metrics.update(retrieved["metrics"])
+                docs = [
+                    Document(page_content=doc["text"], metadata=doc["metadata"])
+                    for doc in retrieved["documents"][eval.question_id(question)]
+                ]
+                predict = chain.invoke(
+                    {
+                        "material": context_packing.pack(docs).text,
+                        "question": question["query"],
+                    },
+                    config={"callbacks": [llm_metrics]},
+                )
+            return {"predict": predict, "metrics": metrics}
+
+        runner.run_questions(questions, answer, experiment, concurrency=concurrency)
+
+    return Stage(experiment, run, (retrieve.key,))
+
+
+def _grade_stage(answer: Stage, concurrency: int) -> Stage:
+    experiment = answer.key + "_eval"
+
+    def run() -> None:
+        if os.path.exists(os.path.join("output", f"{experiment}.json")):
+            return
+        results = eval.run_eval_chain(
+            eval.load_results(answer.key), eval.eval_model(), concurrency=concurrency
+        )
+        eval.save_results(results, experiment)
+
+    return Stage(experiment, run, (answer.key,))
+
+
+def comparison_table(configs: list[dict]) -> pd.DataFrame:
+    """One row per configuration: its parameters, accuracy by source and mean metrics."""
+    experiments = [config["experiment"] for config in configs]
+    accuracy = ResultsStore().compare(experiments)["accuracy"]
+    rows = []
+    for config, experiment in zip(configs, experiments):
+        metrics = pd.DataFrame(
+            [r["metrics"] for r in eval.load_results(experiment) if r.get("metrics")]
+        )
+        row = {name: value for name, value in config.items() if name != "experiment"}
+        row["questions"] = int(accuracy.loc["all", "questions"])
+        for source in accuracy.index:
+            row[f"accuracy_{source}"] = accuracy.loc[source, experiment]
+        for name in ("vector_search_s", "generation_s", "prompt_tokens"):
+            if name in metrics:
+                row[name] = metrics[name].mean()
+        rows.append(row)
+    return pd.DataFrame(rows).sort_values("accuracy_all", ascending=False)
+
+
+@click.command()
+@click.option("--chunk_size", default="1000", help="Comma-separated chunk sizes")
+@click.option("--chunk_overlap", default="200", help="Comma-separated chunk overlaps")
+@click.option("--embedding_model", default="qwen2.5:7b", help="Comma-separated embedding models")
+@click.option("--k", default="5", help="Comma-separated numbers of retrieved chunks")
+@click.option("--answer_model", default="qwen2.5:7b", help="Comma-separated answer models")
+@click.option("--workers", default=2, help="Stages run in parallel")
+@click.option("--concurrency", default=4, help="Questions answered or graded in parallel per stage")
+@click.option("--output", default="output/sweep.csv", help="Comparison table file")
+@click.option(
+    "--llm_cache/--no_llm_cache",
+    "use_llm_cache",
+    default=True,
+    help="Reuse LLM responses cached from earlier runs with identical prompts",
+)
+def run(
+    chunk_size: str,
+    chunk_overlap: str,
+    embedding_model: str,
+    k: str,
+    answer_model: str,
+    workers: int,
+    concurrency: int,
+    output: str,
+    use_llm_cache: bool,
+) -> None:
+    if use_llm_cache:
+        llm_cache.enable("sweep")
+    questions = eval.load_questions()
+
+    stages = {}
+    configs = []
+    for size in _split(chunk_size, int):
+        for overlap in _split(chunk_overlap, int):
+            for embedder in _split(embedding_model):
+                index = _index_stage(size, overlap, embedder)
+                stages.setdefault(index.key, index)
+                for top_k in _split(k, int):
+                    retrieve, path = _retrieve_stage(index, embedder, top_k, questions)
+                    stages.setdefault(retrieve.key, retrieve)
+                    for model in _split(answer_model):
+                        answer = _answer_stage(retrieve, path, model, questions, concurrency)
+                        grade = _grade_stage(answer, concurrency)
+                        stages.setdefault(answer.key, answer)
+                        stages.setdefault(grade.key, grade)
+                        configs.append(
+                            {
+                                "chunk_size": size,
+                                "chunk_overlap": overlap,
+                                "embedding_model": embedder,
+                                "k": top_k,
+                                "answer_model": model,
+                                "experiment": grade.key,
+                            }
+                        )
+    print(f"{len(configs)} configurations, {len(stages)} unique stages")
+
+    os.makedirs(_SWEEP_DIR, exist_ok=True)
+    failed = run_stages(list(stages.values()), workers)
+    configs = [config for config in configs if config["experiment"] not in failed]
+    if configs:
+        table = comparison_table(configs)
+        print(table.to_string(index=False, float_format=lambda x: f"{x:.3f}"))
+        os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+        table.to_csv(output, index=False)
+        print(f"Comparison saved to {output}")
+    llm_cache.print_stats()
+    if failed:
+        raise click.ClickException(f"{len(failed)} stages failed or were skipped")
+
+
+if __name__ == "__main__":
+    run()
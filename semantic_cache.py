@@ -0,0 +1,229 @@
+"""
+An in-memory semantic cache in front of a retriever and answer chain.
+
+Past queries are kept with their embedding, their retrieved documents and, once
+generated, their answer. A query whose embedding has cosine similarity of at least
+`threshold` with a cached query reuses that entry: retrieval is skipped, and so is
+generation if the entry has an answer. Identical query text (up to whitespace)
+matches without being embedded.
+
+Entries expire `ttl_s` seconds after they were stored, and beyond `max_entries`
+the least recently used one is evicted. If a `fingerprint` function is given, the
+whole cache is dropped when its value changes, e.g. when an incremental ingest
+rewrites the collection. `path_fingerprint` fingerprints index files by size and
+modification time.
+"""
+
+import hashlib
+import os
+import threading
+import time
+from collections import Counter, OrderedDict
+from typing import Callable
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+# Query vectors remembered between a missed lookup and the `put` that follows it.
+_PENDING_VECTORS = 256
+
+
+def path_fingerprint(paths: list[str]) -> str:
+    """Size and modification time of the files at or under `paths`."""
+    stats = []
+    for path in paths:
+        if os.path.isdir(path):
+            files = sorted(
+                os.path.join(root, name) for root, _, names in os.walk(path) for name in names
+            )
+        else:
+            files = [path]
+        for file in files:
+            try:
+                stat = os.stat(file)
+            except FileNotFoundError:
+                stats.append(f"{file}:missing")
+                continue
+            stats.append(f"{file}:{stat.st_size}:{stat.st_mtime_ns}")
+    return hashlib.sha1("\n".join(stats).encode("utf-8")).hexdigest()
+
+
+def _text_key(query: str) -> str:
+    return " ".join(query.split())
+
+
+class CacheEntry:
+    def __init__(self, query: str, documents: list, retrieval_s: float, created: float):
+        self.query = query
+        self.documents = documents
+        self.retrieval_s = retrieval_s
+        self.answer = None
+        self.answer_s = 0.0
+        self.created = created
+
+
+class SemanticCache:
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        threshold: float = 0.92,
+        ttl_s: float = 3600.0,
+        max_entries: int = 1024,
+        fingerprint: Callable[[], str] | None = None,
+    ):
+        self.embeddings = embeddings
+        self.threshold = threshold
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+        self.fingerprint = fingerprint
+        self._fingerprint_value = fingerprint() if fingerprint else None
+        self._lock = threading.Lock()
+        self._counts = Counter()
+        self._saved_s = 0.0
+        # Unit query vectors by slot, allocated on the first `put`.
+        self._vectors = None
+        self._created = np.full(max_entries, -np.inf)
+        self._entries: OrderedDict[int, CacheEntry] = OrderedDict()  # LRU order
+        self._by_text: dict[str, int] = {}
+        self._pending: OrderedDict[str, np.ndarray] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _embed(self, key: str) -> np.ndarray:
+        with self._lock:
+            vector = self._pending.get(key)
+        if vector is None:
+            vector = np.asarray(self.embeddings.embed_query(key), dtype=np.float32)
+            vector /= np.linalg.norm(vector) or 1.0
+        return vector
+
+    def _remove(self, slot: int) -> None:
+        entry = self._entries.pop(slot)
+        self._created[slot] = -np.inf
+        if self._by_text.get(_text_key(entry.query)) == slot:
+            del self._by_text[_text_key(entry.query)]
+
+    def _check_fingerprint(self) -> None:
+        if self.fingerprint is None:
+            return
+        value = self.fingerprint()
+        with self._lock:
+            if value != self._fingerprint_value:
+                self._fingerprint_value = value
+                for slot in list(self._entries):
+                    self._remove(slot)
+                self._counts["invalidations"] += 1
+
+    def lookup(self, query: str, answer: bool = False) -> CacheEntry | None:
+        """
+        The entry for `query` or a similar query, if any. Pass `answer` when the
+        caller will use a cached answer, so the time saved includes generation.
+        """
+        self._check_fingerprint()
+        key = _text_key(query)
+        with self._lock:
+            exact = key in self._by_text
+        vector = None if exact else self._embed(key)
+        with self._lock:
+            self._counts["lookups"] += 1
+            cutoff = time.time() - self.ttl_s
+            slot = self._by_text.get(key)
+            if slot is not None and self._created[slot] >= cutoff:
+                self._counts["exact_hits"] += 1
+            elif vector is not None and self._vectors is not None:
+                similarities = self._vectors @ vector
+                similarities[self._created < cutoff] = -np.inf
+                slot = int(np.argmax(similarities))
+                if similarities[slot] >= self.threshold:
+                    self._counts["semantic_hits"] += 1
+                else:
+                    slot = None
+            else:
+                slot = None
+            if slot is None:
+                self._counts["misses"] += 1
+                if vector is not None:
+                    self._pending[key] = vector
+                    while len(self._pending) > _PENDING_VECTORS:
+                        self._pending.popitem(last=False)
+                return None
+            entry = self._entries[slot]
+            self._entries.move_to_end(slot)
+            self._saved_s += entry.retrieval_s
+            if answer and entry.answer is not None:
+                self._counts["answer_hits"] += 1
+                self._saved_s += entry.answer_s
+            return entry
+
+    def put(self, query: str, documents: list, retrieval_s: float = 0.0) -> CacheEntry:
+        """Cache the documents retrieved for `query`; returns the new entry."""
+        key = _text_key(query)
+        vector = self._embed(key)
+        with self._lock:
+            self._pending.pop(key, None)
+            if self._vectors is None:
+                self._vectors = np.zeros((self.max_entries, len(vector)), dtype=np.float32)
+            if key in self._by_text:
+                self._remove(self._by_text[key])
+            cutoff = time.time() - self.ttl_s
+            for slot in np.flatnonzero(np.isfinite(self._created) & (self._created < cutoff)):
+                self._remove(int(slot))
+                self._counts["expired"] += 1
+            if len(self._entries) >= self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self._counts["evictions"] += 1
+            # Free slots have no creation time.
+            slot = int(np.argmin(self._created))
+            entry = CacheEntry(query, documents, retrieval_s, time.time())
+            self._vectors[slot] = vector
+            self._created[slot] = entry.created
+            self._entries[slot] = entry
+            self._by_text[key] = slot
+            return entry
+
+    def add_answer(self, entry: CacheEntry, answer: str, answer_s: float = 0.0) -> None:
+        with self._lock:
+            entry.answer = answer
+            entry.answer_s = answer_s
+
+    def clear(self) -> None:
+        with self._lock:
+            for slot in list(self._entries):
+                self._remove(slot)
+
+    def stats(self) -> dict:
+        with self._lock:
+            counts = dict(self._counts)
+            entries = len(self._entries)
+            saved_s = self._saved_s
+        hits = counts.get("exact_hits", 0) + counts.get("semantic_hits", 0)
+        lookups = counts.get("lookups", 0)
+        return {
+            "entries": entries,
+            "lookups": lookups,
+            "hits": hits,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            **{
+                name: counts.get(name, 0)
+                for name in (
+                    "exact_hits",
+                    "semantic_hits",
+                    "answer_hits",
+                    "misses",
+                    "expired",
+                    "evictions",
+                    "invalidations",
+                )
+            },
+            "saved_s": saved_s,
+        }
+
+    def print_stats(self) -> None:
+        stats = self.stats()
+        print(
+            f"Semantic cache: {stats['hits']} hits ({stats['exact_hits']} exact, "
+            f"{stats['semantic_hits']} similar, {stats['answer_hits']} with answers), "
+            f"{stats['misses']} misses, hit rate {stats['hit_rate']:.2%}, "
+            f"{stats['entries']} entries, {stats['saved_s']:.1f}s saved"
+        )
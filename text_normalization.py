@@ -0,0 +1,48 @@
+"""
+Character folding shared by the grader, the indexes and entity linking: traditional
+to simplified Chinese and ASCII lowercase, one character for one character, so
+offsets into folded text are offsets into the original.
+"""
+
+import string
+
+_TRADITIONAL = (
+    "萬與醜專業叢東絲丟兩嚴喪個豐臨為麗舉麼義烏樂喬習鄉書買亂爭於虧雲亞產畝親億僅從倉儀們價眾優會傘偉傳傷倫偽體餘傭俠侶偵側僑"
+    "係倆儉債傾償儲兒兌黨蘭關興養獸內岡冊寫軍農馮衝決況凍淨涼減湊凜幾鳳憑凱擊劃劉則剛創刪別劍劑勸辦務動勵勁勞勢勳勻匯區醫華協"
+    "單賣盧鹵衛卻廠廳曆歷厲壓厭參雙發變敘葉號嘆吳呂嗎員響問啟喚嘗嗚團園圍國圖圓聖場壞塊堅壇壩墳墜壘墾牆壯聲殼壺處備復夠頭誇夾"
+    "奪奮獎婦媽娛婁孫學寧寶實寵審憲宮寬賓寢對尋導將爾塵堯屍盡層屬歲豈島嶺崗巖幣師帳帶幫幹廣莊慶廬廟應廢開異棄張彌彎當錄徹徵後"
+    "徑憶懷態憐總戀惡惱悅懸驚慘慚懼憤願懶戰戲戶撲執擴掃揚擾撫搶護報擔擬擁攔撥擇掛撈損換據擄擲攜攝擺搖數斂斃斷時曠晝顯晉曬曉暈"
+    "條來楊極構槍楓櫃樹棲標欄權橫樓櫻機殺氣漢湯溝沒滄潑澤潔灑濃濤潤淚澗漸溫灣濕滅燈災爐點煉煩燒熱營燦爺牽犧狀獨獵貓獻獲環現璽"
+    "畫暢疊療瘋監蓋盤睜礦碼確禮禍禪離種積稱穩窮竊競筆築籃簽節範糧糾紀紅約級紛細終組結絕給統經綠維綱網緊緒線練縣縱績繼續纏罷羅"
+    "聰職聯腦膽臉艦藝蘇蔣藍蘆虜蟲補裝襲規視覺覽觀計訂討讓訓記設許論諸證評識詞試詩誠話該詳語誤說請讀課誰調談謀謝講謹議譽讚豬貝"
+    "負財貢貨貧責貫貴費賀資賊賈賞賢質賴贈贏趙趕躍車軌軒轉軟輕載較輔輛輝輩輪輸邊遼達遷過運還這進遠連遲遺選遜鄧鄭鄒釋銅銀鋒錢鐵"
+    "鏡鍾鎖錦長門閃閉閑間閣闖闞陽陰陣陳陸隊隨險隱難雞雛電靈靜韓頁頂項順須預頓領頗頻題顏額風飛飯飲飽館餓馬馳駐騎驗騰驕髮鬥魯魚"
+    "鮮鳥鴻鵬鶴麥黃齊齒龍龐龜諜謙諫譙紹術禰蟬謖臥荊鄴肅臺彥瑯嶽嘯瀘兗隴閬軻簡闓韋顧譚鎮滎淵頌鑒夥僕滷隸聽櫓艤燭罵懲盜韜纔綸鋪"
+    "閱聞瀋濟禦準鍋鐘廚鄰邁霧靂靄飄飾髒鬧麵擋擠攤敵斬渾潰濱灘猶獄獅瑣璉瓊癡皺盞矯碩禱稅穀窩窯簞籠紙紐紗純絞絡綁綜綿緩編緣縛縮"
+    "織繩繳纖罰羨聳脅脈脫腎膚艱芻莖薦薑蘊虛蝦蠟蠶衊衹袞褲襯訊託訣訴診詐詢誘諾謎謊譏譯豎貞貿賦賬購賽贊贖趨蹤軀軸辭遞適醞釀鈍鈔"
+    "鉤銳鋼錯鍛鎧鏈鑄鑰閒闊陝隕雖雜韌頸顆顛颱饑餵駕駱騙驅驟驢鬱鳴鴉鵝鷹黴齡"
+)
+_SIMPLIFIED = (
+    "万与丑专业丛东丝丢两严丧个丰临为丽举么义乌乐乔习乡书买乱争于亏云亚产亩亲亿仅从仓仪们价众优会伞伟传伤伦伪体余佣侠侣侦侧侨"
+    "系俩俭债倾偿储儿兑党兰关兴养兽内冈册写军农冯冲决况冻净凉减凑凛几凤凭凯击划刘则刚创删别剑剂劝办务动励劲劳势勋匀汇区医华协"
+    "单卖卢卤卫却厂厅历历厉压厌参双发变叙叶号叹吴吕吗员响问启唤尝呜团园围国图圆圣场坏块坚坛坝坟坠垒垦墙壮声壳壶处备复够头夸夹"
+    "夺奋奖妇妈娱娄孙学宁宝实宠审宪宫宽宾寝对寻导将尔尘尧尸尽层属岁岂岛岭岗岩币师帐带帮干广庄庆庐庙应废开异弃张弥弯当录彻征后"
+    "径忆怀态怜总恋恶恼悦悬惊惨惭惧愤愿懒战戏户扑执扩扫扬扰抚抢护报担拟拥拦拨择挂捞损换据掳掷携摄摆摇数敛毙断时旷昼显晋晒晓晕"
+    "条来杨极构枪枫柜树栖标栏权横楼樱机杀气汉汤沟没沧泼泽洁洒浓涛润泪涧渐温湾湿灭灯灾炉点炼烦烧热营灿爷牵牺状独猎猫献获环现玺"
+    "画畅叠疗疯监盖盘睁矿码确礼祸禅离种积称稳穷窃竞笔筑篮签节范粮纠纪红约级纷细终组结绝给统经绿维纲网紧绪线练县纵绩继续缠罢罗"
+    "聪职联脑胆脸舰艺苏蒋蓝芦虏虫补装袭规视觉览观计订讨让训记设许论诸证评识词试诗诚话该详语误说请读课谁调谈谋谢讲谨议誉赞猪贝"
+    "负财贡货贫责贯贵费贺资贼贾赏贤质赖赠赢赵赶跃车轨轩转软轻载较辅辆辉辈轮输边辽达迁过运还这进远连迟遗选逊邓郑邹释铜银锋钱铁"
+    "镜钟锁锦长门闪闭闲间阁闯阚阳阴阵陈陆队随险隐难鸡雏电灵静韩页顶项顺须预顿领颇频题颜额风飞饭饮饱馆饿马驰驻骑验腾骄发斗鲁鱼"
+    "鲜鸟鸿鹏鹤麦黄齐齿龙庞龟谍谦谏谯绍术祢蝉谡卧荆邺肃台彦琅岳啸泸兖陇阆轲简闿韦顾谭镇荥渊颂鉴伙仆卤隶听橹舣烛骂惩盗韬才纶铺"
+    "阅闻沈济御准锅钟厨邻迈雾雳霭飘饰脏闹面挡挤摊敌斩浑溃滨滩犹狱狮琐琏琼痴皱盏矫硕祷税谷窝窑箪笼纸纽纱纯绞络绑综绵缓编缘缚缩"
+    "织绳缴纤罚羡耸胁脉脱肾肤艰刍茎荐姜蕴虚虾蜡蚕蔑只衮裤衬讯托诀诉诊诈询诱诺谜谎讥译竖贞贸赋账购赛赞赎趋踪躯轴辞递适酝酿钝钞"
+    "钩锐钢错锻铠链铸钥闲阔陕陨虽杂韧颈颗颠台饥喂驾骆骗驱骤驴郁鸣鸦鹅鹰霉龄"
+)
+FOLD_TABLE = str.maketrans(
+    _TRADITIONAL + string.ascii_uppercase, _SIMPLIFIED + string.ascii_lowercase
+)
+
+
+def fold(text: str) -> str:
+    """Traditional to simplified Chinese and ASCII lowercase, one char for one char."""
+    return text.translate(FOLD_TABLE)